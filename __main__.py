@@ -107,6 +107,10 @@ def main():
         elif first_arg.startswith('+'):
             namespaced(['+', first_arg[1:]] + sys.argv[2:])
         else:
+            from kitty.trace import start_tracing, trace_startup_requested
+            if trace_startup_requested(sys.argv[1:]):
+                # Start before importing kitty.main so that imports are traced
+                start_tracing()
             from kitty.main import main
             main()
     else:
@@ -2,11 +2,17 @@
 # vim:fileencoding=utf-8
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
+import mmap
 import os
 import re
+import sys
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from hashlib import md5
 from mimetypes import guess_type
+from threading import Lock
+from time import monotonic
 
 path_name_map = {}
 
@@ -50,14 +56,14 @@ class Collection:
         self.adds.add(right_path)
         self.all_paths.append(right_path)
         self.type_map[right_path] = 'add'
-        if isinstance(data_for_path(right_path), str):
+        if not is_binary_file(right_path):
             self.added_count += len(lines_for_path(right_path))
 
     def add_removal(self, left_path):
         self.removes.add(left_path)
         self.all_paths.append(left_path)
         self.type_map[left_path] = 'removal'
-        if isinstance(data_for_path(left_path), str):
+        if not is_binary_file(left_path):
             self.removed_count += len(lines_for_path(left_path))
 
     def finalize(self):
@@ -78,7 +84,80 @@ class Collection:
         return len(self.all_paths)
 
 
-def collect_files(collection, left, right):
+def exact_renames(removed, added, removed_hashes, added_hashes):
+    '''
+    Pair up removed and added files with identical contents, using an index
+    from hash to added files. Files with the same name are paired up first, so
+    that moving a directory full of identical files, such as empty
+    __init__.py files, keeps each file with its counterpart.
+    '''
+    ans = []
+    for key in (lambda name, h: (h, os.path.basename(name)), lambda name, h: h):
+        index = defaultdict(list)
+        for a in sorted(added, reverse=True):
+            index[key(a, added_hashes[a])].append(a)
+        for r in sorted(removed):
+            candidates = index.get(key(r, removed_hashes[r]))
+            if candidates:
+                a = candidates.pop()
+                removed.discard(r), added.discard(a)
+                ans.append((r, a))
+    return ans
+
+
+def fingerprint(lines, shingle_size=3):
+    ''' The set of hashes of all runs of shingle_size consecutive lines, ignoring leading and trailing whitespace '''
+    lines = tuple(x.strip() for x in lines)
+    if len(lines) <= shingle_size:
+        return {hash(lines)}
+    return {hash(lines[i:i + shingle_size]) for i in range(len(lines) - shingle_size + 1)}
+
+
+def similar_renames(removed, added, left_path_map, right_path_map, threshold, time_limit):
+    '''
+    Pair up removed and added text files whose contents are similar, the
+    similarity of two files being the fraction of their fingerprints they
+    share. Candidates are found through an index from fingerprint to added
+    files, so only files that share content are ever compared. Gives up after
+    time_limit seconds, leaving the remaining files as removals and additions.
+    '''
+    deadline = monotonic() + time_limit
+    fingerprints, index = {}, defaultdict(list)
+    for a in sorted(added):
+        if monotonic() > deadline:
+            return []
+        if not is_binary_file(right_path_map[a]):
+            fingerprints[a] = fp = fingerprint(lines_for_path(right_path_map[a]))
+            for h in fp:
+                index[h].append(a)
+    # Fingerprints shared by very many files, such as license headers, say
+    # nothing about which file is which and are expensive to count
+    too_common = max(10, len(fingerprints) // 10)
+    ans = []
+    for r in sorted(removed):
+        if monotonic() > deadline:
+            break
+        if is_binary_file(left_path_map[r]):
+            continue
+        fp = fingerprint(lines_for_path(left_path_map[r]))
+        shared = defaultdict(int)
+        for h in fp:
+            candidates = index.get(h, ())
+            if len(candidates) <= too_common:
+                for a in candidates:
+                    shared[a] += 1
+        best, best_score = None, threshold
+        for a, count in shared.items():
+            score = count / max(len(fp), len(fingerprints[a]))
+            if score >= best_score and a in added:
+                best, best_score = a, score
+        if best is not None:
+            removed.discard(r), added.discard(best)
+            ans.append((r, best))
+    return ans
+
+
+def collect_files(collection, left, right, rename_similarity=0, rename_time_limit=1):
     left_names, right_names = set(), set()
     left_path_map, right_path_map = {}, {}
 
@@ -92,23 +171,38 @@ def collect_files(collection, left, right):
 
     walk(left, left_names, left_path_map), walk(right, right_names, right_path_map)
     common_names = left_names & right_names
-    changed_names = {n for n in common_names if data_for_path(left_path_map[n]) != data_for_path(right_path_map[n])}
-    for n in changed_names:
-        collection.add_change(left_path_map[n], right_path_map[n])
-
     removed = left_names - common_names
     added = right_names - common_names
-    ahash = {a: hash_for_path(right_path_map[a]) for a in added}
-    rhash = {r: hash_for_path(left_path_map[r]) for r in removed}
-    for name, rh in rhash.items():
-        for n, ah in ahash.items():
-            if ah == rh and data_for_path(left_path_map[name]) == data_for_path(right_path_map[n]):
-                collection.add_rename(left_path_map[name], right_path_map[n])
-                added.discard(n)
-                break
+
+    # Files are only read to compare them when they are the same size and not
+    # the same file, everything that needs hashing is hashed at once, in
+    # parallel
+    changed_names, same_size = set(), []
+    for n in common_names:
+        lst, rst = os.stat(left_path_map[n]), os.stat(right_path_map[n])
+        if lst.st_ino == rst.st_ino and lst.st_dev == rst.st_dev:
+            continue
+        if lst.st_size == rst.st_size:
+            same_size.append(n)
         else:
-            collection.add_removal(left_path_map[name])
+            changed_names.add(n)
+    hashes = hash_paths(
+        [left_path_map[n] for n in same_size] + [right_path_map[n] for n in same_size] +
+        [left_path_map[r] for r in removed] + [right_path_map[a] for a in added])
+    changed_names.update(n for n in same_size if hashes[left_path_map[n]] != hashes[right_path_map[n]])
+    for n in changed_names:
+        collection.add_change(left_path_map[n], right_path_map[n])
+
+    for r, a in exact_renames(
+            removed, added, {r: hashes[left_path_map[r]] for r in removed}, {a: hashes[right_path_map[a]] for a in added}):
+        collection.add_rename(left_path_map[r], right_path_map[a])
+    if rename_similarity > 0 and removed and added:
+        # Similar files are shown as changes between the old and new names
+        for r, a in similar_renames(removed, added, left_path_map, right_path_map, rename_similarity, rename_time_limit):
+            collection.add_change(left_path_map[r], right_path_map[a])
 
+    for name in removed:
+        collection.add_removal(left_path_map[name])
     for name in added:
         collection.add_add(right_path_map[name])
 
@@ -126,45 +220,170 @@ def mime_type_for_path(path):
     return guess_type(path)[0] or 'application/octet-stream'
 
 
-@lru_cache(maxsize=1024)
-def raw_data_for_path(path):
+def is_image(path):
+    return mime_type_for_path(path).startswith('image/')
+
+
+class CachedFile:
+
+    __slots__ = ('hash', 'size', 'lines', 'cost')
+
+    def __init__(self, cost):
+        self.hash = self.size = self.lines = None
+        self.cost = cost
+
+
+class ContentCache:
+
+    '''
+    A cache of the contents of files, that keeps the least recently used files
+    within a budget of max_size bytes of memory. Only one representation of
+    each file is kept: the sanitized lines for text files. Binary files are
+    never kept in memory, only their size, and hashes are computed by
+    streaming the file, without loading it.
+    '''
+
+    entry_cost = sys.getsizeof(CachedFile(0)) + 100
+
+    def __init__(self, max_size=512 * 1024 * 1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = Lock()
+
+    def entry(self, path):
+        # must be called with the lock held
+        ans = self.entries.get(path)
+        if ans is None:
+            ans = self.entries[path] = CachedFile(self.entry_cost)
+            self.size += ans.cost
+            self.evict()
+        else:
+            self.entries.move_to_end(path)
+        return ans
+
+    def loaded(self, path):
+        with self.lock:
+            e = self.entry(path)
+            if e.size is not None:
+                self.hits += 1
+                return e
+            self.misses += 1
+        size, lines = load_file(path)
+        with self.lock:
+            if e.size is None:
+                e.size, e.lines = size, lines
+                if lines is not None:
+                    cost = sys.getsizeof(lines) + sum(map(sys.getsizeof, lines))
+                    e.cost += cost
+                    if self.entries.get(path) is e:
+                        self.size += cost
+                        self.evict()
+        return e
+
+    def hash_for_path(self, path):
+        with self.lock:
+            e = self.entry(path)
+        if e.hash is None:
+            e.hash = hash_file(path)
+        return e.hash
+
+    def evict(self):
+        # The most recently used entry is never evicted, even if it is larger
+        # than the budget on its own
+        while self.size > self.max_size and len(self.entries) > 1:
+            e = self.entries.popitem(last=False)[1]
+            self.size -= e.cost
+            self.evictions += 1
+
+    def stats(self):
+        return 'File contents cache: {} hits, {} misses, {} evictions, {:.1f} MB of {:.1f} MB used'.format(
+            self.hits, self.misses, self.evictions, self.size / (1024 * 1024), self.max_size / (1024 * 1024))
+
+
+def load_file(path):
+    # Returns the size of the file and its sanitized lines, or None for the
+    # lines if the file is binary
     with open(path, 'rb') as f:
-        return f.read()
+        data = f.read()
+    size = len(data)
+    if is_image(path) or os.path.samefile(path, os.devnull):
+        return size, None
+    try:
+        data = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return size, None
+    data = data.replace('\t', lines_for_path.replace_tab_by)
+    return size, tuple(sanitize(data).splitlines())
 
 
-def is_image(path):
-    return mime_type_for_path(path).startswith('image/')
+content_cache = ContentCache()
 
 
-@lru_cache(maxsize=1024)
-def data_for_path(path):
-    ans = raw_data_for_path(path)
-    if not is_image(path) and not os.path.samefile(path, os.devnull):
-        try:
-            ans = ans.decode('utf-8')
-        except UnicodeDecodeError:
-            pass
-    return ans
+def set_max_memory(max_size):
+    content_cache.max_size = max_size
+
+
+def is_binary_file(path):
+    return content_cache.loaded(path).lines is None
+
+
+def size_for_path(path):
+    return content_cache.loaded(path).size
 
 
-@lru_cache(maxsize=1024)
 def lines_for_path(path):
-    data = data_for_path(path).replace('\t', lines_for_path.replace_tab_by)
-    return tuple(sanitize(data).splitlines())
+    return content_cache.loaded(path).lines
 
 
 lines_for_path.replace_tab_by = ' ' * 4
 
 
-@lru_cache(maxsize=1024)
 def hash_for_path(path):
-    return md5(raw_data_for_path(path)).digest()
+    return content_cache.hash_for_path(path)
+
+
+def hash_file(path, mmap_threshold=256 * 1024):
+    # Hash a memory map of large files, so that they do not have to be read
+    # into memory, md5 releases the GIL while hashing large buffers
+    with open(path, 'rb') as f:
+        data = f.read(mmap_threshold)
+        if len(data) < mmap_threshold:
+            return md5(data).digest()
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # special files cannot be mapped
+            return md5(data + f.read()).digest()
+        with m:
+            return md5(m).digest()
+
+
+def hash_paths(paths):
+    ''' Return a map of path to content hash, hashing the files in parallel '''
+    num_workers = min(len(paths), os.cpu_count() or 1)
+    if num_workers < 2:
+        return {p: hash_for_path(p) for p in paths}
+    # Hash the files in batches, as most files are small enough that the
+    # overhead of a job per file would dominate
+    batch_size = max(1, len(paths) // (num_workers * 4))
+
+    def hash_batch(batch):
+        return tuple(map(hash_for_path, batch))
+
+    ans = {}
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        for batch, hashes in zip(batches, executor.map(hash_batch, batches)):
+            ans.update(zip(batch, hashes))
+    return ans
 
 
-def create_collection(left, right):
+def create_collection(left, right, rename_similarity=0, rename_time_limit=1):
     collection = Collection()
     if os.path.isdir(left):
-        collect_files(collection, left, right)
+        collect_files(collection, left, right, rename_similarity, rename_time_limit)
     else:
         pl, pr = os.path.abspath(left), os.path.abspath(right)
         path_name_map[pl] = left
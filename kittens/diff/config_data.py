@@ -9,7 +9,7 @@ from functools import partial
 
 from kitty.conf.definition import option_func
 from kitty.conf.utils import (
-    positive_int, python_string, to_color
+    positive_float, positive_int, python_string, to_color, unit_float
 )
 
 # }}}
@@ -47,8 +47,23 @@ o('diff_cmd', 'auto', long_text=_('''
 The diff command to use. Must contain the placeholder :code:`_CONTEXT_`
 which will be replaced by the number of lines of context. The default
 is to search the system for either git or diff and use that, if found.
+A value of :code:`builtin` diffs files inside the kitten, which is much
+faster than running a command for every changed file, when many files
+have changed.
 '''))
 
+o('rename_similarity', 0, option_type=unit_float, long_text=_('''
+When comparing directories, also detect files that were renamed and changed
+at the same time, showing them as changes rather than as a removal and an
+addition. The value is the fraction of the contents that must be unchanged,
+for example, 0.5 for half. The default of zero only detects renames of files
+whose contents are unchanged.'''))
+
+o('rename_detection_time', 1.0, option_type=positive_float, long_text=_('''
+The maximum time, in seconds, to spend detecting renamed and changed files, see
+:opt:`rename_similarity`. Files not yet detected when the time runs out are
+shown as removals and additions.'''))
+
 o('replace_tab_by', r'\x20\x20\x20\x20', option_type=python_string, long_text=_('''
 The string to replace tabs with. Default is to use four spaces.'''))
 
@@ -13,7 +13,7 @@ from pygments.util import ClassNotFound
 
 from kitty.rgb import color_as_sgr, parse_sharp
 
-from .collect import Segment, data_for_path, lines_for_path
+from .collect import Segment, is_binary_file, lines_for_path
 
 
 class StyleNotFound(Exception):
@@ -138,7 +138,7 @@ def highlight_collection(collection, aliases=None):
             if item_type != 'rename':
                 for p in (path, other_path):
                     if p:
-                        is_binary = isinstance(data_for_path(p), bytes)
+                        is_binary = is_binary_file(p)
                         if not is_binary:
                             jobs[executor.submit(highlight_for_diff, p, aliases)] = p
         for future in concurrent.futures.as_completed(jobs):
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+'''
+Diffing of sequences of lines in process. The lines that are unique to both
+sides are used as anchors, as in patience diff, and the regions between
+anchors are diffed with the linear space variant of the Myers O(ND) algorithm.
+As in xdiff, the cost of the search is limited, regions that differ too much
+are shown as replaced, rather than finding a minimal diff for them.
+'''
+
+# The minimum number of differences to search for in a region before giving
+# up, the limit grows with the square root of the size of the region
+MIN_COST_LIMIT = 256
+
+
+def as_ints(left, right):
+    # Comparing small ints is much faster than comparing strings
+    ids = {}
+    return [ids.setdefault(x, len(ids)) for x in left], [ids.setdefault(x, len(ids)) for x in right]
+
+
+def cost_limit(n, m):
+    return max(MIN_COST_LIMIT, int((n + m) ** 0.5))
+
+
+def middle_snake(a, b, a0, a1, b0, b1):
+    # Returns the point at which to split the region, or None if the two
+    # sides have nothing in common or differ too much to find out cheaply
+    n, m = a1 - a0, b1 - b0
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    v1, v2 = [-1] * size, [-1] * size
+    v1[offset + 1] = v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(min(max_d, cost_limit(n, m))):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a0 + x1] == b[b0 + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < size and v2[k2_offset] != -1 and x1 >= n - v2[k2_offset]:
+                    return a0 + x1, b0 + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a1 - x2 - 1] == b[b1 - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < size and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= n - x2:
+                        return a0 + x1, b0 + offset + x1 - k1_offset
+
+
+def myers_matches(a, b, a0, a1, b0, b1, ans):
+    # Adds the matches to ans, not in order
+    stack = [(a0, a1, b0, b1)]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            ans.append((a0, b0))
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            ans.append((a1, b1))
+        if a0 < a1 and b0 < b1:
+            split = middle_snake(a, b, a0, a1, b0, b1)
+            if split is not None:
+                x, y = split
+                stack.append((a0, x, b0, y))
+                stack.append((x, a1, y, b1))
+
+
+def unique_common_lines(a, b, a0, a1, b0, b1):
+    # Returns the pairs of positions of the lines that occur exactly once on
+    # both sides, in the order of the left side
+    counts = {}
+    for i in range(a0, a1):
+        x = a[i]
+        c = counts.get(x)
+        counts[x] = [i, None] if c is None else [-1, None]
+    for j in range(b0, b1):
+        c = counts.get(b[j])
+        if c is not None and c[0] != -1:
+            c[1] = j if c[1] is None else -1
+    return [tuple(c) for c in sorted(counts.values()) if c[0] != -1 and c[1] is not None and c[1] != -1]
+
+
+def longest_increasing_subsequence(pairs):
+    # Patience sorting on the right side positions of pairs that are sorted
+    # by their left side positions
+    from bisect import bisect_left
+    tails, tail_idx, back = [], [], [None] * len(pairs)
+    for idx, (i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = idx
+        back[idx] = tail_idx[pos - 1] if pos > 0 else None
+    ans = []
+    idx = tail_idx[-1] if tail_idx else None
+    while idx is not None:
+        ans.append(pairs[idx])
+        idx = back[idx]
+    ans.reverse()
+    return ans
+
+
+def patience_matches(a, b, a0, a1, b0, b1, ans):
+    # Adds the matches to ans, not in order
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        ans.append((a0, b0))
+        a0 += 1
+        b0 += 1
+    while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+        a1 -= 1
+        b1 -= 1
+        ans.append((a1, b1))
+    if a0 < a1 and b0 < b1:
+        anchors = longest_increasing_subsequence(unique_common_lines(a, b, a0, a1, b0, b1))
+        if anchors:
+            for i, j in anchors:
+                patience_matches(a, b, a0, i, b0, j, ans)
+                ans.append((i, j))
+                a0, b0 = i + 1, j + 1
+            patience_matches(a, b, a0, a1, b0, b1, ans)
+        else:
+            myers_matches(a, b, a0, a1, b0, b1, ans)
+
+
+def slide_down(lines, changed):
+    # Move every run of changed lines down as far as possible, as diff and git
+    # do, so that the same changes are shown in the same place. A run can move
+    # down by one whenever its first line is the same as the line after it.
+    n = len(lines)
+    i = 0
+    while i < n:
+        if not changed[i]:
+            i += 1
+            continue
+        start = i
+        while i < n and changed[i]:
+            i += 1
+        while i < n and lines[start] == lines[i]:
+            changed[start], changed[i] = False, True
+            start += 1
+            i += 1
+            while i < n and changed[i]:
+                i += 1
+
+
+def matching_lines(left, right):
+    ''' Return the sorted list of pairs of indices of the lines of left and right that match '''
+    a, b = as_ints(left, right)
+    matches = []
+    patience_matches(a, b, 0, len(a), 0, len(b), matches)
+    changed_a, changed_b = [True] * len(a), [True] * len(b)
+    for i, j in matches:
+        changed_a[i] = changed_b[j] = False
+    slide_down(a, changed_a), slide_down(b, changed_b)
+    return list(zip((i for i, c in enumerate(changed_a) if not c), (j for j, c in enumerate(changed_b) if not c)))
+
+
+def opcodes(left, right):
+    '''
+    Return the differences between left and right as a list of (tag, i1, i2,
+    j1, j2) tuples, like difflib.SequenceMatcher.get_opcodes()
+    '''
+    ans = []
+    i = j = 0
+    matches = matching_lines(left, right)
+    matches.append((len(left), len(right)))
+    for mi, mj in matches:
+        if i < mi or j < mj:
+            tag = 'replace' if i < mi and j < mj else ('delete' if i < mi else 'insert')
+            ans.append((tag, i, mi, j, mj))
+            i, j = mi, mj
+        if mi < len(left):
+            if ans and ans[-1][0] == 'equal':
+                t = ans[-1]
+                ans[-1] = ('equal', t[1], mi + 1, t[3], mj + 1)
+            else:
+                ans.append(('equal', mi, mi + 1, mj, mj + 1))
+            i, j = mi + 1, mj + 1
+    return ans
+
+
+def grouped_opcodes(codes, context=3):
+    '''
+    Group the opcodes into hunks with up to context lines of context, in the
+    same way as difflib.SequenceMatcher.get_grouped_opcodes() and unified diff
+    '''
+    if codes and codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes and codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
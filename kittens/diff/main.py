@@ -6,7 +6,6 @@ import os
 import signal
 import sys
 import warnings
-from collections import defaultdict
 from functools import partial
 from gettext import gettext as _
 
@@ -21,12 +20,12 @@ from ..tui.line_edit import LineEdit
 from ..tui.loop import Loop
 from ..tui.operations import styled
 from .collect import (
-    create_collection, data_for_path, lines_for_path, sanitize,
-    set_highlight_data
+    content_cache, create_collection, is_binary_file, lines_for_path,
+    sanitize, set_highlight_data, set_max_memory
 )
 from .config import init_config
 from .patch import Differ, set_diff_command, worker_processes
-from .render import ImageSupportWarning, LineRef, render_diff
+from .render import ImageSupportWarning, render_diff
 from .search import BadRegex, Search
 
 try:
@@ -43,7 +42,7 @@ def generate_diff(collection, context):
 
     for path, item_type, changed_path in collection:
         if item_type == 'diff':
-            is_binary = isinstance(data_for_path(path), bytes) or isinstance(data_for_path(changed_path), bytes)
+            is_binary = is_binary_file(path) or is_binary_file(changed_path)
             if not is_binary:
                 d.add_diff(path, changed_path)
 
@@ -114,7 +113,7 @@ class DiffHandler(Handler):
             self.generate_diff()
 
         def collect(left, right):
-            collection = create_collection(left, right)
+            collection = create_collection(left, right, self.opts.rename_similarity, self.opts.rename_detection_time)
             self.asyncio_loop.call_soon_threadsafe(collect_done, collection)
 
         self.asyncio_loop.run_in_executor(None, collect, self.left, self.right)
@@ -160,7 +159,9 @@ class DiffHandler(Handler):
                 self.quit_loop(1)
                 return
             set_highlight_data(hdata)
-            self.render_diff()
+            # Highlighting does not change the number of lines, so only the
+            # lines that were already rendered need to be rendered again
+            self.diff_lines.clear_cache()
             self.draw_screen()
 
         def highlight(*a):
@@ -177,11 +178,8 @@ class DiffHandler(Handler):
             self.removed_count += patch.removed_count
 
     def render_diff(self):
-        self.diff_lines = tuple(render_diff(self.collection, self.diff_map, self.args, self.screen_size.cols, self.image_manager))
-        self.margin_size = render_diff.margin_size
-        self.ref_path_map = defaultdict(list)
-        for i, l in enumerate(self.diff_lines):
-            self.ref_path_map[l.ref.path].append((i, l.ref))
+        self.diff_lines = render_diff(self.collection, self.diff_map, self.args, self.screen_size.cols, self.image_manager)
+        self.margin_size = self.diff_lines.margin_size
         self.max_scroll_pos = len(self.diff_lines) - self.num_lines
         if self.current_search is not None:
             self.current_search(self.diff_lines, self.margin_size, self.screen_size.cols)
@@ -192,21 +190,7 @@ class DiffHandler(Handler):
 
     @current_position.setter
     def current_position(self, ref):
-        num = None
-        if isinstance(ref.extra, LineRef):
-            sln = ref.extra.src_line_number
-            for i, q in self.ref_path_map[ref.path]:
-                if isinstance(q.extra, LineRef):
-                    if q.extra.src_line_number >= sln:
-                        if q.extra.src_line_number == sln:
-                            num = i
-                        break
-                    num = i
-        if num is None:
-            for i, q in self.ref_path_map[ref.path]:
-                num = i
-                break
-
+        num = self.diff_lines.position_of(ref)
         if num is not None:
             self.scroll_pos = max(0, min(num, self.max_scroll_pos))
 
@@ -215,28 +199,18 @@ class DiffHandler(Handler):
         return self.screen_size.rows - 1
 
     def scroll_to_next_change(self, backwards=False):
-        if backwards:
-            r = range(self.scroll_pos - 1, -1, -1)
+        i = self.diff_lines.next_change(self.scroll_pos, backwards)
+        if i is None:
+            self.cmd.bell()
         else:
-            r = range(self.scroll_pos + 1, len(self.diff_lines))
-        for i in r:
-            line = self.diff_lines[i]
-            if line.is_change_start:
-                self.scroll_lines(i - self.scroll_pos)
-                return
-        self.cmd.bell()
+            self.scroll_lines(i - self.scroll_pos)
 
     def scroll_to_next_match(self, backwards=False, include_current=False):
         if self.current_search is not None:
-            offset = 0 if include_current else 1
-            if backwards:
-                r = range(self.scroll_pos - offset, -1, -1)
-            else:
-                r = range(self.scroll_pos + offset, len(self.diff_lines))
-            for i in r:
-                if i in self.current_search:
-                    self.scroll_lines(i - self.scroll_pos)
-                    return
+            i = self.current_search.next_match(self.scroll_pos, backwards, include_current)
+            if i is not None:
+                self.scroll_lines(i - self.scroll_pos)
+                return
         self.cmd.bell()
 
     def set_scrolling_region(self):
@@ -496,6 +470,20 @@ type=list
 Override individual configuration options, can be specified multiple times.
 Syntax: :italic:`name=value`. For example: :italic:`-o background=gray`
 
+
+--max-memory
+type=int
+default=512
+The maximum amount of memory, in MB, to use for caching the contents of files.
+When it is exceeded, the least recently used files are dropped from the cache
+and read again if they are needed.
+
+
+--cache-stats
+type=bool-set
+Print the number of hits, misses and evictions of the cache of the contents
+of files on exit. Useful to choose a value for :code:`--max-memory`.
+
 '''.format, config_help=CONFIG_HELP.format(conf_name='diff', appname=appname))
 
 
@@ -529,6 +517,7 @@ def main(args):
     opts = init_config(args)
     set_diff_command(opts.diff_cmd)
     lines_for_path.replace_tab_by = opts.replace_tab_by
+    set_max_memory(max(1, args.max_memory) * 1024 * 1024)
     for f in left, right:
         if not os.path.exists(f):
             raise SystemExit('{} does not exist'.format(f))
@@ -542,6 +531,8 @@ def main(args):
     highlight_processes = getattr(highlight_collection, 'processes', ())
     terminate_processes(tuple(highlight_processes))
     terminate_processes(tuple(worker_processes))
+    if args.cache_stats:
+        print(content_cache.stats(), file=sys.stderr)
     if loop.return_code != 0:
         if handler.report_traceback_on_exit:
             print(handler.report_traceback_on_exit, file=sys.stderr)
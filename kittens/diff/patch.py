@@ -10,10 +10,12 @@ import subprocess
 
 from .collect import lines_for_path
 from .diff_speedup import changed_center
+from .line_diff import grouped_opcodes, opcodes
 
 left_lines = right_lines = None
 GIT_DIFF = 'git diff --no-color --no-ext-diff --exit-code -U_CONTEXT_ --no-index --'
 DIFF_DIFF = 'diff -p -U _CONTEXT_ --'
+BUILTIN_DIFF = 'builtin'
 worker_processes = []
 
 
@@ -25,7 +27,9 @@ def find_differ():
 
 
 def set_diff_command(opt):
-    if opt == 'auto':
+    if opt == BUILTIN_DIFF:
+        cmd = BUILTIN_DIFF
+    elif opt == 'auto':
         cmd = find_differ()
         if cmd is None:
             raise SystemExit('Failed to find either the git or diff programs on your system')
@@ -206,6 +210,43 @@ def parse_patch(raw):
     return Patch(all_hunks)
 
 
+def function_name(lines, before, after=0):
+    # The function name shown in hunk headers, which is the last line before
+    # the hunk that starts with a letter, _ or $, as for diff -p and git diff
+    for i in range(before - 1, after - 1, -1):
+        line = lines[i]
+        if line and (line[0].isalpha() or line[0] in '_$'):
+            return line.rstrip()[:80]
+
+
+def builtin_patch(left_lines, right_lines, context=3):
+    '''
+    Diff left_lines and right_lines in process, returning the same Patch as
+    parsing the output of diff -U context for them
+    '''
+    all_hunks = []
+    title, searched_to = '', 0
+    for group in grouped_opcodes(opcodes(left_lines, right_lines), context):
+        i1, i2, j1, j2 = group[0][1], group[-1][2], group[0][3], group[-1][4]
+        # Like diff, an empty range starts at the line before it
+        hunk = Hunk('', (i1 + 1 if i2 > i1 else i1, i2 - i1), (j1 + 1 if j2 > j1 else j1, j2 - j1))
+        title = function_name(left_lines, i1, searched_to) or title
+        hunk.title, searched_to = title, i1
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for i in range(i1, i2):
+                    hunk.context_line()
+                continue
+            for i in range(i1, i2):
+                hunk.remove_line()
+            for j in range(j1, j2):
+                hunk.add_line()
+        all_hunks.append(hunk)
+    for h in all_hunks:
+        h.finalize()
+    return Patch(all_hunks)
+
+
 class Differ:
 
     diff_executor = None
@@ -223,6 +264,18 @@ class Differ:
     def __call__(self, context=3):
         global left_lines, right_lines
         ans = {}
+        if set_diff_command.cmd == BUILTIN_DIFF:
+            # Diffing in process is much faster than running a diff process
+            # per file, it is CPU bound, so running it in threads gains nothing
+            for left_path in self.jobs:
+                left_lines = lines_for_path(left_path)
+                right_lines = lines_for_path(self.jmap[left_path])
+                try:
+                    ans[left_path] = builtin_patch(left_lines, right_lines, context)
+                except Exception:
+                    import traceback
+                    return traceback.format_exc() + '\nDiffing {} vs. {} failed'.format(left_path, self.jmap[left_path])
+            return ans
         executor = Differ.diff_executor
         jobs = {executor.submit(run_diff, key, self.jmap[key], context): key for key in self.jobs}
         for future in concurrent.futures.as_completed(jobs):
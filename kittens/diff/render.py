@@ -3,16 +3,19 @@
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
 import warnings
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import partial
 from gettext import gettext as _
-from itertools import repeat, zip_longest
+from itertools import accumulate, repeat, zip_longest
 from math import ceil
 
 from kitty.fast_data_types import truncate_point_for_length, wcswidth
 
 from ..tui.images import can_display_images
 from .collect import (
-    Segment, data_for_path, highlights_for_path, is_image, lines_for_path,
-    path_name_map, sanitize
+    Segment, highlights_for_path, is_binary_file, is_image, lines_for_path,
+    path_name_map, sanitize, size_for_path
 )
 from .config import formats
 from .diff_speedup import split_with_highlights as _split_with_highlights
@@ -159,7 +162,7 @@ def binary_lines(path, other_path, columns, margin_size):
     available_cols = columns // 2 - margin_size
 
     def fl(path, fmt):
-        text = template.format(human_readable(len(data_for_path(path))))
+        text = template.format(human_readable(size_for_path(path)))
         text = place_in(text, available_cols)
         return margin_format(' ' * margin_size) + fmt(text)
 
@@ -327,28 +330,49 @@ def lines_for_chunk(data, hunk_num, chunk, chunk_num):
                 yield Line(left_line + right_line, ref, i == 0 and wli == 0)
 
 
-def lines_for_diff(left_path, right_path, hunks, args, columns, margin_size):
+def lines_for_hunk(left_path, right_path, hunk_num, hunk, columns, margin_size):
     available_cols = columns // 2 - margin_size
     data = DiffData(left_path, right_path, available_cols, margin_size)
+    yield Line(hunk_title(hunk_num, hunk, margin_size, columns - margin_size), Reference(left_path, LineRef(hunk.left_start)))
+    for cnum, chunk in enumerate(hunk.chunks):
+        yield from lines_for_chunk(data, hunk_num, chunk, cnum)
 
-    for hunk_num, hunk in enumerate(hunks):
-        yield Line(hunk_title(hunk_num, hunk, margin_size, columns - margin_size), Reference(left_path, LineRef(hunk.left_start)))
-        for cnum, chunk in enumerate(hunk.chunks):
-            yield from lines_for_chunk(data, hunk_num, chunk, cnum)
 
+def num_rows_for_line(line, available_cols):
+    # The number of screen lines a line is split into, no character is more
+    # than two cells wide, so most lines need not be measured at all
+    if len(line) * 2 <= available_cols:
+        return 1
+    return sum(1 for x in truncate_points(line, available_cols)) + 1
 
-def all_lines(path, args, columns, margin_size, is_add=True):
+
+def num_lines_for_hunk(left_lines, right_lines, hunk, available_cols):
+    ans = 1
+    for chunk in hunk.chunks:
+        if chunk.is_context:
+            for i in range(chunk.left_start, chunk.left_start + chunk.left_count):
+                ans += num_rows_for_line(left_lines[i], available_cols)
+        else:
+            for i in range(max(chunk.left_count, chunk.right_count)):
+                ans += max(
+                    num_rows_for_line(left_lines[chunk.left_start + i], available_cols) if i < chunk.left_count else 0,
+                    num_rows_for_line(right_lines[chunk.right_start + i], available_cols) if i < chunk.right_count else 0)
+    return ans
+
+
+def all_lines(path, args, columns, margin_size, is_add=True, start=0, end=None):
     available_cols = columns // 2 - margin_size
     ltype = 'add' if is_add else 'remove'
     lines = lines_for_path(path)
     filler = render_diff_line('', '', 'filler', margin_size, available_cols)
-    msg_written = False
+    msg_written = start > 0
     hdata = highlights_for_path(path)
 
     def highlights(num):
         return hdata[num] if num < len(hdata) else []
 
-    for line_number, line in enumerate(lines):
+    for line_number in range(start, len(lines) if end is None else end):
+        line = lines[line_number]
         h = render_half_line(line_number, line, highlights(line_number), ltype, margin_size, available_cols)
         for i, hl in enumerate(h):
             ref = Reference(path, LineRef(line_number, i))
@@ -405,7 +429,7 @@ def render_image(path, is_left, available_cols, margin_size, image_manager):
         yield from yield_split(' '.join(str(e).splitlines()))
         return
     meta = _('Dimensions: {0}x{1} pixels Size: {2}').format(
-            width, height, human_readable(len(data_for_path(path))))
+            width, height, human_readable(size_for_path(path)))
     yield from yield_split(meta)
     bg_line = m + fmt(' ' * available_cols)
     img = Image(image_id, width, height, margin_size, image_manager.screen_size)
@@ -439,7 +463,182 @@ def image_lines(left_path, right_path, columns, margin_size, image_manager):
         is_change_start = False
 
 
+class Block:
+
+    '''
+    A run of consecutive lines of the rendered diff. Either the lines are
+    rendered up front, or only their number is known up front and render() is
+    called to render them when they are needed. starts maps each path to the
+    first source line of it the block shows and source_ranges lists the
+    (path, start, stop) ranges of source lines shown by a block that is
+    rendered on demand.
+    '''
+
+    __slots__ = ('num_lines', 'render', 'lines', 'paths', 'has_change_start', 'starts', 'source_ranges')
+
+    def __init__(self, paths, num_lines=0, render=None, lines=None, has_change_start=True, starts=None, source_ranges=None):
+        self.paths = paths
+        self.render = render
+        self.lines = lines
+        self.num_lines = num_lines if lines is None else len(lines)
+        self.has_change_start = has_change_start
+        self.source_ranges = source_ranges
+        if starts is None:
+            starts = {}
+            for line in lines or ():
+                if isinstance(line.ref.extra, LineRef):
+                    starts.setdefault(line.ref.path, line.ref.extra.src_line_number)
+        self.starts = starts
+
+
+class RenderedDiff:
+
+    '''
+    The lines of the rendered diff, as a sequence. Only the blocks of lines
+    that are accessed are rendered and the most recently used of them are
+    kept, up to max_cached_lines lines. Finding the line at a position is a
+    binary search over the blocks, finding the line showing a source line is
+    a binary search over the blocks of its file.
+    '''
+
+    def __init__(self, blocks, margin_size, max_cached_lines=5000):
+        self.blocks = blocks
+        self.margin_size = margin_size
+        self.max_cached_lines = max_cached_lines
+        self.offsets = list(accumulate(b.num_lines for b in blocks))
+        self.offsets.insert(0, 0)
+        self.num_lines = self.offsets.pop()
+        self.cache = OrderedDict()
+        self.num_cached_lines = 0
+        # path -> (first block, last block) and path -> (first source line of
+        # every block showing source lines of it, those blocks)
+        self.path_map = {}
+        self.line_starts = {}
+        for b, block in enumerate(blocks):
+            for path in block.paths:
+                self.path_map[path] = self.path_map.get(path, (b,))[:1] + (b,)
+            for path, start in block.starts.items():
+                starts, bnums = self.line_starts.setdefault(path, ([], []))
+                starts.append(start), bnums.append(b)
+
+    def __len__(self):
+        return self.num_lines
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.num_lines
+        if not 0 <= i < self.num_lines:
+            raise IndexError('Line index out of range: {}'.format(i))
+        b = self.block_for_line(i)
+        return self.lines_for_block(b)[i - self.offsets[b]]
+
+    def __iter__(self):
+        for b in range(len(self.blocks)):
+            yield from self.lines_for_block(b)
+
+    def block_for_line(self, i):
+        return bisect_right(self.offsets, i) - 1
+
+    def lines_for_block(self, b):
+        block = self.blocks[b]
+        if block.lines is not None:
+            return block.lines
+        ans = self.cache.get(b)
+        if ans is None:
+            ans = self.cache[b] = tuple(block.render())
+            self.num_cached_lines += len(ans)
+            while self.num_cached_lines > self.max_cached_lines and len(self.cache) > 1:
+                self.num_cached_lines -= len(self.cache.popitem(last=False)[1])
+        else:
+            self.cache.move_to_end(b)
+        return ans
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.num_cached_lines = 0
+
+    def next_change(self, pos, backwards=False):
+        # Returns the index of the next line that starts a change, only
+        # rendering blocks that have one
+        if not 0 <= pos < self.num_lines:
+            return
+        first = self.block_for_line(pos)
+        blocks = range(first, -1, -1) if backwards else range(first, len(self.blocks))
+        for b in blocks:
+            if not self.blocks[b].has_change_start:
+                continue
+            offset = self.offsets[b]
+            lines = self.lines_for_block(b)
+            r = range(len(lines) - 1, -1, -1) if backwards else range(len(lines))
+            for i in r:
+                if (i + offset < pos if backwards else i + offset > pos) and lines[i].is_change_start:
+                    return i + offset
+
+    def lines_for_path(self, path):
+        first, last = self.path_map.get(path, (0, -1))
+        for b in range(first, last + 1):
+            offset = self.offsets[b]
+            for i, line in enumerate(self.lines_for_block(b)):
+                if line.ref.path == path:
+                    yield offset + i, line
+
+    def position_of(self, ref):
+        # Returns the index of the line showing the source line ref refers
+        # to, or if it is not shown, the line before it, or the first line
+        # for the file. Only the block that shows the source line is
+        # rendered, or the one before it, if it starts with another line.
+        if isinstance(ref.extra, LineRef):
+            sln = ref.extra.src_line_number
+            starts, bnums = self.line_starts.get(ref.path, ((), ()))
+            for idx in range(bisect_right(starts, sln) - 1, -1, -1):
+                b = bnums[idx]
+                num = None
+                for i, line in enumerate(self.lines_for_block(b)):
+                    q = line.ref
+                    if q.path == ref.path and isinstance(q.extra, LineRef):
+                        if q.extra.src_line_number >= sln:
+                            if q.extra.src_line_number == sln:
+                                num = i
+                            break
+                        num = i
+                if num is not None:
+                    return self.offsets[b] + num
+        for i, line in self.lines_for_path(ref.path):
+            return i
+
+
+def blocks_for_all_lines(path, args, columns, margin_size, is_add, block_size=256):
+    available_cols = columns // 2 - margin_size
+    lines = lines_for_path(path)
+    for start in range(0, len(lines), block_size):
+        end = min(start + block_size, len(lines))
+        num_lines = sum(num_rows_for_line(lines[i], available_cols) for i in range(start, end))
+        yield Block(
+            frozenset((path,)), num_lines, partial(all_lines, path, args, columns, margin_size, is_add, start, end),
+            has_change_start=start == 0, starts={path: start}, source_ranges=((path, start, end),))
+
+
+def blocks_for_diff(path, other_path, patch, columns, margin_size):
+    available_cols = columns // 2 - margin_size
+    left_lines, right_lines = lines_for_path(path), lines_for_path(other_path)
+    paths = frozenset((path, other_path))
+    for hunk_num, hunk in enumerate(patch):
+        yield Block(
+            paths, num_lines_for_hunk(left_lines, right_lines, hunk, available_cols),
+            partial(lines_for_hunk, path, other_path, hunk_num, hunk, columns, margin_size),
+            has_change_start=any(not c.is_context for c in hunk.chunks),
+            starts={path: hunk.left_start, other_path: hunk.right_start},
+            source_ranges=(
+                (path, hunk.left_start, hunk.left_start + hunk.left_count),
+                (other_path, hunk.right_start, hunk.right_start + hunk.right_count)))
+
+
 def render_diff(collection, diff_map, args, columns, image_manager):
+    '''
+    Return the RenderedDiff for the collection. Only the number of lines
+    every file needs is calculated, the lines are rendered when they are
+    accessed, except for images, which are sent to the terminal here.
+    '''
     largest_line_number = 0
     for path, item_type, other_path in collection:
         if item_type == 'diff':
@@ -447,44 +646,49 @@ def render_diff(collection, diff_map, args, columns, image_manager):
             if patch is not None:
                 largest_line_number = max(largest_line_number, patch.largest_line_number)
 
-    margin_size = render_diff.margin_size = max(3, len(str(largest_line_number)) + 1)
+    margin_size = max(3, len(str(largest_line_number)) + 1)
     last_item_num = len(collection) - 1
+    blocks = []
+
+    def eager(paths, lines, has_change_start=True):
+        blocks.append(Block(paths, lines=tuple(lines), has_change_start=has_change_start))
 
     for i, (path, item_type, other_path) in enumerate(collection):
         item_ref = Reference(path)
-        is_binary = isinstance(data_for_path(path), bytes)
-        if not is_binary and item_type == 'diff' and isinstance(data_for_path(other_path), bytes):
+        paths = frozenset((path,))
+        is_binary = is_binary_file(path)
+        if not is_binary and item_type == 'diff' and is_binary_file(other_path):
             is_binary = True
         is_img = is_binary and (is_image(path) or is_image(other_path)) and images_supported()
-        yield from yield_lines_from(title_lines(path, other_path, args, columns, margin_size), item_ref, False)
+        eager(paths, yield_lines_from(title_lines(path, other_path, args, columns, margin_size), item_ref, False), False)
         if item_type == 'diff':
             if is_binary:
                 if is_img:
-                    ans = image_lines(path, other_path, columns, margin_size, image_manager)
+                    eager(frozenset((path, other_path)), image_lines(path, other_path, columns, margin_size, image_manager))
                 else:
-                    ans = yield_lines_from(binary_lines(path, other_path, columns, margin_size), item_ref)
+                    eager(paths, yield_lines_from(binary_lines(path, other_path, columns, margin_size), item_ref))
             else:
-                ans = lines_for_diff(path, other_path, diff_map[path], args, columns, margin_size)
+                blocks.extend(blocks_for_diff(path, other_path, diff_map[path], columns, margin_size))
         elif item_type == 'add':
             if is_binary:
                 if is_img:
-                    ans = image_lines(None, path, columns, margin_size, image_manager)
+                    eager(paths, image_lines(None, path, columns, margin_size, image_manager))
                 else:
-                    ans = yield_lines_from(binary_lines(None, path, columns, margin_size), item_ref)
+                    eager(paths, yield_lines_from(binary_lines(None, path, columns, margin_size), item_ref))
             else:
-                ans = all_lines(path, args, columns, margin_size, is_add=True)
+                blocks.extend(blocks_for_all_lines(path, args, columns, margin_size, True))
         elif item_type == 'removal':
             if is_binary:
                 if is_img:
-                    ans = image_lines(path, None, columns, margin_size, image_manager)
+                    eager(paths, image_lines(path, None, columns, margin_size, image_manager))
                 else:
-                    ans = yield_lines_from(binary_lines(path, None, columns, margin_size), item_ref)
+                    eager(paths, yield_lines_from(binary_lines(path, None, columns, margin_size), item_ref))
             else:
-                ans = all_lines(path, args, columns, margin_size, is_add=False)
+                blocks.extend(blocks_for_all_lines(path, args, columns, margin_size, False))
         elif item_type == 'rename':
-            ans = yield_lines_from(rename_lines(path, other_path, args, columns, margin_size), item_ref)
+            eager(paths, yield_lines_from(rename_lines(path, other_path, args, columns, margin_size), item_ref))
         else:
             raise ValueError('Unsupported item type: {}'.format(item_type))
-        yield from ans
         if i < last_item_num:
-            yield Line('', item_ref)
+            eager(paths, (Line('', item_ref),), False)
+    return RenderedDiff(blocks, margin_size)
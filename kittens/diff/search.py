@@ -3,21 +3,35 @@
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
 import re
+from bisect import bisect_left, bisect_right
 
 from kitty.fast_data_types import wcswidth
 
 from ..tui.operations import styled
+from .collect import lines_for_path
 
 
 class BadRegex(ValueError):
     pass
 
 
+strip_pat = re.compile('\033\\[.*?m')
+
+
 class Search:
 
+    '''
+    Matches are counted in the source lines the blocks of the diff show, so
+    that only the rendered lines of the blocks that are displayed or jumped
+    to have to be searched.
+    '''
+
     def __init__(self, opts, query, is_regex, is_backward):
-        self.matches = {}
+        self.diff_lines = None
+        self.block_matches = {}
+        self.match_blocks = []
         self.count = 0
+        self.source_matches = {}
         self.style = styled('|', fg=opts.search_fg, bg=opts.search_bg).split('|', 1)[0]
         if not is_regex:
             query = re.escape(query)
@@ -27,37 +41,84 @@ class Search:
             raise BadRegex('Not a valid regex: {}'.format(query))
 
     def __call__(self, diff_lines, margin_size, cols):
-        self.matches = {}
+        self.diff_lines, self.margin_size, self.cols = diff_lines, margin_size, cols
+        self.block_matches = {}
+        self.match_blocks = []
         self.count = 0
-        half_width = cols // 2
-        strip_pat = re.compile('\033[[].*?m')
-        right_offset = half_width + 1 + margin_size
-        find = self.pat.finditer
-        for i, line in enumerate(diff_lines):
-            text = strip_pat.sub('', line.text)
-            left, right = text[margin_size:half_width + 1], text[right_offset:]
-            matches = []
-
-            def add(which, offset):
-                for m in find(which):
-                    before = which[:m.start()]
-                    matches.append((wcswidth(before) + offset, m.group()))
-                    self.count += 1
-
-            add(left, margin_size)
-            add(right, right_offset)
-            if matches:
-                self.matches[i] = matches
-        return bool(self.matches)
+        for b, block in enumerate(diff_lines.blocks):
+            if block.source_ranges is None:
+                count = sum(map(len, self.matches_in_block(b).values()))
+            else:
+                count = sum(self.matches_in_source(*r) for r in block.source_ranges)
+            if count:
+                self.count += count
+                self.match_blocks.append(b)
+        return bool(self.match_blocks)
+
+    def matches_in_source(self, path, start, stop):
+        # The source lines do not change when the diff is rendered again, so
+        # the counts are kept for the lifetime of the search
+        key = path, start, stop
+        ans = self.source_matches.get(key)
+        if ans is None:
+            find = self.pat.findall
+            ans = self.source_matches[key] = sum(len(find(line)) for line in lines_for_path(path)[max(0, start):stop])
+        return ans
+
+    def matches_in_block(self, b):
+        ans = self.block_matches.get(b)
+        if ans is None:
+            ans = self.block_matches[b] = {}
+            half_width = self.cols // 2
+            margin_size = self.margin_size
+            right_offset = half_width + margin_size
+            find = self.pat.finditer
+            offset = self.diff_lines.offsets[b]
+            for i, line in enumerate(self.diff_lines.lines_for_block(b)):
+                text = strip_pat.sub('', line.text)
+                left, right = text[margin_size:half_width], text[right_offset:]
+                matches = []
+
+                def add(which, offset):
+                    for m in find(which):
+                        before = which[:m.start()]
+                        matches.append((wcswidth(before) + offset, m.group()))
+
+                add(left, margin_size)
+                add(right, right_offset)
+                if matches:
+                    ans[offset + i] = matches
+        return ans
+
+    def next_match(self, pos, backwards=False, include_current=False):
+        # Only the blocks with matches from the one containing pos onwards
+        # are searched, until a line with a match is found
+        blocks = self.match_blocks
+        b = self.diff_lines.block_for_line(pos)
+        if backwards:
+            indices = range(bisect_right(blocks, b) - 1, -1, -1)
+        else:
+            indices = range(bisect_left(blocks, b), len(blocks))
+        for idx in indices:
+            lines = sorted(self.matches_in_block(blocks[idx]), reverse=backwards)
+            for i in lines:
+                if (include_current and i == pos) or (i < pos if backwards else i > pos):
+                    return i
 
     def __contains__(self, i):
-        return i in self.matches
+        return bool(self.matches_for_line(i))
 
     def __len__(self):
         return self.count
 
+    def matches_for_line(self, i):
+        b = self.diff_lines.block_for_line(i)
+        idx = bisect_left(self.match_blocks, b)
+        if idx < len(self.match_blocks) and self.match_blocks[idx] == b:
+            return self.matches_in_block(b).get(i)
+
     def highlight_line(self, write, line_num):
-        highlights = self.matches.get(line_num)
+        highlights = self.matches_for_line(line_num)
         if not highlights:
             return False
         write(self.style)
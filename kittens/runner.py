@@ -146,3 +146,237 @@ def main():
         import traceback
         traceback.print_exc()
         input('Press Enter to quit...')
+
+
+runner_cmd = 'from kittens.runner import main; main()'
+# The modules that account for most of the startup time of a kitten, they
+# are imported once by the kitten server and shared by every kitten forked
+# from it
+preloaded_modules = (
+    'kitty.cli', 'kitty.key_encoding', 'kittens.tui.handler',
+    'kittens.tui.loop', 'kittens.tui.operations', 'kittens.ask.main',
+    'kittens.hints.main', 'kittens.resize_window.main', 'kittens.unicode_input.main',
+)
+
+
+def send_message(sock, data, fds=()):
+    import array
+    import socket
+    import struct
+    data = struct.pack('=I', len(data)) + data
+    anc = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sent = sock.sendmsg([data], anc)
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        q = sock.recv(size - len(data))
+        if not q:
+            raise EOFError('Connection closed')
+        data += q
+    return data
+
+
+def recv_message(sock, max_fds=0):
+    import array
+    import socket
+    import struct
+    fds = array.array('i')
+    data, anc, flags, addr = sock.recvmsg(4, socket.CMSG_SPACE(max_fds * fds.itemsize) if max_fds else 0)
+    if not data:
+        raise EOFError('Connection closed')
+    data += recv_exactly(sock, 4 - len(data))
+    for level, kind, cdata in anc:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - (len(cdata) % fds.itemsize)])
+    return recv_exactly(sock, struct.unpack('=I', data)[0]), list(fds)
+
+
+def run_forked_kitten(req, fds):
+    # Runs in the process forked from the kitten server, it does what spawn()
+    # in child.c does for normal children, except that instead of exec()ing
+    # a fresh interpreter, the kitten is run directly
+    import fcntl
+    import signal
+    import termios
+    from kitty.constants import is_macos
+    slave, ready_read_fd = fds[:2]
+    stdin_read_fd = fds[2] if len(fds) > 2 else slave
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        os.chdir(req['cwd'])
+    except OSError:
+        os.chdir('/')
+    os.setsid()
+    tfd = os.open(os.ttyname(slave), os.O_RDWR)
+    if is_macos:
+        # On BSD open() does not establish the controlling terminal
+        fcntl.ioctl(tfd, termios.TIOCSCTTY, 0)
+    os.close(tfd)
+    os.dup2(slave, 1)
+    os.dup2(slave, 2)
+    os.dup2(stdin_read_fd, 0)
+    # Wait for kitty to finish setting up the screen of the window
+    while os.read(ready_read_fd, 64):
+        pass
+    os.closerange(3, 201)
+    os.environ.clear()
+    os.environ.update(req['env'])
+    sys.stdin = sys.__stdin__ = open(0, 'r', encoding='utf-8', closefd=False)
+    sys.stdout = sys.__stdout__ = open(1, 'w', encoding='utf-8', buffering=1, closefd=False)
+    sys.stderr = sys.__stderr__ = open(2, 'w', encoding='utf-8', errors='backslashreplace', buffering=1, closefd=False)
+    sys.argv = ['kitty'] + req['args']
+    import random
+    random.seed()
+    main()
+
+
+def serve(fd):
+    '''
+    Run the kitten server, a process that has the modules needed by kittens
+    already imported and forks a new process for every kitten requested by
+    kitty over the socket fd.
+    '''
+    import json
+    import signal
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0, fd)
+    for name in preloaded_modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+    # Kittens are reaped automatically and the server itself is stopped by
+    # kitty closing the socket, not by signals sent to its process group
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    send_message(sock, json.dumps({'ready': True}).encode('utf-8'))
+    while True:
+        try:
+            data, fds = recv_message(sock, max_fds=3)
+        except (EOFError, OSError):
+            break
+        req = json.loads(data.decode('utf-8'))
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                sock.close()
+                run_forked_kitten(req, fds)
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os._exit(code)
+        for x in fds:
+            os.close(x)
+        send_message(sock, json.dumps({'pid': pid}).encode('utf-8'))
+
+
+class KittenServer:
+
+    '''
+    A process that has the modules needed by kittens already imported and
+    forks kittens on request. It is started when the first kitten is run.
+    Until it is ready, kittens are run the normal way, so that kitty never
+    waits for it to start.
+    '''
+
+    # The server only needs to fork once it is ready, so do not wait long for
+    # it to respond
+    timeout = 0.5
+
+    def __init__(self):
+        self.process = self.socket = None
+        self.ready = self.failed = False
+
+    def start(self):
+        if self.socket is not None:
+            return
+        import socket
+        import subprocess
+        from kitty.constants import kitty_exe
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.process = subprocess.Popen([
+                kitty_exe(), '+runpy', 'from kittens.runner import serve; serve({})'.format(theirs.fileno())
+            ], pass_fds=(theirs.fileno(),), stdin=subprocess.DEVNULL)
+        except Exception:
+            ours.close()
+            raise
+        finally:
+            theirs.close()
+        ours.settimeout(self.timeout)
+        self.socket = ours
+
+    def shutdown(self):
+        self.ready = False
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if self.process is not None:
+            try:
+                if self.process.poll() is None:
+                    self.process.kill()
+            except Exception:
+                pass
+            self.process = None
+
+    def fail(self):
+        # Run kittens the normal way from now on
+        import traceback
+        traceback.print_exc()
+        self.shutdown()
+        self.failed = True
+
+    def is_ready(self):
+        ''' Return True if the server can fork kittens, starting it if it is
+        not running. Never waits for the server. '''
+        if self.ready or self.failed:
+            return self.ready
+        try:
+            if self.socket is None:
+                self.start()
+                return False
+            import json
+            import select
+            if select.select([self.socket], [], [], 0)[0]:
+                self.ready = json.loads(recv_message(self.socket)[0].decode('utf-8')).get('ready') is True
+        except Exception:
+            self.fail()
+        return self.ready
+
+    def spawn(self, args, cwd, env, master, slave, stdin_read_fd, stdin_write_fd, ready_read_fd, ready_write_fd):
+        ''' Fork a kitten from the server, returns its pid or None if the
+        server is not ready or not working, in which case the caller must use
+        a fresh pty to run the kitten some other way. '''
+        import json
+        if not self.is_ready():
+            return
+        fds = [slave, ready_read_fd]
+        if stdin_read_fd > -1:
+            fds.append(stdin_read_fd)
+        req = {'args': list(args), 'cwd': cwd, 'env': env}
+        try:
+            send_message(self.socket, json.dumps(req).encode('utf-8'), fds)
+            return json.loads(recv_message(self.socket)[0].decode('utf-8'))['pid']
+        except Exception:
+            self.fail()
+
+
+def kitten_server():
+    ans = getattr(kitten_server, 'ans', None)
+    if ans is None:
+        kitten_server.ans = ans = KittenServer()
+    return ans
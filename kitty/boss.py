@@ -10,13 +10,13 @@ from functools import partial
 from gettext import gettext as _
 from weakref import WeakValueDictionary
 
-from .child import cached_process_data
+from .child import cached_process_data, child_pool, process_info
 from .cli import create_opts, parse_args
 from .conf.utils import to_cmdline
 from .config import initial_window_size_func, prepare_config_file_for_editing
 from .config_data import MINIMUM_FONT_SIZE
 from .constants import (
-    appname, config_dir, is_macos, kitty_exe, set_boss,
+    appname, config_dir, is_macos, is_wayland, kitty_exe, set_boss,
     supports_primary_selection
 )
 from .fast_data_types import (
@@ -24,21 +24,32 @@ from .fast_data_types import (
     change_os_window_state, create_os_window, current_os_window,
     destroy_global_data, get_clipboard_string, glfw_post_empty_event,
     global_font_size, mark_os_window_for_close, os_window_font_size,
-    patch_global_colors, set_clipboard_string, set_in_sequence_mode,
-    toggle_fullscreen
+    patch_color_profiles, patch_global_colors, set_clipboard_string,
+    set_in_sequence_mode, set_options, toggle_fullscreen
 )
 from .keys import get_shortcut, shortcut_matches
 from .layout import set_draw_minimal_borders
-from .remote_control import handle_cmd
-from .rgb import Color, color_from_int
+from .remote_control import (
+    EventSubscription, RemotePeer, ResponseWriter, handle_cmd
+)
+from .rgb import Color, color_as_int, color_from_int
 from .session import create_session
-from .tabs import SpecialWindow, SpecialWindowInstance, TabManager
+from .tabs import (
+    SpecialWindow, SpecialWindowInstance, TabManager, deferred_relayouts
+)
+from .trace import span
 from .utils import (
     get_editor, get_primary_selection, is_path_in_temp_dir, log_error,
     open_url, parse_address_spec, remove_socket_file, safe_print,
     set_primary_selection, single_instance, startup_notification_handler
 )
 
+# Options that change the fonts and so need all sprites to be re-rendered
+font_options = frozenset((
+    'font_family', 'bold_font', 'italic_font', 'bold_italic_font', 'font_size',
+    'symbol_map', 'adjust_line_height', 'adjust_column_width', 'box_drawing_scale'
+))
+
 
 def listen_on(spec):
     import socket
@@ -108,6 +119,8 @@ class Boss:
         set_draw_minimal_borders(opts)
         self.update_check_process = None
         self.window_id_map = WeakValueDictionary()
+        self.window_pid_map = WeakValueDictionary()
+        self.tab_id_map = WeakValueDictionary()
         self.startup_colors = {k: opts[k] for k in opts if isinstance(opts[k], Color)}
         self.startup_cursor_text_color = opts.cursor_text_color
         self.pending_sequences = None
@@ -116,6 +129,8 @@ class Boss:
         self.os_window_death_actions = {}
         self.cursor_blinking = True
         self.shutting_down = False
+        self.current_remote_peer = None
+        self.event_subscriptions = {}
         talk_fd = getattr(single_instance, 'socket', None)
         talk_fd = -1 if talk_fd is None else talk_fd.fileno()
         listen_fd = -1
@@ -126,9 +141,12 @@ class Boss:
             DumpCommands(args) if args.dump_commands or args.dump_bytes else None,
             talk_fd, listen_fd
         )
+        self.response_writer = ResponseWriter(self.child_monitor.send_to_peer)
         set_boss(self)
         self.opts, self.args = opts, args
-        startup_session = create_session(opts, args, default_session=opts.startup_session)
+        with span('create session'):
+            startup_session = create_session(opts, args, default_session=opts.startup_session)
+        self.new_os_window_trigger = new_os_window_trigger
         self.keymap = self.opts.keymap.copy()
         if new_os_window_trigger is not None:
             self.keymap.pop(new_os_window_trigger, None)
@@ -155,16 +173,19 @@ class Boss:
         self.os_window_map[os_window_id] = tm
         return os_window_id
 
-    def list_os_windows(self):
+    def list_os_windows(self, fields=None, window_ids=None):
+        ''' List only the specified window fields and the windows whose ids are in window_ids, if not None '''
         with cached_process_data():
             active_tab, active_window = self.active_tab, self.active_window
             active_tab_manager = self.active_tab_manager
             for os_window_id, tm in self.os_window_map.items():
-                yield {
-                    'id': os_window_id,
-                    'is_focused': tm is active_tab_manager,
-                    'tabs': list(tm.list_tabs(active_tab, active_window)),
-                }
+                tabs = list(tm.list_tabs(active_tab, active_window, fields, window_ids))
+                if tabs or window_ids is None:
+                    yield {
+                        'id': os_window_id,
+                        'is_focused': tm is active_tab_manager,
+                        'tabs': tabs,
+                    }
 
     @property
     def all_tab_managers(self):
@@ -180,11 +201,26 @@ class Boss:
         for tab in self.all_tabs:
             yield from tab
 
+    def indexed_window(self, field, exp):
+        ' Look up a window by id or pid using the indices, returns None if there is no such window '
+        try:
+            key = int(exp)
+        except ValueError:
+            return
+        w = (self.window_id_map if field == 'id' else self.window_pid_map).get(key)
+        if w is not None and str(w.id if field == 'id' else w.child.pid) == exp and self.tab_for_window(w) is not None:
+            return w
+
     def match_windows(self, match):
         try:
             field, exp = match.split(':', 1)
         except ValueError:
             return
+        if field in ('id', 'pid'):
+            w = self.indexed_window(field, exp)
+            if w is not None:
+                yield w
+            return
         if field == 'num':
             tab = self.active_tab
             if tab is not None:
@@ -208,10 +244,9 @@ class Boss:
                 yield window
 
     def tab_for_window(self, window):
-        for tab in self.all_tabs:
-            for w in tab:
-                if w.id == window.id:
-                    return tab
+        tab = self.tab_id_map.get(window.tab_id)
+        if tab is not None and window in tab:
+            return tab
 
     def match_tabs(self, match):
         try:
@@ -220,7 +255,15 @@ class Boss:
             return
         pat = re.compile(exp)
         found = False
-        if field in ('title', 'id'):
+        if field == 'id':
+            try:
+                tab = self.tab_id_map.get(int(exp))
+            except ValueError:
+                tab = None
+            if tab is not None and tab.matches(field, pat):
+                yield tab
+                found = True
+        elif field == 'title':
             for tab in self.all_tabs:
                 if tab.matches(field, pat):
                     yield tab
@@ -267,30 +310,53 @@ class Boss:
     def add_child(self, window):
         self.child_monitor.add_child(window.id, window.child.pid, window.child.child_fd, window.screen)
         self.window_id_map[window.id] = window
+        self.window_pid_map[window.child.pid] = window
+        self.notify_event_subscribers('window_created', window_id=window.id, tab_id=window.tab_id, os_window_id=window.os_window_id)
 
-    def _handle_remote_command(self, cmd, window=None):
+    def _handle_remote_command(self, cmd, window=None, peer=None):
+        ''' Responses to peers can contain deferred data, see encode_response() '''
         response = None
+        try:
+            cmd = json.loads(cmd)
+        except Exception as err:
+            return {'ok': False, 'error': 'Malformed remote control command: {}'.format(err)}
         if self.opts.allow_remote_control or getattr(window, 'allow_remote_control', False):
+            if peer is not None:
+                peer.request_id = cmd.get('id')
+            self.current_remote_peer = peer
             try:
-                response = handle_cmd(self, window, cmd)
+                response = handle_cmd(self, window, cmd, allow_deferred=peer is not None)
             except Exception as err:
                 import traceback
                 response = {'ok': False, 'error': str(err)}
                 if not getattr(err, 'hide_traceback', False):
                     response['tb'] = traceback.format_exc()
+            finally:
+                self.current_remote_peer = None
         else:
             response = {'ok': False, 'error': 'Remote control is disabled. Add allow_remote_control yes to your kitty.conf'}
+        if response is not None and isinstance(cmd, dict) and 'id' in cmd:
+            # echo the request id so that clients using a persistent
+            # connection can match responses to requests
+            response['id'] = cmd['id']
         return response
 
-    def peer_message_received(self, msg):
+    def peer_message_received(self, msg, peer_id):
         msg = msg.decode('utf-8')
         cmd_prefix = '\x1bP@kitty-cmd'
         if msg.startswith(cmd_prefix):
             cmd = msg[len(cmd_prefix):-2]
-            response = self._handle_remote_command(cmd)
-            if response is not None:
-                response = (cmd_prefix + json.dumps(response) + '\x1b\\').encode('utf-8')
-            return response
+            peer = RemotePeer(peer_id)
+            response = self._handle_remote_command(cmd, peer=peer)
+            if peer.keep_request_open:
+                if response is not None:
+                    self.response_writer(peer_id, response, False)
+                return False
+            if response is None:
+                return
+            # Serialize the response on a worker thread, which finishes the request
+            self.response_writer(peer_id, response)
+            return False
         else:
             msg = json.loads(msg)
             if isinstance(msg, dict) and msg.get('cmd') == 'new_instance':
@@ -307,6 +373,25 @@ class Boss:
             else:
                 log_error('Unknown message received from peer, ignoring')
 
+    def peer_closed(self, peer_id):
+        if self.event_subscriptions.pop(peer_id, None) is not None:
+            self.response_writer(peer_id, None)
+
+    def subscribe_to_events(self, peer, events=None):
+        peer.keep_request_open = True
+        self.event_subscriptions[peer.peer_id] = EventSubscription(peer.peer_id, peer.request_id, frozenset(events) if events else None)
+
+    def notify_event_subscribers(self, event_type, **data):
+        if not self.event_subscriptions:
+            return
+        data['type'] = event_type
+        for sub in self.event_subscriptions.values():
+            if sub.events is None or event_type in sub.events:
+                response = {'ok': True, 'data': json.dumps(data)}
+                if sub.request_id is not None:
+                    response['id'] = sub.request_id
+                self.response_writer(sub.peer_id, response, False)
+
     def handle_remote_cmd(self, cmd, window=None):
         response = self._handle_remote_command(cmd, window)
         if response is not None:
@@ -317,6 +402,9 @@ class Boss:
         window = self.window_id_map.pop(window_id, None)
         if window is None:
             return
+        if self.window_pid_map.get(window.child.pid) is window:
+            del self.window_pid_map[window.child.pid]
+        process_info.invalidate(window.child.pid)
         if window.action_on_close:
             try:
                 window.action_on_close(window)
@@ -324,14 +412,13 @@ class Boss:
                 import traceback
                 traceback.print_exc()
         os_window_id = window.os_window_id
+        self.notify_event_subscribers('window_closed', window_id=window.id, tab_id=window.tab_id, os_window_id=os_window_id)
         window.destroy()
         tm = self.os_window_map.get(os_window_id)
         if tm is None:
             return
-        for tab in tm:
-            if window in tab:
-                break
-        else:
+        tab = self.tab_for_window(window)
+        if tab is None:
             return
         tab.remove_window(window)
         if len(tab) == 0:
@@ -621,8 +708,10 @@ class Boss:
         tm = self.os_window_map.pop(os_window_id, None)
         if tm is not None:
             tm.destroy()
-        for window_id in tuple(w.id for w in self.window_id_map.values() if getattr(w, 'os_window_id', None) == os_window_id):
-            self.window_id_map.pop(window_id, None)
+        for w in tuple(w for w in self.window_id_map.values() if getattr(w, 'os_window_id', None) == os_window_id):
+            self.window_id_map.pop(w.id, None)
+            if self.window_pid_map.get(w.child.pid) is w:
+                del self.window_pid_map[w.child.pid]
         action = self.os_window_death_actions.pop(os_window_id, None)
         if action is not None:
             action()
@@ -655,6 +744,84 @@ class Boss:
         cmd = [kitty_exe(), '+runpy', 'import os, sys, time; time.sleep(0.05); os.execvp(sys.argv[1], sys.argv[1:])'] + get_editor() + [confpath]
         self.new_os_window(*cmd)
 
+    def load_config_file(self, *paths):
+        ''' Reload the config, from paths if specified, otherwise from the
+        config files kitty was started with. Overrides specified on the
+        command line are re-applied. Relative paths are resolved relative to
+        the kitty config directory. '''
+        if paths:
+            from .config import load_config
+            paths = [os.path.join(config_dir, os.path.expanduser(p)) for p in paths]
+            opts = load_config(*paths, overrides=(a.replace('=', ' ', 1) for a in self.args.override or ()))
+        else:
+            opts = create_opts(self.args)
+        return self.apply_new_options(opts)
+
+    def apply_new_options(self, new_opts):
+        '''
+        Apply the options in new_opts that differ from the current options,
+        without recreating any windows. Fonts are reloaded only if a font
+        option changed. Returns the names of the changed options.
+        '''
+        opts = self.opts
+        changed = frozenset(k for k, v in new_opts._asdict().items() if getattr(opts, k) != v)
+        if not changed:
+            return changed
+        # The tab managers, tabs and windows all share the options object, so
+        # update it in place
+        for k in changed:
+            setattr(opts, k, getattr(new_opts, k))
+        set_options(opts, is_wayland, self.args.debug_gl, self.args.debug_font_fallback)
+        set_draw_minimal_borders(opts)
+        if changed & {'env', 'editor'}:
+            from .main import setup_environment
+            setup_environment(opts, self.args)
+        if changed & {'keymap', 'sequence_map'}:
+            self.keymap = opts.keymap.copy()
+            if self.new_os_window_trigger is not None:
+                self.keymap.pop(self.new_os_window_trigger, None)
+
+        colors = {k: color_as_int(getattr(opts, k)) for k in changed if k != 'cursor_text_color' and isinstance(getattr(opts, k), Color)}
+        cursor_text_color = False
+        if 'cursor_text_color' in changed:
+            cursor_text_color = opts.cursor_text_color
+            self.startup_cursor_text_color = cursor_text_color
+            if cursor_text_color is not None:
+                cursor_text_color = color_as_int(cursor_text_color)
+        if colors or cursor_text_color is not False:
+            self.startup_colors.update((k, getattr(opts, k)) for k in colors)
+            windows = tuple(self.all_windows)
+            patch_color_profiles(colors, cursor_text_color, tuple(w.screen.color_profile for w in windows), True)
+            self.patch_colors(colors, cursor_text_color, True)
+            for w in windows:
+                if 'background' in colors:
+                    self.default_bg_changed_for(w.id)
+                w.refresh()
+
+        if changed & font_options:
+            from .fonts.box_drawing import set_scale
+            from .fonts.render import set_font_family
+            set_scale(opts.box_drawing_scale)
+            set_font_family(opts, debug_font_matching=self.args.debug_font_fallback)
+            if 'font_size' in changed:
+                global_font_size(opts.font_size)
+            # set_font_family() discards the fonts of all OS windows, so they
+            # must all get new ones, even if their font size is unchanged
+            for os_window_id in self.os_window_map:
+                sz = opts.font_size if 'font_size' in changed else os_window_font_size(os_window_id)
+                os_window_font_size(os_window_id, sz, True)
+        if 'background_opacity' in changed:
+            for os_window_id in self.os_window_map:
+                self._set_os_window_background_opacity(os_window_id, opts.background_opacity)
+        with deferred_relayouts:
+            for tm in self.all_tab_managers:
+                tm.apply_options(changed)
+                if changed & font_options:
+                    # The cell size may have changed, so all tabs must be
+                    # laid out again
+                    tm.resize()
+        return changed
+
     def get_output(self, source_window, num_lines=1):
         output = ''
         s = source_window.screen
@@ -666,7 +833,7 @@ class Boss:
 
     def _run_kitten(self, kitten, args=(), input_data=None, window=None):
         orig_args, args = list(args), list(args)
-        from kittens.runner import create_kitten_handler
+        from kittens.runner import create_kitten_handler, runner_cmd
         end_kitten = create_kitten_handler(kitten, orig_args)
         if window is None:
             w = self.active_window
@@ -699,7 +866,7 @@ class Boss:
             copts = {k: self.opts[k] for k in ('select_by_word_characters', 'open_url_with')}
             overlay_window = tab.new_special_window(
                 SpecialWindow(
-                    [kitty_exe(), '+runpy', 'from kittens.runner import main; main()'] + args,
+                    [kitty_exe(), '+runpy', runner_cmd] + args,
                     stdin=data,
                     env={
                         'KITTY_COMMON_OPTS': json.dumps(copts),
@@ -781,6 +948,9 @@ class Boss:
         self.child_monitor.shutdown_monitor()
         self.set_update_check_process()
         self.update_check_process = None
+        from kittens.runner import kitten_server
+        kitten_server().shutdown()
+        child_pool.shutdown()
         del self.child_monitor
         for tm in self.os_window_map.values():
             tm.destroy()
@@ -33,6 +33,7 @@ typedef struct {
     char *data;
     size_t sz;
     int fd;
+    bool peer_closed;
 } Message;
 
 typedef struct {
@@ -214,6 +215,7 @@ wakeup_io_loop(bool in_signal_handler) {
 static void* io_loop(void *data);
 static void* talk_loop(void *data);
 static void send_response(int fd, const char *msg, size_t msg_sz);
+static void add_peer_writer(int fd, const char* msg, size_t msg_sz, bool finishes_request);
 static void wakeup_talk_loop(bool);
 static bool talk_thread_started = false;
 
@@ -320,6 +322,29 @@ needs_write(ChildMonitor UNUSED *self, PyObject *args) {
     Py_RETURN_FALSE;
 }
 
+static PyObject *
+pending_write_size(ChildMonitor *self, PyObject *args) {
+#define pending_write_size_doc "pending_write_size(id) -> The number of bytes queued to be written to child, or None if there is no such child."
+    unsigned long id;
+    size_t ans = 0;
+    bool found = false;
+    if (!PyArg_ParseTuple(args, "k", &id)) return NULL;
+    children_mutex(lock);
+    for (size_t i = 0; i < self->count; i++) {
+        if (children[i].id == id) {
+            found = true;
+            Screen *screen = children[i].screen;
+            screen_mutex(lock, write);
+            ans = screen->write_buf_used;
+            screen_mutex(unlock, write);
+            break;
+        }
+    }
+    children_mutex(unlock);
+    if (!found) Py_RETURN_NONE;
+    return PyLong_FromSize_t(ans);
+}
+
 static PyObject *
 shutdown_monitor(ChildMonitor *self, PyObject *a UNUSED) {
 #define shutdown_monitor_doc "shutdown_monitor() -> Shutdown the monitor loop."
@@ -377,7 +402,7 @@ parse_input(ChildMonitor *self) {
         if (msg) {
             for (size_t i = 0; i < self->messages_count; i++) {
                 Message *m = self->messages + i;
-                PyTuple_SET_ITEM(msg, i, Py_BuildValue("y#i", m->data, (int)m->sz, m->fd));
+                PyTuple_SET_ITEM(msg, i, Py_BuildValue("y#iO", m->data, (Py_ssize_t)m->sz, m->fd, m->peer_closed ? Py_True : Py_False));
                 free(m->data); m->data = NULL; m->sz = 0;
             }
             self->messages_count = 0;
@@ -396,9 +421,17 @@ parse_input(ChildMonitor *self) {
     children_mutex(unlock);
     if (msg) {
         for (Py_ssize_t i = 0; i < PyTuple_GET_SIZE(msg); i++) {
-            PyObject *resp = PyObject_CallMethod(global_state.boss, "peer_message_received", "O", PyTuple_GET_ITEM(PyTuple_GET_ITEM(msg, i), 0));
-            int peer_fd = (int)PyLong_AsLong(PyTuple_GET_ITEM(PyTuple_GET_ITEM(msg, i), 1));
-            if (resp && PyBytes_Check(resp)) send_response(peer_fd, PyBytes_AS_STRING(resp), PyBytes_GET_SIZE(resp));
+            PyObject *m = PyTuple_GET_ITEM(msg, i);
+            int peer_fd = (int)PyLong_AsLong(PyTuple_GET_ITEM(m, 1));
+            if (PyTuple_GET_ITEM(m, 2) == Py_True) {
+                PyObject *ret = PyObject_CallMethod(global_state.boss, "peer_closed", "i", peer_fd);
+                if (ret == NULL) PyErr_Print();
+                Py_CLEAR(ret);
+                continue;
+            }
+            PyObject *resp = PyObject_CallMethod(global_state.boss, "peer_message_received", "Oi", PyTuple_GET_ITEM(m, 0), peer_fd);
+            if (resp == Py_False) { /* the request is kept open and will be finished by a call to send_to_peer() */ }
+            else if (resp && PyBytes_Check(resp)) send_response(peer_fd, PyBytes_AS_STRING(resp), PyBytes_GET_SIZE(resp));
             else { send_response(peer_fd, NULL, 0); if (!resp) PyErr_Print(); }
             Py_CLEAR(resp);
         }
@@ -445,6 +478,18 @@ mark_for_close(ChildMonitor *self, PyObject *args) {
     Py_RETURN_NONE;
 }
 
+static PyObject *
+send_to_peer(ChildMonitor UNUSED *self, PyObject *args) {
+#define send_to_peer_doc "send_to_peer(peer_id, data, finishes_request) -> Write data to a peer connected to the remote control socket. If finishes_request is True, the request for which peer_message_received() returned False is finished."
+    int peer_fd, finishes_request;
+    const char *data = NULL;
+    Py_ssize_t sz = 0;
+    if (!PyArg_ParseTuple(args, "iz#p", &peer_fd, &data, &sz, &finishes_request)) return NULL;
+    add_peer_writer(peer_fd, data, sz, finishes_request);
+    wakeup_talk_loop(false);
+    Py_RETURN_NONE;
+}
+
 static inline bool
 pty_resize(int fd, struct winsize *dim) {
     while(true) {
@@ -1211,29 +1256,34 @@ io_loop(void *data) {
 
 // {{{ Talk thread functions
 
+// Every connected peer has a single entry here. A peer can send either a
+// single message terminated by EOF (used by single instance and old remote
+// control clients) or a stream of DCS framed remote control commands, in
+// which case each frame is dispatched as soon as it is complete and the
+// connection is kept open for further commands. Responses are written back in
+// the order in which the requests were received.
 typedef struct {
-    char *data;
-    size_t capacity, used;
     int fd;
-    bool finished, close_socket;
-} PeerReadData;
-static PeerReadData empty_prd = {.fd = -1, 0};
+    char *read_buf, *write_buf;
+    size_t read_capacity, read_used, write_capacity, write_used, write_pos;
+    size_t num_pending_responses;
+    bool read_finished, close_socket, has_frames, close_notified;
+} Peer;
+static Peer empty_peer = {.fd = -1, 0};
 
 typedef struct {
     char *data;
-    size_t sz, pos;
+    size_t sz;
     int fd;
-    bool finished;
-} PeerWriteData;
-static PeerWriteData empty_pwd = {.fd = -1, 0};
+    bool finishes_request;
+} QueuedWrite;
 
 typedef struct {
-    size_t num_listen_fds, num_talk_fds, num_reads, num_writes, num_queued_writes;
-    size_t fds_capacity, reads_capacity, writes_capacity, queued_writes_capacity;
+    size_t num_listen_fds, num_peers, num_queued_writes;
+    size_t fds_capacity, peers_capacity, queued_writes_capacity;
     struct pollfd *fds;
-    PeerReadData *reads;
-    PeerWriteData *writes;
-    PeerWriteData *queued_writes;
+    Peer *peers;
+    QueuedWrite *queued_writes;
     int wakeup_fds[2];
     pthread_mutex_t peer_lock;
 } TalkData;
@@ -1241,6 +1291,8 @@ typedef struct {
 static TalkData talk_data = {0};
 typedef struct pollfd PollFD;
 #define PEER_LIMIT 256
+#define MAX_PEER_MESSAGE_SIZE (1024u * 1024u)
+#define MAX_PEER_WRITE_BUFFER_SIZE (16u * 1024u * 1024u)
 #define nuke_socket(s) { shutdown(s, SHUT_RDWR); close(s); }
 
 static inline bool
@@ -1251,13 +1303,10 @@ accept_peer(int listen_fd, bool shutting_down) {
         if (!shutting_down) perror("accept() on talk socket failed!");
         return false;
     }
-    size_t fd_idx = talk_data.num_listen_fds + talk_data.num_talk_fds;
-    if (fd_idx < PEER_LIMIT && talk_data.reads_capacity < PEER_LIMIT) {
-        ensure_space_for(&talk_data, fds, PollFD, fd_idx + 1, fds_capacity, 8, false);
-        talk_data.fds[fd_idx].fd = peer; talk_data.fds[fd_idx].events = POLLIN;
-        ensure_space_for(&talk_data, reads, PeerReadData, talk_data.num_reads + 1, reads_capacity, 8, false);
-        talk_data.reads[talk_data.num_reads] = empty_prd; talk_data.reads[talk_data.num_reads++].fd = peer;
-        talk_data.num_talk_fds++;
+    if (talk_data.num_peers < PEER_LIMIT) {
+        ensure_space_for(&talk_data, peers, Peer, talk_data.num_peers + 1, peers_capacity, 8, false);
+        talk_data.peers[talk_data.num_peers] = empty_peer;
+        talk_data.peers[talk_data.num_peers++].fd = peer;
     } else {
         log_error("Too many peers want to talk, ignoring one.");
         nuke_socket(peer);
@@ -1265,109 +1314,141 @@ accept_peer(int listen_fd, bool shutting_down) {
     return true;
 }
 
-static inline bool
-read_from_peer(ChildMonitor *self, int s) {
-    bool read_finished = false;
-    for (size_t i = 0; i < talk_data.num_reads; i++) {
-        PeerReadData *rd = talk_data.reads + i;
-#define failed(msg) { read_finished = true; log_error("%s", msg); rd->finished = true; rd->close_socket = true; break; }
-        if (rd->fd == s) {
-            if (rd->used >= rd->capacity) {
-                if (rd->capacity >= 1024 * 1024) failed("Ignoring too large message from peer");
-                rd->capacity = MAX(8192, rd->capacity * 2);
-                rd->data = realloc(rd->data, rd->capacity);
-                if (!rd->data) failed("Out of memory");
-            }
-            ssize_t n = recv(s, rd->data + rd->used, rd->capacity - rd->used, 0);
-            if (n == 0) {
-                read_finished = true; rd->finished = true;
-                children_mutex(lock);
-                ensure_space_for(self, messages, Message, self->messages_count + 1, messages_capacity, 16, true);
-                Message *m = self->messages + self->messages_count++;
-                m->data = rd->data; rd->data = NULL; m->sz = rd->used; m->fd = s;
-                children_mutex(unlock);
-                wakeup_main_loop();
-            } else if (n < 0) {
-                if (errno != EINTR) {
-                    perror("Error reading from talk peer");
-                    failed("");
-                }
-            } else rd->used += n;
-            break;
-        }
-    }
-#undef failed
-    return read_finished;
+static inline void
+queue_peer_message(ChildMonitor *self, Peer *peer, char *data, size_t sz) {
+    // takes ownership of data
+    children_mutex(lock);
+    ensure_space_for(self, messages, Message, self->messages_count + 1, messages_capacity, 16, true);
+    Message *m = self->messages + self->messages_count++;
+    m->data = data; m->sz = sz; m->fd = peer->fd; m->peer_closed = false;
+    children_mutex(unlock);
+    peer->num_pending_responses++;
+    wakeup_main_loop();
 }
 
-static inline bool
-write_to_peer(int fd) {
-    bool write_finished = false;
-    for (size_t i = 0; i < talk_data.num_writes; i++) {
-        PeerWriteData *wd = talk_data.writes + i;
-#define failed(msg) { write_finished = true; log_error("%s", msg); wd->finished = true; break; }
-        if (wd->fd == fd) {
-            ssize_t n = send(fd, wd->data + wd->pos, wd->sz - wd->pos, MSG_NOSIGNAL);
-            if (n == 0) { failed("send() to peer failed to send any data"); }
-            else if (n < 0) {
-                if (errno != EINTR) { perror("write() to peer socket failed with error"); failed(""); }
-            } else {
-                wd->pos += n;
-                if (wd->pos >= wd->sz) { write_finished = true; wd->finished = true; }
-            }
-            break;
-        }
+static inline void
+notify_peer_closed(ChildMonitor *self, Peer *peer) {
+    // Requests that are kept open, such as event subscriptions, need to be
+    // told that the peer has gone away so that they can be finished
+    peer->close_notified = true;
+    children_mutex(lock);
+    ensure_space_for(self, messages, Message, self->messages_count + 1, messages_capacity, 16, true);
+    Message *m = self->messages + self->messages_count++;
+    m->data = NULL; m->sz = 0; m->fd = peer->fd; m->peer_closed = true;
+    children_mutex(unlock);
+    wakeup_main_loop();
+}
 
+static inline const char*
+find_frame_terminator(const char *data, size_t sz) {
+    for (size_t i = 0; i + 1 < sz; i++) {
+        if (data[i] == 0x1b && data[i + 1] == '\\') return data + i;
     }
-#undef failed
-    return write_finished;
+    return NULL;
+}
+
+static inline const char*
+find_frame_start(const char *data, size_t sz) {
+    // A trailing ESC is returned as well, as it could be the start of a frame
+    // whose remainder has not been read yet
+    for (size_t i = 0; i < sz; i++) {
+        if (data[i] == 0x1b && (i + 1 == sz || data[i + 1] == 'P')) return data + i;
+    }
+    return NULL;
 }
 
 static inline void
-remove_poll_fd(int fd) {
-    size_t count = talk_data.num_talk_fds + talk_data.num_listen_fds;
-    for (size_t i = talk_data.num_listen_fds; i < count; i++) {
-        struct pollfd *pfd = talk_data.fds + i;
-        if (pfd->fd == fd) {
-            size_t num_to_right = count - 1 - i;
-            if (num_to_right) memmove(talk_data.fds + i, talk_data.fds + i + 1, num_to_right * sizeof(struct pollfd));
-            talk_data.num_talk_fds--;
+dispatch_complete_frames(ChildMonitor *self, Peer *peer) {
+    // Bytes outside of frames, such as the trailing newline added by echo,
+    // are skipped
+    size_t consumed = 0;
+    while (consumed < peer->read_used) {
+        const char *start = find_frame_start(peer->read_buf + consumed, peer->read_used - consumed);
+        if (!start) {
+            if (peer->has_frames) consumed = peer->read_used;
             break;
         }
+        if (peer->has_frames) consumed = start - peer->read_buf;
+        size_t available = peer->read_buf + peer->read_used - start;
+        if (available < 3) break;
+        const char *end = find_frame_terminator(start + 2, available - 2);
+        if (!end) break;
+        size_t sz = end + 2 - start;
+        char *frame = malloc(sz);
+        if (!frame) fatal("Out of memory");
+        memcpy(frame, start, sz);
+        queue_peer_message(self, peer, frame, sz);
+        consumed = end + 2 - peer->read_buf;
+        peer->has_frames = true;
+    }
+    if (consumed) {
+        peer->read_used -= consumed;
+        if (peer->read_used) memmove(peer->read_buf, peer->read_buf + consumed, peer->read_used);
     }
 }
 
 static inline void
-prune_finished_reads() {
-    if (!talk_data.num_reads) return;
-    for (ssize_t i = talk_data.num_reads - 1; i >= 0; i--) {
-        PeerReadData *rd = talk_data.reads + i;
-        if (rd->finished) {
-            remove_poll_fd(rd->fd);
-            if (rd->close_socket) { nuke_socket(rd->fd); }
-            else shutdown(rd->fd, SHUT_RD);
-            free(rd->data);
-            ssize_t num_to_right = talk_data.num_reads - 1 - i;
-            if (num_to_right > 0) memmove(talk_data.reads + i, talk_data.reads + i + 1, num_to_right * sizeof(PeerReadData));
-            else talk_data.reads[i] = empty_prd;
-            talk_data.num_reads--;
+read_from_peer(ChildMonitor *self, Peer *peer) {
+#define failed(msg) { if (msg[0]) log_error("%s", msg); peer->read_finished = true; peer->close_socket = true; return; }
+    if (peer->read_used >= peer->read_capacity) {
+        if (peer->read_capacity >= MAX_PEER_MESSAGE_SIZE) failed("Ignoring too large message from peer");
+        peer->read_capacity = MAX(8192u, peer->read_capacity * 2);
+        peer->read_buf = realloc(peer->read_buf, peer->read_capacity);
+        if (!peer->read_buf) failed("Out of memory");
+    }
+    ssize_t n = recv(peer->fd, peer->read_buf + peer->read_used, peer->read_capacity - peer->read_used, 0);
+    if (n == 0) {
+        peer->read_finished = true;
+        if (peer->has_frames) {
+            if (peer->read_used) log_error("Ignoring incomplete command frame from peer");
+        } else if (peer->read_used) {
+            queue_peer_message(self, peer, peer->read_buf, peer->read_used);
+            peer->read_buf = NULL; peer->read_capacity = 0;
         }
+        peer->read_used = 0;
+    } else if (n < 0) {
+        if (errno != EINTR) {
+            perror("Error reading from talk peer");
+            failed("");
+        }
+    } else {
+        peer->read_used += n;
+        dispatch_complete_frames(self, peer);
+    }
+#undef failed
+}
+
+static inline void
+write_to_peer(Peer *peer) {
+    ssize_t n = send(peer->fd, peer->write_buf + peer->write_pos, peer->write_used - peer->write_pos, MSG_NOSIGNAL);
+    if (n == 0) { log_error("send() to peer failed to send any data"); peer->close_socket = true; }
+    else if (n < 0) {
+        if (errno != EINTR) { perror("write() to peer socket failed with error"); peer->close_socket = true; }
+    } else {
+        peer->write_pos += n;
+        if (peer->write_pos >= peer->write_used) peer->write_pos = peer->write_used = 0;
     }
+    if (peer->close_socket) { peer->read_finished = true; peer->write_pos = peer->write_used = 0; }
+}
+
+static inline bool
+peer_is_finished(Peer *peer) {
+    // A peer may only be closed once all requests it sent have been responded
+    // to, otherwise a response could be sent to a re-used fd
+    return peer->read_finished && !peer->num_pending_responses && peer->write_used <= peer->write_pos;
 }
 
 static inline void
-prune_finished_writes() {
-    if (!talk_data.num_writes) return;
-    for (ssize_t i = talk_data.num_writes - 1; i >= 0; i--) {
-        PeerWriteData *wd = talk_data.writes + i;
-        if (wd->finished) {
-            remove_poll_fd(wd->fd);
-            shutdown(wd->fd, SHUT_WR); close(wd->fd);
-            free(wd->data);
-            ssize_t num_to_right = talk_data.num_writes - 1 - i;
-            if (num_to_right > 0) memmove(talk_data.writes + i, talk_data.writes + i + 1, num_to_right * sizeof(PeerWriteData));
-            else talk_data.writes[i] = empty_pwd;
-            talk_data.num_writes--;
+prune_finished_peers() {
+    if (!talk_data.num_peers) return;
+    for (ssize_t i = talk_data.num_peers - 1; i >= 0; i--) {
+        Peer *peer = talk_data.peers + i;
+        if (peer_is_finished(peer)) {
+            nuke_socket(peer->fd);
+            free(peer->read_buf); free(peer->write_buf);
+            ssize_t num_to_right = talk_data.num_peers - 1 - i;
+            if (num_to_right > 0) memmove(talk_data.peers + i, talk_data.peers + i + 1, num_to_right * sizeof(Peer));
+            talk_data.peers[--talk_data.num_peers] = empty_peer;
         }
     }
 }
@@ -1385,23 +1466,37 @@ wakeup_talk_loop(bool in_signal_handler) {
     }
 }
 
+static inline Peer*
+find_peer(int fd) {
+    for (size_t i = 0; i < talk_data.num_peers; i++) {
+        if (talk_data.peers[i].fd == fd) return talk_data.peers + i;
+    }
+    return NULL;
+}
+
 static inline void
 move_queued_writes() {
-    while (talk_data.num_queued_writes) {
-        PeerWriteData *src = talk_data.queued_writes + --talk_data.num_queued_writes;
-        size_t fd_idx = talk_data.num_listen_fds + talk_data.num_talk_fds;
-        if (fd_idx < PEER_LIMIT && talk_data.num_writes < PEER_LIMIT) {
-            ensure_space_for(&talk_data, fds, PollFD, fd_idx + 1, fds_capacity, 8, false);
-            talk_data.fds[fd_idx].fd = src->fd; talk_data.fds[fd_idx].events = POLLOUT;
-            ensure_space_for(&talk_data, writes, PeerWriteData, talk_data.num_writes + 1, writes_capacity, 8, false);
-            talk_data.writes[talk_data.num_writes++] = *src;
-            talk_data.num_talk_fds++;
-        } else {
-            log_error("Cannot send response to peer, too many peers");
-            free(src->data); nuke_socket(src->fd);
+    // Queued writes are moved in FIFO order so that pipelined responses are
+    // sent in the same order as the requests
+    for (size_t i = 0; i < talk_data.num_queued_writes; i++) {
+        QueuedWrite *src = talk_data.queued_writes + i;
+        Peer *peer = find_peer(src->fd);
+        if (peer) {
+            if (src->finishes_request && peer->num_pending_responses) peer->num_pending_responses--;
+            if (!src->finishes_request && peer->write_used - peer->write_pos + src->sz > MAX_PEER_WRITE_BUFFER_SIZE) {
+                log_error("Disconnecting peer that is not reading the data sent to it");
+                peer->close_socket = true; peer->read_finished = true; peer->write_pos = peer->write_used = 0;
+            }
+            if (src->sz && !peer->close_socket) {
+                ensure_space_for(peer, write_buf, char, peer->write_used + src->sz, write_capacity, 8192, false);
+                memcpy(peer->write_buf + peer->write_used, src->data, src->sz);
+                peer->write_used += src->sz;
+            }
         }
-        *src = empty_pwd;
+        free(src->data);
+        src->data = NULL;
     }
+    talk_data.num_queued_writes = 0;
 }
 
 static void*
@@ -1422,55 +1517,72 @@ talk_loop(void *data) {
     talk_data.fds[talk_data.num_listen_fds].fd = talk_data.wakeup_fds[0]; talk_data.fds[talk_data.num_listen_fds++].events = POLLIN;
 
     while (LIKELY(!self->shutting_down)) {
-        for (size_t i = 0; i < talk_data.num_listen_fds + talk_data.num_talk_fds; i++) { talk_data.fds[i].revents = 0; }
-        int ret = poll(talk_data.fds, talk_data.num_listen_fds + talk_data.num_talk_fds, -1);
+        size_t num_peers = talk_data.num_peers;
+        ensure_space_for(&talk_data, fds, PollFD, talk_data.num_listen_fds + num_peers, fds_capacity, 8, false);
+        for (size_t i = 0; i < num_peers; i++) {
+            Peer *peer = talk_data.peers + i;
+            PollFD *pfd = talk_data.fds + talk_data.num_listen_fds + i;
+            pfd->events = 0;
+            if (!peer->read_finished) pfd->events |= POLLIN;
+            if (peer->write_used > peer->write_pos) pfd->events |= POLLOUT;
+            // peers waiting for a response are not polled at all
+            pfd->fd = pfd->events ? peer->fd : -1;
+        }
+        for (size_t i = 0; i < talk_data.num_listen_fds + num_peers; i++) { talk_data.fds[i].revents = 0; }
+        int ret = poll(talk_data.fds, talk_data.num_listen_fds + num_peers, -1);
         if (ret > 0) {
-            bool has_finished_reads = false, has_finished_writes = false;
             for (size_t i = 0; i < talk_data.num_listen_fds - 1; i++) {
                 if (talk_data.fds[i].revents & POLLIN) {if (!accept_peer(talk_data.fds[i].fd, self->shutting_down)) goto end; }
             }
             if (talk_data.fds[talk_data.num_listen_fds - 1].revents & POLLIN) drain_fd(talk_data.fds[talk_data.num_listen_fds - 1].fd);  // wakeup
-            for (size_t i = talk_data.num_listen_fds; i < talk_data.num_talk_fds + talk_data.num_listen_fds; i++) {
-                if (talk_data.fds[i].revents & (POLLIN | POLLHUP)) { if (read_from_peer(self, talk_data.fds[i].fd)) has_finished_reads = true; }
-                if (talk_data.fds[i].revents & POLLOUT) { if (write_to_peer(talk_data.fds[i].fd)) has_finished_writes = true; }
+            for (size_t i = 0; i < num_peers; i++) {
+                Peer *peer = talk_data.peers + i;
+                short revents = talk_data.fds[talk_data.num_listen_fds + i].revents;
+                if (revents & (POLLIN | POLLHUP) && !peer->read_finished) read_from_peer(self, peer);
+                if (revents & POLLOUT && !peer->close_socket) write_to_peer(peer);
+                if (revents & (POLLERR | POLLNVAL)) { peer->read_finished = true; peer->close_socket = true; peer->write_pos = peer->write_used = 0; }
             }
-            if (has_finished_reads) prune_finished_reads();
-            if (has_finished_writes) prune_finished_writes();
-            peer_mutex(lock);
-            if (talk_data.num_queued_writes) move_queued_writes();
-            peer_mutex(unlock);
         } else if (ret < 0) { if (errno != EAGAIN && errno != EINTR) perror("poll() on talk fds failed"); }
+        peer_mutex(lock);
+        if (talk_data.num_queued_writes) move_queued_writes();
+        peer_mutex(unlock);
+        for (size_t i = 0; i < talk_data.num_peers; i++) {
+            Peer *peer = talk_data.peers + i;
+            if (peer->read_finished && peer->num_pending_responses && !peer->close_notified) notify_peer_closed(self, peer);
+        }
+        prune_finished_peers();
     }
 end:
     close(talk_data.wakeup_fds[0]); close(talk_data.wakeup_fds[1]);
-    free(talk_data.fds); free(talk_data.reads); free(talk_data.writes); free(talk_data.queued_writes);
+    for (size_t i = 0; i < talk_data.num_peers; i++) { free(talk_data.peers[i].read_buf); free(talk_data.peers[i].write_buf); }
+    for (size_t i = 0; i < talk_data.num_queued_writes; i++) free(talk_data.queued_writes[i].data);
+    free(talk_data.fds); free(talk_data.peers); free(talk_data.queued_writes);
     return 0;
 }
 
-static inline bool
-add_peer_writer(int fd, const char* msg, size_t msg_sz) {
-    bool ok = false;
+static void
+add_peer_writer(int fd, const char* msg, size_t msg_sz, bool finishes_request) {
+    // Every request must be matched by exactly one call to this function
+    // with finishes_request set, even when there is nothing to send, so that
+    // the talk thread knows when it is safe to close the connection
     peer_mutex(lock);
-    if (talk_data.num_queued_writes < PEER_LIMIT) {
-        ensure_space_for(&talk_data, queued_writes, PeerWriteData, talk_data.num_queued_writes + 1, queued_writes_capacity, 8, false);
-        talk_data.queued_writes[talk_data.num_queued_writes] = empty_pwd;
-        talk_data.queued_writes[talk_data.num_queued_writes].data = malloc(msg_sz);
-        if (talk_data.queued_writes[talk_data.num_queued_writes].data) {
-            memcpy(talk_data.queued_writes[talk_data.num_queued_writes].data, msg, msg_sz);
-            talk_data.queued_writes[talk_data.num_queued_writes].sz = msg_sz;
-            talk_data.queued_writes[talk_data.num_queued_writes++].fd = fd;
-            ok = true;
-        }
-    } else log_error("Cannot send response to peer, too many peers");
+    ensure_space_for(&talk_data, queued_writes, QueuedWrite, talk_data.num_queued_writes + 1, queued_writes_capacity, 8, false);
+    QueuedWrite *w = talk_data.queued_writes + talk_data.num_queued_writes++;
+    w->fd = fd; w->sz = 0; w->data = NULL; w->finishes_request = finishes_request;
+    if (msg && msg_sz) {
+        w->data = malloc(msg_sz);
+        if (w->data) {
+            memcpy(w->data, msg, msg_sz);
+            w->sz = msg_sz;
+        } else log_error("Out of memory while queueing response to peer");
+    }
     peer_mutex(unlock);
-    return ok;
 }
 
 static void
 send_response(int fd, const char *msg, size_t msg_sz) {
-    if (msg == NULL) { shutdown(fd, SHUT_WR); close(fd); return; }
-    if (!add_peer_writer(fd, msg, msg_sz)) { shutdown(fd, SHUT_WR); close(fd); }
-    else wakeup_talk_loop(false);
+    add_peer_writer(fd, msg, msg_sz, true);
+    wakeup_talk_loop(false);
 }
 
 // }}}
@@ -1479,11 +1591,13 @@ send_response(int fd, const char *msg, size_t msg_sz) {
 static PyMethodDef methods[] = {
     METHOD(add_child, METH_VARARGS)
     METHOD(needs_write, METH_VARARGS)
+    METHOD(pending_write_size, METH_VARARGS)
     METHOD(start, METH_NOARGS)
     METHOD(wakeup, METH_NOARGS)
     METHOD(shutdown_monitor, METH_NOARGS)
     METHOD(main_loop, METH_NOARGS)
     METHOD(mark_for_close, METH_VARARGS)
+    METHOD(send_to_peer, METH_VARARGS)
     METHOD(resize_pty, METH_VARARGS)
     {NULL}  /* Sentinel */
 };
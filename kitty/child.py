@@ -4,12 +4,15 @@
 
 import fcntl
 import os
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from contextlib import contextmanager
+from functools import partial
+from time import monotonic
 
 import kitty.fast_data_types as fast_data_types
 
 from .constants import is_macos, shell_path, terminfo_dir
+from .trace import span
 
 if is_macos:
     from kitty.fast_data_types import (
@@ -26,6 +29,9 @@ if is_macos:
             ans[pgid].append(pid)
         return ans
 
+    def processes_in_group_under(grp, pid):
+        return None  # listing the children of a process is not supported
+
 else:
 
     def cmdline_of_process(pid):
@@ -56,29 +62,120 @@ else:
             ans[q].append(pid)
         return ans
 
+    def stat_fields(pid):
+        raw = open('/proc/{}/stat'.format(pid), 'rb').read().decode('utf-8')
+        # The process name is in parentheses and can contain spaces
+        return raw[raw.rfind(')') + 2:].split(' ')
+
+    def can_list_children():
+        ans = getattr(can_list_children, 'ans', None)
+        if ans is None:
+            pid = os.getpid()
+            ans = can_list_children.ans = os.path.exists('/proc/{}/task/{}/children'.format(pid, pid))
+        return ans
 
-def processes_in_group(grp):
+    def processes_in_group_under(grp, pid):
+        ''' Return the processes in the process group grp that are pid or its
+        descendants, or None if the kernel cannot list the children of a process '''
+        if not can_list_children():
+            return
+        ans, pending = [], [pid]
+        while pending:
+            pid = pending.pop()
+            try:
+                if int(stat_fields(pid)[2]) == grp:
+                    ans.append(pid)
+                for tid in os.listdir('/proc/{}/task'.format(pid)):
+                    with open('/proc/{}/task/{}/children'.format(pid, tid), 'rb') as f:
+                        pending.extend(map(int, f.read().split()))
+            except EnvironmentError:
+                continue  # process or thread exited
+        return sorted(ans)
+
+
+def processes_in_group(grp, root_pid=None):
+    '''
+    Return the processes in the process group grp. When root_pid is
+    specified, only its process tree is searched, falling back to looking at
+    all processes if that is not possible or finds nothing.
+    '''
+    if root_pid is not None:
+        ans = processes_in_group_under(grp, root_pid)
+        if ans:
+            return ans
     gmap = getattr(process_group_map, 'cached_map', None)
     if gmap is None:
         try:
             gmap = process_group_map()
         except Exception:
             gmap = {}
+        if getattr(process_group_map, 'cache_enabled', False):
+            process_group_map.cached_map = gmap
     return gmap.get(grp, [])
 
 
 @contextmanager
 def cached_process_data():
-    try:
-        process_group_map.cached_map = process_group_map()
-    except Exception:
-        process_group_map.cached_map = {}
+    # The map of all processes is only built if some lookup actually needs it
+    process_group_map.cache_enabled = True
     try:
         yield
     finally:
+        process_group_map.cache_enabled = False
         process_group_map.cached_map = None
 
 
+class ProcessInfoCache:
+
+    '''
+    Cache information about processes, such as their command lines, so that
+    it is not read from the OS on every access. Entries expire after ttl
+    seconds, as processes can change their command line and working
+    directory, and exec can change their environment. Expired entries are
+    removed at most once every ttl seconds, so that the cache does not grow
+    with the number of processes ever queried.
+    '''
+
+    def __init__(self, ttl=0.5):
+        self.ttl = ttl
+        self.entries = {}
+        self.next_prune_at = 0
+
+    def get(self, pid, field, fetch):
+        now = monotonic()
+        if now >= self.next_prune_at:
+            self.prune(now)
+        entry = self.entries.get(pid)
+        if entry is None or now >= entry['expires_at']:
+            entry = self.entries[pid] = {'expires_at': now + self.ttl, 'values': {}}
+        values = entry['values']
+        if field not in values:
+            values[field] = fetch(pid)
+        return values[field]
+
+    def cmdline(self, pid):
+        return self.get(pid, 'cmdline', cmdline_of_process)
+
+    def cwd(self, pid):
+        return self.get(pid, 'cwd', cwd_of_process)
+
+    def environ(self, pid):
+        return self.get(pid, 'environ', environ_of_process)
+
+    def invalidate(self, pid=None):
+        if pid is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(pid, None)
+
+    def prune(self, now=None):
+        if now is None:
+            now = monotonic()
+        for pid in tuple(pid for pid, e in self.entries.items() if now >= e['expires_at']):
+            del self.entries[pid]
+        self.next_prune_at = now + self.ttl
+
+
 def parse_environ_block(data):
     """Parse a C environ block of environment variables into a dictionary."""
     # The block is usually raw data from the target process.  It might contain
@@ -106,6 +203,9 @@ def environ_of_process(pid):
     return parse_environ_block(_environ_of_process(pid))
 
 
+process_info = ProcessInfoCache()
+
+
 def remove_cloexec(fd):
     fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) & ~fcntl.FD_CLOEXEC)
 
@@ -128,6 +228,7 @@ class Child:
 
     child_fd = pid = None
     forked = False
+    window_id = 0
 
     def __init__(self, argv, cwd, opts, stdin=None, env=None, cwd_from=None):
         self.allow_remote_control = False
@@ -153,60 +254,103 @@ class Child:
         if self.forked:
             return
         self.forked = True
+        env = default_env().copy()
+        env.update(self.env)
+        env['TERM'] = self.opts.term
+        env['COLORTERM'] = 'truecolor'
+        if os.path.isdir(terminfo_dir):
+            env['TERMINFO'] = terminfo_dir
+        argv = list(self.argv)
+        exe = argv[0]
+        pid = None
+        if argv[1:2] == ['+runpy']:
+            from kittens.runner import kitten_server, runner_cmd
+            if argv[2:3] == [runner_cmd] and kitten_server().is_ready():
+                # Fork kittens from the kitten server instead of starting a
+                # new interpreter, falling back to exec if that fails
+                pid = self.spawn(partial(kitten_server().spawn, argv[3:], self.cwd, env))
+        if pid is None:
+            if is_macos and exe == shell_path:
+                # Some macOS machines need the shell to have argv[0] prefixed by
+                # hyphen, see https://github.com/kovidgoyal/kitty/issues/247
+                argv[0] = ('-' + exe.split('/')[-1])
+            cenv = tuple('{}={}'.format(k, v) for k, v in env.items())
+            with span('fork child', cmd=exe):
+                pid = self.spawn(partial(fast_data_types.spawn, exe, self.cwd, tuple(argv), cenv))
+        return pid
+
+    def spawn(self, spawn_func):
         master, slave = os.openpty()  # Note that master and slave are in blocking mode
         remove_cloexec(slave)
         fast_data_types.set_iutf8(master, True)
-        stdin, self.stdin = self.stdin, None
         ready_read_fd, ready_write_fd = os.pipe()
         remove_cloexec(ready_read_fd)
-        if stdin is not None:
+        if self.stdin is not None:
             stdin_read_fd, stdin_write_fd = os.pipe()
             remove_cloexec(stdin_read_fd)
         else:
             stdin_read_fd = stdin_write_fd = -1
-        env = default_env().copy()
-        env.update(self.env)
-        env['TERM'] = self.opts.term
-        env['COLORTERM'] = 'truecolor'
-        if os.path.isdir(terminfo_dir):
-            env['TERMINFO'] = terminfo_dir
-        env = tuple('{}={}'.format(k, v) for k, v in env.items())
-        argv = list(self.argv)
-        exe = argv[0]
-        if is_macos and exe == shell_path:
-            # Some macOS machines need the shell to have argv[0] prefixed by
-            # hyphen, see https://github.com/kovidgoyal/kitty/issues/247
-            argv[0] = ('-' + exe.split('/')[-1])
-        pid = fast_data_types.spawn(exe, self.cwd, tuple(argv), env, master, slave, stdin_read_fd, stdin_write_fd, ready_read_fd, ready_write_fd)
+        pid = spawn_func(master, slave, stdin_read_fd, stdin_write_fd, ready_read_fd, ready_write_fd)
         os.close(slave)
+        os.close(ready_read_fd)
+        if stdin_read_fd > -1:
+            os.close(stdin_read_fd)
+        if pid is None:
+            for fd in (master, ready_write_fd, stdin_write_fd):
+                if fd > -1:
+                    os.close(fd)
+            return
         self.pid = pid
         self.child_fd = master
+        stdin, self.stdin = self.stdin, None
         if stdin is not None:
-            os.close(stdin_read_fd)
             fast_data_types.thread_write(stdin_write_fd, stdin)
-        os.close(ready_read_fd)
         self.terminal_ready_fd = ready_write_fd
         fcntl.fcntl(self.child_fd, fcntl.F_SETFL, fcntl.fcntl(self.child_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
         return pid
 
     def mark_terminal_ready(self):
-        os.close(self.terminal_ready_fd)
-        self.terminal_ready_fd = -1
+        if self.terminal_ready_fd > -1:
+            os.close(self.terminal_ready_fd)
+            self.terminal_ready_fd = -1
+
+    @property
+    def is_alive(self):
+        # Used for children that were never added to the child monitor. They
+        # are our own children, so waitpid() reaps them if they have exited
+        # and fails if they were already reaped, unlike kill(), which succeeds
+        # if the pid has been reused by some other process.
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+        except ChildProcessError:
+            return False
+        return pid == 0
+
+    def discard(self):
+        # Used for children that were never added to the child monitor
+        import signal
+        if self.is_alive:
+            try:
+                os.killpg(os.getpgid(self.pid), signal.SIGHUP)
+            except OSError:
+                pass
+        self.mark_terminal_ready()
+        os.close(self.child_fd)
 
     @property
     def foreground_processes(self):
         try:
             pgrp = os.tcgetpgrp(self.child_fd)
-            foreground_processes = processes_in_group(pgrp) if pgrp >= 0 else []
+            foreground_processes = processes_in_group(pgrp, self.pid) if pgrp >= 0 else []
 
             def process_desc(pid):
                 ans = {'pid': pid}
                 try:
-                    ans['cmdline'] = cmdline_of_process(pid)
+                    ans['cmdline'] = process_info.cmdline(pid)
                 except Exception:
                     pass
                 try:
-                    ans['cwd'] = cwd_of_process(pid) or None
+                    ans['cwd'] = process_info.cwd(pid) or None
                 except Exception:
                     pass
                 return ans
@@ -218,21 +362,21 @@ class Child:
     @property
     def cmdline(self):
         try:
-            return cmdline_of_process(self.pid) or list(self.argv)
+            return process_info.cmdline(self.pid) or list(self.argv)
         except Exception:
             return list(self.argv)
 
     @property
     def environ(self):
         try:
-            return environ_of_process(self.pid)
+            return process_info.environ(self.pid)
         except Exception:
             return {}
 
     @property
     def current_cwd(self):
         try:
-            return cwd_of_process(self.pid)
+            return process_info.cwd(self.pid)
         except Exception:
             pass
 
@@ -240,7 +384,7 @@ class Child:
     def pid_for_cwd(self):
         try:
             pgrp = os.tcgetpgrp(self.child_fd)
-            foreground_processes = processes_in_group(pgrp) if pgrp >= 0 else []
+            foreground_processes = processes_in_group(pgrp, self.pid) if pgrp >= 0 else []
             if len(foreground_processes) == 1:
                 return foreground_processes[0]
         except Exception:
@@ -253,3 +397,110 @@ class Child:
             return cwd_of_process(self.pid_for_cwd) or None
         except Exception:
             pass
+
+
+class ChildPool:
+
+    ''' Shells started ahead of time, so that new windows do not have to wait
+    for them to read their startup files. There is a pool for every distinct
+    (argv, cwd, env) that windows were recently created with. Pooled children
+    run in a pty of the size of the last window created for their pool and
+    have the id of the window that will adopt them reserved. '''
+
+    max_pools = 4
+    refill_delay = 0.5
+
+    def __init__(self):
+        self.pools = OrderedDict()
+        self.refill_timer = None
+
+    def key(self, child):
+        env = tuple(sorted((k, v) for k, v in child.env.items() if k != 'KITTY_WINDOW_ID'))
+        return tuple(child.argv), child.cwd, env
+
+    def adopt(self, child):
+        ''' Return a running child to use instead of the not yet forked child
+        or None if there is none, in which case the caller must fork child and
+        then call add_template(). The pool is refilled in the background. '''
+        key = self.key(child)
+        pool = self.pools.get(key)
+        if pool is None:
+            return
+        self.pools.move_to_end(key)
+        self.drop_dead(pool['children'])
+        ans = pool['children'].pop(0) if pool['children'] else None
+        if ans is not None:
+            pool['template'] = ans
+        self.refill_later()
+        return ans
+
+    def add_template(self, child):
+        ''' Start pooling children like child '''
+        if not child.opts.child_pool_size:
+            return
+        key = self.key(child)
+        if key in self.pools:
+            self.pools.move_to_end(key)
+            self.pools[key]['template'] = child
+        else:
+            self.pools[key] = {'template': child, 'children': []}
+            while len(self.pools) > self.max_pools:
+                for q in self.pools.popitem(last=False)[1]['children']:
+                    q.discard()
+        self.refill_later()
+
+    def drop_dead(self, children):
+        alive = []
+        for child in children:
+            if child.is_alive:
+                alive.append(child)
+            else:
+                child.discard()
+        children[:] = alive
+
+    def refill_later(self):
+        if self.refill_timer is None:
+            self.refill_timer = fast_data_types.add_timer('child_pool_refill', self.refill, self.refill_delay)
+
+    def refill(self, timer_id=None):
+        if timer_id is not None:
+            fast_data_types.remove_timer(timer_id)
+            self.refill_timer = None
+        import struct
+        import termios
+        for pool in self.pools.values():
+            t = pool['template']
+            try:
+                winsize = fcntl.ioctl(t.child_fd, termios.TIOCGWINSZ, struct.pack('4H', 0, 0, 0, 0))
+            except OSError:
+                winsize = None
+            children = pool['children']
+            self.drop_dead(children)
+            while len(children) < t.opts.child_pool_size:
+                window_id = fast_data_types.reserve_window_id()
+                env = t.env.copy()
+                env['KITTY_WINDOW_ID'] = str(window_id)
+                child = Child(t.argv, t.cwd, t.opts, env=env)
+                child.window_id = window_id
+                try:
+                    child.fork()
+                except OSError:
+                    import traceback
+                    traceback.print_exc()
+                    break
+                if winsize is not None:
+                    fcntl.ioctl(child.child_fd, termios.TIOCSWINSZ, winsize)
+                child.mark_terminal_ready()
+                children.append(child)
+
+    def shutdown(self):
+        if self.refill_timer is not None:
+            fast_data_types.remove_timer(self.refill_timer)
+            self.refill_timer = None
+        for pool in self.pools.values():
+            for child in pool['children']:
+                child.discard()
+        self.pools.clear()
+
+
+child_pool = ChildPool()
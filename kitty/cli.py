@@ -101,8 +101,30 @@ def file(x):
 
 
 def parse_option_spec(spec=None):
+    '''
+    Parse the option spec into a sequence of options and a sequence of
+    disabled options. The parsed spec is cached, so parsing the same spec
+    again, as happens for every command in kitty @ batch and for every new
+    instance with --single-instance, only copies the cached options.
+    '''
     if spec is None:
         spec = options_spec()
+    ans = parse_option_spec.cache.get(spec)
+    if ans is None:
+        ans = parse_option_spec.cache[spec] = _parse_option_spec(spec)
+    seq, disabled = ans
+    return list(map(copy_option, seq)), list(map(copy_option, disabled))
+
+
+parse_option_spec.cache = {}
+
+
+def copy_option(opt):
+    # The values of an option are immutable, so a shallow copy is enough
+    return opt if isinstance(opt, str) else opt.copy()
+
+
+def _parse_option_spec(spec):
     NORMAL, METADATA, HELP = 'NORMAL', 'METADATA', 'HELP'
     state = NORMAL
     lines = spec.splitlines()
@@ -137,7 +159,7 @@ def parse_option_spec(spec=None):
                     v = eval(v)
                 current_cmd[k] = v
                 if k == 'choices':
-                    current_cmd['choices'] = {x.strip() for x in current_cmd['choices'].split(',')}
+                    current_cmd['choices'] = frozenset(x.strip() for x in current_cmd['choices'].split(','))
         elif state is HELP:
             if line:
                 spc = '' if current_cmd['help'].endswith('\n') else ' '
@@ -602,6 +624,13 @@ type=bool-set
 Print out information about the system and kitty configuration.
 
 
+--trace-startup
+Path to a file in which to write a trace of how long each phase of startup
+takes, such as importing modules, loading the config, finding fonts, compiling
+shaders and starting the first child process. The trace is in the Chrome trace
+event format and can be viewed with chrome://tracing or https://ui.perfetto.dev
+
+
 --execute -e
 type=bool-set
 !
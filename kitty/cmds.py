@@ -5,12 +5,11 @@
 import json
 import os
 import sys
+from collections import namedtuple
+from functools import partial
 
 from .cli import parse_args
-from .config import parse_config, parse_send_text_bytes
-from .constants import appname
-from .fast_data_types import focus_os_window
-from .tabs import SpecialWindow
+from .constants import appname, version
 from .utils import natsort_ints
 
 
@@ -32,10 +31,29 @@ class UnknownLayout(ValueError):
     hide_traceback = True
 
 
-cmap = {}
+class SubscriptionError(ValueError):
 
+    hide_traceback = True
 
-def cmd(short_desc, desc=None, options_spec=None, no_response=False, argspec='...', string_return_is_error=False, args_count=None):
+
+cmap = {}
+# A response that is one chunk of a larger response. The client gets the
+# next chunk by repeating the command with the continuation in the payload.
+ChunkedResponse = namedtuple('ChunkedResponse', 'data continuation')
+# A response whose data is encode(snapshot). The snapshot is captured on the
+# main thread, encoding it can be done on a worker thread.
+DeferredResponse = namedtuple('DeferredResponse', 'snapshot encode')
+# A payload for a command that sends a large amount of binary data. read(n)
+# returns at most n bytes, the client sends them in chunks with flow control.
+BulkPayload = namedtuple('BulkPayload', 'payload read')
+EVENT_TYPES = (
+    'window_created', 'window_closed', 'focus_changed', 'title_changed', 'bell', 'tab_created', 'tab_closed')
+
+
+def cmd(
+    short_desc, desc=None, options_spec=None, no_response=False, argspec='...',
+    string_return_is_error=False, args_count=None, streams_response=False
+):
 
     def w(func):
         func.short_desc = short_desc
@@ -47,6 +65,7 @@ def cmd(short_desc, desc=None, options_spec=None, no_response=False, argspec='..
         func.impl = lambda: globals()[func.__name__[4:]]
         func.no_response = no_response
         func.string_return_is_error = string_return_is_error
+        func.streams_response = streams_response
         func.args_count = 0 if not argspec else args_count
         cmap[func.name] = func
         return func
@@ -79,6 +98,9 @@ for that window is used.
 
 
 # ls {{{
+LS_WINDOW_FIELDS = ('is_focused', 'title', 'pid', 'cwd', 'cmdline', 'env', 'foreground_processes')
+
+
 @cmd(
     'List all tabs/windows',
     'List all windows. The list is returned as JSON tree. The top-level is a list of'
@@ -87,16 +109,55 @@ for that window is used.
     ' Each window has an :italic:`id`, :italic:`title`, :italic:`current working directory`, :italic:`process id (PID)`, '
     ' :italic:`command-line` and :italic:`environment` of the process running in the window.\n\n'
     'You can use these criteria to select windows/tabs for the other commands.'.format(appname=appname),
+    options_spec=MATCH_WINDOW_OPTION + '''\n
+--fields -f
+A comma separated list of the window fields to report. The window id is always
+reported. Only the requested fields are computed, which is much faster when
+there are many windows. Available fields: {fields}. Defaults to all fields.
+
+
+--format
+default=json
+choices=json,ndjson
+The output format. :italic:`json` is a single JSON tree. :italic:`ndjson` outputs one
+compact JSON object per window per line, with the ids of its OS window and tab
+in the :italic:`os_window_id` and :italic:`tab_id` keys, suitable for processing
+with line oriented tools.
+'''.format(fields=', '.join(LS_WINDOW_FIELDS)),
     argspec=''
 )
 def cmd_ls(global_opts, opts, args):
-    pass
-
-
-def ls(boss, window):
-    data = list(boss.list_os_windows())
-    data = json.dumps(data, indent=2, sort_keys=True)
-    return data
+    fields = None
+    if opts.fields:
+        fields = [x.strip() for x in opts.fields.split(',') if x.strip()]
+        unknown = set(fields) - set(LS_WINDOW_FIELDS) - {'id'}
+        if unknown:
+            raise SystemExit('Unknown window fields: {}'.format(', '.join(sorted(unknown))))
+    return {'match': opts.match, 'fields': fields, 'format': opts.format}
+
+
+def ls(boss, window, payload=None):
+    payload = payload or {}
+    window_ids = None
+    match = payload.get('match')
+    if match:
+        window_ids = {w.id for w in boss.match_windows(match)}
+        if not window_ids:
+            raise MatchError(match)
+    data = list(boss.list_os_windows(payload.get('fields'), window_ids))
+    if payload.get('format') == 'ndjson':
+        return DeferredResponse(data, ls_as_ndjson)
+    return DeferredResponse(data, partial(json.dumps, indent=2, sort_keys=True))
+
+
+def ls_as_ndjson(data):
+    lines = []
+    for os_window in data:
+        for tab in os_window['tabs']:
+            for w in tab['windows']:
+                w['os_window_id'], w['tab_id'] = os_window['id'], tab['id']
+                lines.append(json.dumps(w))
+    return '\n'.join(lines)
 # }}}
 
 
@@ -136,6 +197,11 @@ not interpreted for escapes. If stdin is a terminal, you can press Ctrl-D to end
 --from-file
 Path to a file whose contents you wish to send. Note that in this case the file contents
 are sent as is, not interpreted for escapes.
+
+When controlling kitty over a socket with :option:`kitty @ --to`, the contents of
+a file or of :italic:`stdin`, when it is not a terminal, are sent as raw bytes in
+large chunks, with flow control, so that even very large amounts of data can be
+sent quickly without kitty running out of memory.
 ''',
     no_response=True,
     argspec='[TEXT TO SEND]'
@@ -143,6 +209,11 @@ are sent as is, not interpreted for escapes.
 def cmd_send_text(global_opts, opts, args):
     limit = 1024
     ret = {'match': opts.match, 'is_binary': False, 'match_tab': opts.match_tab}
+    # Bulk transfers need a connection of their own, so they are not used for
+    # send-text commands in a batch
+    bulk_allowed = global_opts.to and not getattr(global_opts, 'in_batch', False)
+    if bulk_allowed and not args and (opts.from_file or (opts.stdin and not sys.stdin.isatty())):
+        return bulk_send_text(ret, opts)
 
     def pipe():
         ret['is_binary'] = True
@@ -204,22 +275,61 @@ def cmd_send_text(global_opts, opts, args):
     return chain()
 
 
+def bulk_send_text(ret, opts):
+    files = []
+    if opts.stdin:
+        files.append(sys.stdin.buffer)
+    if opts.from_file:
+        files.append(open(opts.from_file, 'rb'))
+    ret['is_binary'] = True
+
+    def read(n):
+        while files:
+            data = files[0].read(n)
+            if data:
+                return data
+            f = files.pop(0)
+            if f is not sys.stdin.buffer:
+                f.close()
+        return b''
+    return BulkPayload(ret, read)
+
+
 def send_text(boss, window, payload):
     windows = [boss.active_window]
-    match = payload['match']
-    if match:
-        windows = tuple(boss.match_windows(match))
-    if payload['match_tab']:
-        windows = []
-        tabs = tuple(boss.match_tabs(payload['match_tab']))
-        if not tabs:
-            raise MatchError(payload['match_tab'], 'tabs')
-        for tab in tabs:
-            windows += tuple(tab)
-    data = payload['text'].encode('utf-8') if payload['is_binary'] else parse_send_text_bytes(payload['text'])
+    window_ids = payload.get('window_ids')
+    if window_ids is not None:
+        windows = [boss.window_id_map.get(window_id) for window_id in window_ids]
+    else:
+        match = payload['match']
+        if match:
+            windows = tuple(boss.match_windows(match))
+        if payload['match_tab']:
+            windows = []
+            tabs = tuple(boss.match_tabs(payload['match_tab']))
+            if not tabs:
+                raise MatchError(payload['match_tab'], 'tabs')
+            for tab in tabs:
+                windows += tuple(tab)
+    if 'data' in payload:
+        from base64 import standard_b64decode
+        data = standard_b64decode(payload['data'])
+    else:
+        # Imported here, not at the top, so that kitty @ starts quickly
+        from .config import parse_send_text_bytes
+        data = payload['text'].encode('utf-8') if payload['is_binary'] else parse_send_text_bytes(payload['text'])
     for window in windows:
         if window is not None:
             window.write_to_child(data)
+    if payload.get('bulk'):
+        # Report the bytes still waiting to be written to the slowest window,
+        # for flow control, and the matched windows so that they need not be
+        # matched again for every chunk
+        windows = [w for w in windows if w is not None]
+        pending = (boss.child_monitor.pending_write_size(w.id) for w in windows)
+        return json.dumps({
+            'pending': max((x for x in pending if x is not None), default=0),
+            'window_ids': [w.id for w in windows]})
 # }}}
 
 
@@ -516,6 +626,8 @@ def cmd_new_window(global_opts, opts, args):
 
 
 def new_window(boss, window, payload):
+    from .fast_data_types import focus_os_window
+    from .tabs import SpecialWindow
     w = SpecialWindow(cmd=payload['args'] or None, override_title=payload['title'], cwd=payload['cwd'])
     old_window = boss.active_window
     if payload['new_tab']:
@@ -572,6 +684,7 @@ def cmd_focus_window(global_opts, opts, args):
 
 
 def focus_window(boss, window, payload):
+    from .fast_data_types import focus_os_window
     windows = [window or boss.active_window]
     match = payload['match']
     if match:
@@ -639,24 +752,86 @@ getting the current selection, the result is always plain text.
 --self
 type=bool-set
 If specified get text from the window this command is run in, rather than the active window.
+
+
+--line-range
+Only get the specified range of lines, as :italic:`START:STOP`. Lines are numbered
+from zero, starting at the top of the scrollback when the extent is :italic:`all`,
+and the line STOP is not included. Negative numbers count from the bottom and either
+number can be omitted, for example, :italic:`-100:` gets the last hundred lines.
+
+
+--chunk-size
+type=int
+default=0
+Get the text in chunks of at most this many lines, printing each chunk as soon as it
+is received. Use this when getting large amounts of text, such as a big
+scrollback, to keep kitty responsive. The default of zero means get all text in one go.
+
+
+--since
+Get only the lines output since the specified cursor, which is a number returned by a
+previous call. Use zero to start with all the lines in the scrollback. The result is
+JSON containing the text, the cursor to use for the next call and the number of lines
+that were lost because they were removed from the scrollback before they could be
+read. Lines are returned only once they are complete, that is, when the terminal
+cursor has moved past them. This is useful for tailing the output of a program
+without fetching the whole scrollback every time.
 ''',
     argspec=''
 )
 def cmd_get_text(global_opts, opts, args):
-    return {'match': opts.match, 'extent': opts.extent, 'ansi': opts.ansi, 'self': opts.self}
+    line_range = None
+    if opts.line_range:
+        try:
+            line_range = [int(x) if x.strip() else None for x in opts.line_range.split(':', 1)]
+            if len(line_range) != 2:
+                raise ValueError(opts.line_range)
+        except ValueError:
+            raise SystemExit('{} is not a valid line range'.format(opts.line_range))
+    since = None
+    if opts.since:
+        try:
+            since = int(opts.since)
+        except ValueError:
+            raise SystemExit('{} is not a valid cursor'.format(opts.since))
+    return {
+        'match': opts.match, 'extent': opts.extent, 'ansi': opts.ansi, 'self': opts.self,
+        'line_range': line_range, 'chunk_size': max(0, opts.chunk_size), 'since': since
+    }
 
 
 def get_text(boss, window, payload):
-    match = payload['match']
-    if match:
-        windows = tuple(boss.match_windows(match))
-        if not windows:
-            raise MatchError(match)
+    continuation = payload.get('continuation')
+    if continuation is not None:
+        window_id, start, stop = continuation
+        window = boss.window_id_map.get(window_id)
+        if window is None:
+            raise MatchError('id:{}'.format(window_id))
+        windows = [window]
     else:
-        windows = [window if window and payload['self'] else boss.active_window]
+        match = payload['match']
+        if match:
+            windows = tuple(boss.match_windows(match))
+            if not windows:
+                raise MatchError(match)
+        else:
+            windows = [window if window and payload['self'] else boss.active_window]
+        start, stop = payload.get('line_range') or (None, None)
     window = windows[0]
-    if payload['extent'] == 'selection':
+    chunk_size = payload.get('chunk_size')
+    if payload.get('since') is not None:
+        ans = DeferredResponse(window.text_since(payload['since'], as_ansi=bool(payload['ansi'])), json.dumps)
+    elif payload['extent'] == 'selection':
         ans = window.text_for_selection()
+    elif chunk_size or payload.get('line_range'):
+        ans, next_line = window.as_text_chunk(
+            start or 0, stop, max_lines=chunk_size or None,
+            as_ansi=bool(payload['ansi']), add_history=payload['extent'] == 'all')
+        if continuation is None and ans.startswith('\n'):
+            ans = ans[1:]  # the separator from the line before the range
+        if next_line is not None:
+            ans = ChunkedResponse(ans, [window.id, next_line, stop])
     else:
         ans = window.as_text(as_ansi=bool(payload['ansi']), add_history=payload['extent'] == 'all')
     return ans
@@ -690,6 +865,7 @@ this option, any color arguments are ignored and --configured and --all are impl
     argspec='COLOR_OR_FILE ...'
 )
 def cmd_set_colors(global_opts, opts, args):
+    from .config import parse_config
     from .rgb import color_as_int, Color
     colors, cursor_text_color = {}, False
     if not opts.reset:
@@ -814,6 +990,27 @@ def set_background_opacity(boss, window, payload):
 # }}}
 
 
+# load_config {{{
+@cmd(
+    'Reload the config file',
+    'Reload the kitty configuration, applying the changed options to all existing'
+    ' windows, without restarting. By default, the config files {appname} was started'
+    ' with are re-read. Alternately, the paths to one or more config files can be specified.'
+    ' Options specified on the command line with :option:`kitty --override` are re-applied.'
+    ' Options that are only used when creating windows, such as :opt:`scrollback_lines`,'
+    ' apply only to newly created windows. Prints the names of the options that were changed.'.format(appname=appname),
+    argspec='[CONFIG_FILE ...]'
+)
+def cmd_load_config(global_opts, opts, args):
+    return {'paths': [os.path.abspath(os.path.expanduser(x)) for x in args]}
+
+
+def load_config(boss, window, payload):
+    changed = boss.load_config_file(*payload['paths'])
+    return '\n'.join(sorted(changed))
+# }}}
+
+
 # kitten {{{
 @cmd(
     'Run a kitten',
@@ -844,6 +1041,147 @@ def kitten(boss, window, payload):
 # }}}
 
 
+# subscribe {{{
+@cmd(
+    'Subscribe to events',
+    'Print events about windows and tabs as they happen, one JSON object per line,'
+    ' until interrupted. Every event has a :italic:`type`, which is one of:'
+    ' {events}, and the ids of the window and/or tab it refers to. This is much'
+    ' cheaper than repeatedly polling the :italic:`ls` command. Only works when'
+    ' talking to {appname} over a socket, see :option:`kitty @ --to`.'.format(
+        appname=appname, events=', '.join(EVENT_TYPES)),
+    options_spec='''\
+--events -e
+A comma separated list of the types of events to subscribe to. By default,
+all events are reported.
+''',
+    argspec='',
+    streams_response=True
+)
+def cmd_subscribe(global_opts, opts, args):
+    events = [x.strip() for x in (opts.events or '').split(',') if x.strip()]
+    for e in events:
+        if e not in EVENT_TYPES:
+            raise SystemExit('{} is not a known event type'.format(e))
+    return {'events': events}
+
+
+def subscribe(boss, window, payload):
+    peer = boss.current_remote_peer
+    if peer is None:
+        raise SubscriptionError('Subscribing to events only works over the socket specified by --listen-on')
+    if peer.peer_id in boss.event_subscriptions:
+        raise SubscriptionError('This connection is already subscribed to events')
+    boss.subscribe_to_events(peer, payload['events'])
+# }}}
+
+
+# batch {{{
+@cmd(
+    'Run many commands at once',
+    'Run many remote control commands in a single request. The commands are'
+    ' specified as a JSON list, either as an argument, in a file or on STDIN. Every'
+    ' item in the list is a command line for a single command, either as a list of'
+    ' arguments or as a string, for example:\n'
+    ':italic:`kitty @ batch \'[["new-window", "--title", "Email", "mutt"], "goto-layout tall"]\'`\n\n'
+    'All commands are run in a single iteration of the {appname} event loop and'
+    ' windows, tabs and tab bars that are changed by them are laid out only once, at the end.'
+    ' The output is a JSON list with the response for every command, in order.'
+    ' The response for commands that do not produce a response is null.'.format(appname=appname),
+    options_spec='''\
+--stdin
+type=bool-set
+Read the list of commands from :italic:`stdin`.
+
+
+--from-file
+Path to a file containing the list of commands.
+
+
+--stop-on-error
+type=bool-set
+Do not run any more commands after a command fails.
+''',
+    argspec='[COMMANDS_AS_JSON]'
+)
+def cmd_batch(global_opts, opts, args):
+    import shlex
+    import types
+    if opts.stdin:
+        raw = sys.stdin.read()
+    elif opts.from_file:
+        with open(opts.from_file, encoding='utf-8') as f:
+            raw = f.read()
+    else:
+        raw = ' '.join(args)
+    try:
+        cmdlines = json.loads(raw)
+    except ValueError as err:
+        raise SystemExit('The list of commands is not valid JSON: {}'.format(err))
+    if not isinstance(cmdlines, list):
+        raise SystemExit('The commands must be specified as a JSON list')
+    commands = []
+    global_opts.in_batch = True
+    try:
+        for cmdline in cmdlines:
+            if isinstance(cmdline, str):
+                cmdline = shlex.split(cmdline)
+            if not cmdline:
+                continue
+            try:
+                func = cmap[cmdline[0]]
+            except KeyError:
+                raise SystemExit('{} is not a known command'.format(cmdline[0]))
+            if func is cmd_batch:
+                raise SystemExit('batch commands cannot be nested')
+            global_opts.no_command_response = None
+            sub_opts, items = parse_subcommand_cli(func, cmdline)
+            payload = func(global_opts, sub_opts, items)
+            no_response = func.no_response if global_opts.no_command_response is None else global_opts.no_command_response
+            payloads = [dict(p) for p in payload] if isinstance(payload, types.GeneratorType) else [payload]
+            for payload in payloads:
+                sub = {'cmd': func.name, 'no_response': no_response}
+                if payload is not None:
+                    sub['payload'] = payload
+                commands.append(sub)
+    finally:
+        global_opts.no_command_response = None
+        global_opts.in_batch = False
+    return {'commands': commands, 'stop_on_error': opts.stop_on_error}
+
+
+def batch(boss, window, payload):
+    from .remote_control import handle_cmd
+    from .tabs import deferred_relayouts
+    responses = []
+    with deferred_relayouts:
+        for sub in payload['commands']:
+            sub = dict(sub, version=version)
+            try:
+                response = handle_cmd(boss, window, sub, allow_deferred=True)
+            except Exception as err:
+                if sub['no_response']:
+                    response = None
+                else:
+                    import traceback
+                    response = {'ok': False, 'error': str(err)}
+                    if not getattr(err, 'hide_traceback', False):
+                        response['tb'] = traceback.format_exc()
+            responses.append(response)
+            if payload['stop_on_error'] and response is not None and not response['ok']:
+                break
+    return DeferredResponse(responses, encode_batch_responses)
+
+
+def encode_batch_responses(responses):
+    for response in responses:
+        data = response and response.get('data')
+        if isinstance(data, DeferredResponse):
+            response['data'] = data.encode(data.snapshot)
+    return json.dumps(responses, indent=2)
+# }}}
+
+
 def cli_params_for(func):
     return (func.options_spec or '\n').format, func.argspec, func.desc, '{} @ {}'.format(appname, func.name)
 
@@ -2,15 +2,16 @@
 # vim:fileencoding=utf-8
 # License: GPLv3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
+import json
 import os
 import shlex
 import sys
 
-from kittens.runner import get_kitten_cli_docs, all_kitten_names
+from .constants import base, cache_dir, str_version
 
-from .cli import options_for_completion, parse_option_spec
-from .cmds import cmap
-from .shell import options_for_cmd
+# The option specs of kitty, the remote control commands and the kittens are
+# only needed to build the completion table, they are imported lazily so that
+# completing does not pay for importing them, see completion_table()
 
 parsers, serializers = {}, {}
 
@@ -144,8 +145,86 @@ def fish_output_serializer(ans):
     return '\n'.join(lines)
 
 
+# Completion table {{{
+
+def table_signature():
+    ''' The mtimes of the modules that define the options that are completed '''
+    import glob
+    ans = [str_version]
+    kittens_dir = os.path.join(os.path.dirname(base), 'kittens')
+    paths = [os.path.join(base, x + '.py') for x in ('cli', 'cmds', 'config_data', 'shell')]
+    paths += sorted(glob.glob(os.path.join(kittens_dir, '*', 'main.py')))
+    for path in paths:
+        try:
+            ans.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            ans.append((path, None))
+    return ans
+
+
+def option_for_table(opt):
+    return {'aliases': sorted(opt['aliases']), 'help': opt['help'], 'dest': opt['dest'], 'type': opt.get('type', '')}
+
+
+def options_for_table(seq):
+    return [option_for_table(opt) for opt in seq if not isinstance(opt, str)]
+
+
+def build_completion_table():
+    from kittens.runner import all_kitten_names, get_kitten_cli_docs
+    from .cli import options_for_completion, parse_option_spec
+    from .cmds import cmap
+    from .config import option_names_for_completion
+    from .shell import options_for_cmd
+    kittens = {}
+    for kitten in sorted(all_kitten_names()):
+        try:
+            cd = get_kitten_cli_docs(kitten)
+        except SystemExit:
+            cd = None
+        kittens[kitten] = None if cd is None else options_for_table(parse_option_spec(cd['options']())[0])
+    return {
+        'kitty_options': options_for_table(options_for_completion()),
+        'remote_commands': {c: options_for_table(options_for_cmd(c)[1].values()) for c in cmap},
+        'kittens': kittens,
+        'config_directives': sorted(set(option_names_for_completion())),
+    }
+
+
+def completion_table():
+    '''
+    Everything needed for completion that does not depend on the words being
+    completed. It is persisted in the cache directory and rebuilt if
+    table_signature() changes.
+    '''
+    ans = getattr(completion_table, 'ans', None)
+    if ans is None:
+        path = os.path.join(cache_dir(), 'completion-table.json')
+        signature = json.loads(json.dumps(table_signature()))
+        try:
+            with open(path, 'rb') as f:
+                ans = json.loads(f.read().decode('utf-8'))
+        except Exception:
+            pass
+        if not isinstance(ans, dict) or ans.get('signature') != signature:
+            ans = build_completion_table()
+            ans['signature'] = signature
+            from .config import atomic_save
+            try:
+                atomic_save(json.dumps(ans).encode('utf-8'), path)
+            except OSError:
+                pass
+        completion_table.ans = ans
+    return ans
+
+
+def alias_map_for(options):
+    return {alias: opt for opt in options for alias in opt['aliases']}
+# }}}
+
+
 def completions_for_first_word(ans, prefix, entry_points, namespaced_entry_points):
-    cmds = ['@' + c for c in cmap]
+    cmds = ['@' + c for c in completion_table()['remote_commands']]
     ans.match_groups['Entry points'] = {
         k: None for k in
         list(entry_points) + cmds + ['+' + k for k in namespaced_entry_points]
@@ -155,9 +234,7 @@ def completions_for_first_word(ans, prefix, entry_points, namespaced_entry_point
 
 def kitty_cli_opts(ans, prefix=None):
     matches = {}
-    for opt in options_for_completion():
-        if isinstance(opt, str):
-            continue
+    for opt in completion_table()['kitty_options']:
         aliases = frozenset(x for x in opt['aliases'] if x.startswith(prefix)) if prefix else opt['aliases']
         for alias in aliases:
             matches[alias] = opt['help'].strip()
@@ -167,9 +244,8 @@ def kitty_cli_opts(ans, prefix=None):
 def complete_kitty_cli_arg(ans, opt, prefix):
     prefix = prefix or ''
     if opt and opt['dest'] == 'override':
-        from kitty.config import option_names_for_completion
         k = 'Config directives'
-        ans.match_groups[k] = {k+'=': None for k in option_names_for_completion() if k.startswith(prefix)}
+        ans.match_groups[k] = {k+'=': None for k in completion_table()['config_directives'] if k.startswith(prefix)}
         ans.no_space_groups.add(k)
 
 
@@ -209,16 +285,11 @@ def complete_alias_map(ans, words, new_word, option_map, complete_args=None):
 
 
 def complete_cli(ans, words, new_word, seq, complete_args=lambda *a: None):
-    option_map = {}
-    for opt in seq:
-        if not isinstance(opt, str):
-            for alias in opt['aliases']:
-                option_map[alias] = opt
-    complete_alias_map(ans, words, new_word, option_map, complete_args)
+    complete_alias_map(ans, words, new_word, alias_map_for(seq), complete_args)
 
 
 def complete_remote_command(ans, cmd_name, words, new_word):
-    aliases, alias_map = options_for_cmd(cmd_name)
+    alias_map = alias_map_for(completion_table()['remote_commands'].get(cmd_name) or ())
     if not alias_map:
         return
     complete_alias_map(ans, words, new_word, alias_map)
@@ -290,20 +361,10 @@ def complete_diff_args(ans, opt, prefix):
 
 
 def complete_kitten(ans, kitten, words, new_word):
-    try:
-        cd = get_kitten_cli_docs(kitten)
-    except SystemExit:
-        cd = None
-    if cd is None:
+    options = completion_table()['kittens'].get(kitten)
+    if options is None:
         return
-    options = cd['options']()
-    seq = parse_option_spec(options)[0]
-    option_map = {}
-    for opt in seq:
-        if not isinstance(opt, str):
-            for alias in opt['aliases']:
-                option_map[alias] = opt
-    complete_alias_map(ans, words, new_word, option_map, {
+    complete_alias_map(ans, words, new_word, alias_map_for(options), {
         'icat': complete_icat_args,
         'diff': complete_diff_args,
     }.get(kitten))
@@ -322,14 +383,14 @@ def find_completions(words, new_word, entry_points, namespaced_entry_points):
     if words[0] == '@':
         if len(words) == 1 or (len(words) == 2 and not new_word):
             prefix = words[1] if len(words) > 1 else ''
-            ans.match_groups['Remote control commands'] = {c: None for c in cmap if c.startswith(prefix)}
+            ans.match_groups['Remote control commands'] = {c: None for c in completion_table()['remote_commands'] if c.startswith(prefix)}
         else:
             complete_remote_command(ans, words[1], words[2:], new_word)
         return ans
     if words[0].startswith('@'):
         if len(words) == 1 and not new_word:
             prefix = words[0]
-            ans.match_groups['Remote control commands'] = {'@' + c: None for c in cmap if c.startswith(prefix)}
+            ans.match_groups['Remote control commands'] = {'@' + c: None for c in completion_table()['remote_commands'] if c.startswith(prefix)}
         else:
             complete_remote_command(ans, words[0][1:], words[1:], new_word)
     if words[0] == '+':
@@ -339,7 +400,7 @@ def find_completions(words, new_word, entry_points, namespaced_entry_points):
         else:
             if words[1] == 'kitten':
                 if len(words) == 2 or (len(words) == 3 and not new_word):
-                    ans.match_groups['Kittens'] = dict.fromkeys(k for k in all_kitten_names() if k.startswith('' if len(words) == 2 else words[2]))
+                    ans.match_groups['Kittens'] = dict.fromkeys(k for k in completion_table()['kittens'] if k.startswith('' if len(words) == 2 else words[2]))
                 else:
                     complete_kitten(ans, words[2], words[3:], new_word)
         return ans
@@ -347,18 +408,18 @@ def find_completions(words, new_word, entry_points, namespaced_entry_points):
         if len(words) == 1:
             if new_word:
                 if words[0] == '+kitten':
-                    ans.match_groups['Kittens'] = dict.fromkeys(all_kitten_names())
+                    ans.match_groups['Kittens'] = dict.fromkeys(completion_table()['kittens'])
             else:
                 prefix = words[0]
                 ans.match_groups['Entry points'] = {c: None for c in namespaced_entry_points if c.startswith(prefix)}
         else:
             if len(words) == 2 and not new_word:
-                ans.match_groups['Kittens'] = dict.fromkeys(k for k in all_kitten_names() if k.startswith(words[1]))
+                ans.match_groups['Kittens'] = dict.fromkeys(k for k in completion_table()['kittens'] if k.startswith(words[1]))
             else:
                 if words[0] == '+kitten':
                     complete_kitten(ans, words[1], words[2:], new_word)
     else:
-        complete_cli(ans, words, new_word, options_for_completion(), complete_kitty_cli_arg)
+        complete_cli(ans, words, new_word, completion_table()['kitty_options'], complete_kitty_cli_arg)
 
     return ans
 
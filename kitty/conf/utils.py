@@ -55,6 +55,26 @@ def choices(*choices):
     return choice
 
 
+def open_config_file(path):
+    '''
+    Open a config file for reading. If open_config_file.files_read is a
+    list, the path and the (mtime, size) of the file, or None if it does not
+    exist, are appended to it, so that caches of parsed config can be
+    validated.
+    '''
+    files_read = getattr(open_config_file, 'files_read', None)
+    try:
+        f = open(path, encoding='utf-8', errors='replace')
+    except FileNotFoundError:
+        if files_read is not None:
+            files_read.append((path, None))
+        raise
+    if files_read is not None:
+        st = os.fstat(f.fileno())
+        files_read.append((path, (st.st_mtime_ns, st.st_size)))
+    return f
+
+
 def parse_line(line, type_map, special_handling, ans, all_keys, base_path_for_includes):
     line = line.strip()
     if not line or line.startswith('#'):
@@ -69,7 +89,7 @@ def parse_line(line, type_map, special_handling, ans, all_keys, base_path_for_in
             if not os.path.isabs(val):
                 val = os.path.join(base_path_for_includes, val)
             try:
-                with open(val, encoding='utf-8', errors='replace') as include:
+                with open_config_file(val) as include:
                     _parse(include, type_map, special_handling, ans, all_keys)
             except FileNotFoundError:
                 log_error('Could not find included config file: {}, ignoring'.format(val))
@@ -164,7 +184,7 @@ def load_config(Options, defaults, parse_config, merge_configs, *paths, override
         if not path:
             continue
         try:
-            f = open(path, encoding='utf-8', errors='replace')
+            f = open_config_file(path)
         except FileNotFoundError:
             continue
         with f:
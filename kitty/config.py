@@ -13,10 +13,11 @@ from . import fast_data_types as defines
 from .conf.definition import as_conf_file, config_lines
 from .conf.utils import (
     init_config, key_func, load_config as _load_config, merge_dicts,
-    parse_config_base, python_string, to_bool, to_cmdline
+    open_config_file, parse_config_base, python_string, to_bool, to_cmdline
 )
 from .config_data import all_options, parse_mods, type_map
-from .constants import cache_dir, defconf, is_macos
+from .constants import cache_dir, defconf, is_macos, str_version
+from .rgb import Color
 from .utils import log_error
 
 named_keys = {
@@ -61,7 +62,8 @@ func_with_args, args_funcs = key_func()
 
 @func_with_args(
     'pass_selection_to_program', 'new_window', 'new_tab', 'new_os_window',
-    'new_window_with_cwd', 'new_tab_with_cwd', 'new_os_window_with_cwd'
+    'new_window_with_cwd', 'new_tab_with_cwd', 'new_os_window_with_cwd',
+    'load_config_file'
     )
 def shlex_parse(func, rest):
     return func, to_cmdline(rest)
@@ -232,6 +234,11 @@ class KeyDefinition:
         self.trigger = mods, is_native, key
         self.rest = rest
 
+    def __eq__(self, other):
+        # Compared when the config is reloaded, to find the changed options
+        return isinstance(other, KeyDefinition) and (self.is_sequence, self.action, self.trigger, self.rest) == (
+            other.is_sequence, other.action, other.trigger, other.rest)
+
     def resolve(self, kitty_mod):
         self.trigger = defines.resolve_key_mods(kitty_mod, self.trigger[0]), self.trigger[1], self.trigger[2]
         self.rest = tuple((defines.resolve_key_mods(kitty_mod, mods), is_native, key) for mods, is_native, key in self.rest)
@@ -586,9 +593,175 @@ def finalize_keys(opts):
     opts.sequence_map = sequence_map
 
 
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return
+    return st.st_mtime_ns, st.st_size
+
+
+def env_vars_used(paths, overrides):
+    ' The names of the environment variables the config could depend on '
+    pat = re.compile(r'\$\{?([a-zA-Z_][a-zA-Z0-9_]*)')
+    ans = {'HOME', 'KITTY_CONFIG_DIRECTORY', 'XDG_CONFIG_HOME'}
+    texts = list(overrides)
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                texts.append(f.read())
+        except EnvironmentError:
+            pass
+    for text in texts:
+        ans |= set(pat.findall(text))
+    return sorted(ans)
+
+
+def options_definitions_signature():
+    ''' Identifies the code that defines the options, so that cached options
+    are not used after it changes in a source checkout '''
+    from . import config_data
+    ans = [os.path.dirname(os.path.abspath(__file__))]
+    for path in (__file__, config_data.__file__):
+        try:
+            st = os.stat(path)
+        except OSError:
+            ans.append(None)
+        else:
+            ans.append((st.st_mtime_ns, st.st_size))
+    return ans
+
+
+# The types of option values that are stored in the options cache as JSON
+# objects, other than dict and KeyDefinition
+cached_value_types = {cls.__name__: cls for cls in (tuple, set, frozenset, Color, KeyAction)}
+
+
+def option_value_as_json(x):
+    ''' Convert an option value to a value that can be serialized as JSON.
+    Values other than lists, strings, numbers, booleans and None become
+    objects whose only key is the name of their type. '''
+    if x is None or isinstance(x, (bool, int, float, str)):
+        return x
+    if isinstance(x, list):
+        return list(map(option_value_as_json, x))
+    if isinstance(x, dict):
+        return {'dict': [[option_value_as_json(k), option_value_as_json(v)] for k, v in x.items()]}
+    if isinstance(x, bytes):
+        return {'bytes': x.decode('latin-1')}
+    if isinstance(x, KeyDefinition):
+        return {'KeyDefinition': [x.is_sequence, option_value_as_json(x.action), option_value_as_json(x.trigger), option_value_as_json(x.rest)]}
+    name = type(x).__name__
+    if cached_value_types.get(name) is not type(x):
+        raise TypeError('Cannot cache option values of type: {}'.format(name))
+    return {name: list(map(option_value_as_json, x))}
+
+
+def option_value_from_json(x):
+    if isinstance(x, list):
+        return list(map(option_value_from_json, x))
+    if not isinstance(x, dict):
+        return x
+    (name, val), = x.items()
+    if name == 'dict':
+        return {option_value_from_json(k): option_value_from_json(v) for k, v in val}
+    if name == 'bytes':
+        return val.encode('latin-1')
+    if name == 'KeyDefinition':
+        is_sequence, action, trigger, rest = map(option_value_from_json, val)
+        return KeyDefinition(is_sequence, action, *trigger, rest=rest)
+    cls = cached_value_types.get(name)
+    if cls is None:
+        raise ValueError('Unknown type of cached option value: {}'.format(name))
+    vals = map(option_value_from_json, val)
+    return cls(*vals) if hasattr(cls, '_fields') else cls(vals)
+
+
+class OptionsCache:
+
+    '''
+    Cache the result of parsing the config files, including the finalized
+    keymaps, in cache_dir(). The cache is valid as long as the mtimes and
+    sizes of every config file that was read, including included files, and
+    the values of the environment variables the config uses are unchanged.
+    Caches are separate for every version of kitty and of the code that
+    defines the options. The options are stored as JSON, see
+    option_value_as_json(), so reading a cache never runs code.
+    '''
+
+    # Validated cache data by path, so that repeated loads in the same process,
+    # such as for --single-instance requests, do not need to read it again.
+    # The options are converted from JSON for every load, so that every load
+    # creates new values, which can be changed without affecting other loads.
+    loaded = {}
+
+    def __init__(self, paths, overrides):
+        from hashlib import sha1
+        self.paths = tuple(os.path.abspath(p) for p in paths if p)
+        self.overrides = overrides
+        key = json.dumps([str_version, options_definitions_signature(), self.paths, overrides])
+        self.path = os.path.join(cache_dir(), 'options-cache', sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self):
+        data = self.loaded.get(self.path)
+        if data is None:
+            try:
+                with open(self.path, 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+            except FileNotFoundError:
+                return
+            except Exception as err:
+                log_error('Failed to load cached options with error: {}'.format(err))
+                return
+        try:
+            for path, sig in data['files']:
+                if file_signature(path) != (None if sig is None else tuple(sig)):
+                    self.loaded.pop(self.path, None)
+                    return
+            for name, val in data['env'].items():
+                if os.environ.get(name) != val:
+                    self.loaded.pop(self.path, None)
+                    return
+            opts = Options({k: option_value_from_json(v) for k, v in data['options'].items()})
+        except Exception as err:
+            self.loaded.pop(self.path, None)
+            log_error('Failed to load cached options with error: {}'.format(err))
+            return
+        self.loaded[self.path] = data
+        return opts
+
+    def save(self, opts, files_read):
+        files = dict(files_read)
+        for path in self.paths:
+            files.setdefault(path, None)  # config files that did not exist
+        env = {name: os.environ.get(name) for name in env_vars_used(files, self.overrides)}
+        try:
+            options = {k: option_value_as_json(v) for k, v in opts._asdict().items()}
+            data = {'files': list(files.items()), 'env': env, 'options': options}
+            raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            # Store the data as it will be read back from disk
+            self.loaded[self.path] = json.loads(raw.decode('utf-8'))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_save(raw, self.path)
+        except Exception as err:
+            log_error('Failed to save cached options with error: {}'.format(err))
+
+
 def load_config(*paths, overrides=None):
-    opts = _load_config(Options, defaults, parse_config, merge_configs, *paths, overrides=overrides)
-    finalize_keys(opts)
+    overrides = None if overrides is None else tuple(overrides)
+    # Parsing is quick when there are no config files, so do not bother caching
+    cache = OptionsCache(paths, overrides or ()) if (
+        overrides or any(p and os.path.exists(p) for p in paths)) else None
+    opts = None if cache is None else cache.load()
+    if opts is None:
+        open_config_file.files_read = files_read = []
+        try:
+            opts = _load_config(Options, defaults, parse_config, merge_configs, *paths, overrides=overrides)
+        finally:
+            del open_config_file.files_read
+        finalize_keys(opts)
+        if cache is not None:
+            cache.save(opts, [(os.path.abspath(p), sig) for p, sig in files_read])
     if opts.background_opacity < 1.0 and opts.macos_titlebar_color:
         log_error('Cannot use both macos_titlebar_color and background_opacity')
         opts.macos_titlebar_color = 0
@@ -720,6 +720,15 @@ Note that setting it to yes means that any background processes still using the
 terminal can fail silently because their stdout/stderr/stdin no longer work.
 '''))
 
+o('child_pool_size', 0, option_type=positive_int, long_text=_('''
+The number of shells to start ahead of time, so that new windows and tabs
+running the shell appear instantly, instead of waiting for the shell to
+read its startup files. Useful if your shell startup files are slow.
+Shells are kept ready for each combination of working directory and
+environment that recently used windows were created with. The
+default of zero disables this.
+'''))
+
 o('allow_remote_control', False, long_text=_('''
 Allow other programs to control kitty. If you turn this on other programs can
 control all aspects of kitty, including sending text to kitty windows,
@@ -1010,6 +1019,12 @@ g('shortcuts.misc')  # {{{
 k('toggle_fullscreen', 'kitty_mod+f11', 'toggle_fullscreen', _('Toggle fullscreen'))
 k('input_unicode_character', 'kitty_mod+u', 'kitten unicode_input', _('Unicode input'))
 k('edit_config_file', 'kitty_mod+f2', 'edit_config_file', _('Edit config file'))
+k('reload_config_file', 'kitty_mod+f5', 'load_config_file', _('Reload config file'), long_text=_('''
+Reload the config file and apply the changed options to all existing windows,
+without restarting kitty. You can also specify the paths of config files to load
+instead, for example: :code:`load_config_file /path/to/alternative/kitty.conf`.
+Options that are only used when creating new windows, such as :opt:`scrollback_lines`,
+only apply to windows created after the reload.'''))
 k('kitty_shell', 'kitty_mod+escape', 'kitty_shell window', _('Open the kitty command shell'), long_text=_('''
 Open the kitty shell in a new window/tab/overlay/os_window to control kitty using commands.'''))
 k('increase_background_opacity', 'kitty_mod+a>m', 'set_background_opacity +0.1', _('Increase background opacity'))
@@ -189,6 +189,7 @@ typedef struct {
     PagerHistoryBuf *pagerhist;
     Line *line;
     index_type start_of_data, count;
+    unsigned long long total_lines_added;
 } HistoryBuf;
 
 typedef struct {
@@ -301,6 +302,7 @@ void wakeup_io_loop(bool);
 void scroll_event(double, double, int);
 void fake_scroll(int, bool);
 void set_special_key_combo(int glfw_key, int mods, bool is_native);
+void clear_special_key_combos(void);
 void on_key_input(int key, int scancode, int action, int mods, const char*, int);
 void request_window_attention(id_type, bool);
 SPRITE_MAP_HANDLE alloc_sprite_map(unsigned int, unsigned int);
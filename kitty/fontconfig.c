@@ -108,6 +108,33 @@ end:
     return ans;
 }
 
+static inline PyObject*
+str_list_as_list(FcStrList *list) {
+    if (list == NULL) return PyErr_NoMemory();
+    PyObject *ans = PyList_New(0);
+    FcChar8 *s;
+    while (ans != NULL && (s = FcStrListNext(list)) != NULL) {
+        PyObject *x = PyUnicode_DecodeFSDefault((const char*)s);
+        if (x == NULL || PyList_Append(ans, x) != 0) Py_CLEAR(ans);
+        Py_XDECREF(x);
+    }
+    FcStrListDone(list);
+    return ans;
+}
+
+static PyObject*
+fc_config_paths(PyObject UNUSED *self, PyObject UNUSED *args) {
+    FcConfig *config = FcConfigGetCurrent();
+    if (config == NULL) { PyErr_SetString(PyExc_ValueError, "Failed to get the current fontconfig configuration"); return NULL; }
+    PyObject *font_dirs = str_list_as_list(FcConfigGetFontDirs(config));
+    if (font_dirs == NULL) return NULL;
+    PyObject *cache_dirs = str_list_as_list(FcConfigGetCacheDirs(config));
+    if (cache_dirs == NULL) { Py_DECREF(font_dirs); return NULL; }
+    PyObject *config_files = str_list_as_list(FcConfigGetConfigFiles(config));
+    if (config_files == NULL) { Py_DECREF(font_dirs); Py_DECREF(cache_dirs); return NULL; }
+    return Py_BuildValue("NNN", font_dirs, cache_dirs, config_files);
+}
+
 static inline PyObject*
 _fc_match(FcPattern *pat) {
     FcPattern *match = NULL;
@@ -223,6 +250,7 @@ end:
 static PyMethodDef module_methods[] = {
     METHODB(fc_list, METH_VARARGS),
     METHODB(fc_match, METH_VARARGS),
+    METHODB(fc_config_paths, METH_NOARGS),
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
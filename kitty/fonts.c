@@ -1081,6 +1081,9 @@ set_font_data(PyObject UNUSED *m, PyObject *args) {
                 &PyTuple_Type, &sm, &global_state.font_sz_in_pts)) return NULL;
     Py_INCREF(box_drawing_function); Py_INCREF(prerender_function); Py_INCREF(descriptor_for_idx);
     free_font_groups();
+    // When reloading fonts, the OS windows must be given new font groups
+    // with os_window_font_size() before they are rendered again
+    for (size_t o = 0; o < global_state.num_os_windows; o++) global_state.os_windows[o].fonts_data = NULL;
     clear_symbol_maps();
     num_symbol_maps = PyTuple_GET_SIZE(sm);
     symbol_maps = calloc(num_symbol_maps, sizeof(SymbolMap));
@@ -2,13 +2,18 @@
 # vim:fileencoding=utf-8
 # License: GPL v3 Copyright: 2016, Kovid Goyal <kovid at kovidgoyal.net>
 
+import json
+import os
 import re
 from functools import lru_cache
+from itertools import chain
 
+from kitty.constants import cache_dir, str_version
 from kitty.fast_data_types import (
     FC_SLANT_ITALIC, FC_SLANT_ROMAN, FC_WEIGHT_BOLD, FC_WEIGHT_REGULAR,
-    fc_list, fc_match,
+    fc_config_paths, fc_list, fc_match,
 )
+from kitty.utils import log_error
 
 attr_map = {(False, False): 'font_family',
             (True, False): 'bold_font',
@@ -30,9 +35,67 @@ def create_font_map(all_fonts):
     return ans
 
 
+def fontconfig_signature():
+    '''
+    The mtimes of all font directories, fontconfig cache directories and
+    fontconfig config files. Installing or removing fonts or changing the
+    fontconfig configuration changes these.
+    '''
+    ans = [str_version]
+    for path in chain(*fc_config_paths()):
+        try:
+            ans.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            ans.append((path, None))
+    return ans
+
+
+def fontconfig_cache(name):
+    '''
+    A cache that is persisted to disk, so that listing and matching fonts
+    can be skipped at startup. It is discarded if fontconfig_signature()
+    changes. Call save_fontconfig_cache() after modifying it.
+    '''
+    caches = fontconfig_cache.caches
+    ans = caches.get(name)
+    if ans is None:
+        signature = getattr(fontconfig_cache, 'signature', None)
+        if signature is None:
+            # round trip through JSON to compare equal to the loaded signature
+            signature = fontconfig_cache.signature = json.loads(json.dumps(fontconfig_signature()))
+        try:
+            with open(os.path.join(cache_dir(), name + '.json'), 'rb') as f:
+                ans = json.loads(f.read().decode('utf-8'))
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            log_error('Failed to load the {} cache with error: {}'.format(name, err))
+        if not isinstance(ans, dict) or ans.get('signature') != signature:
+            ans = {'signature': signature, 'data': {}}
+        caches[name] = ans
+    return ans['data']
+
+
+fontconfig_cache.caches = {}
+
+
+def save_fontconfig_cache(name):
+    from kitty.config import atomic_save
+    try:
+        atomic_save(json.dumps(fontconfig_cache.caches[name]).encode('utf-8'), os.path.join(cache_dir(), name + '.json'))
+    except Exception as err:
+        log_error('Failed to save the {} cache with error: {}'.format(name, err))
+
+
 @lru_cache()
 def all_fonts_map(monospaced=True):
-    return create_font_map(fc_list(monospaced))
+    # Stored separately from the matched fonts as the list of all fonts can be large
+    name = 'fontconfig-{}-fonts'.format('monospaced' if monospaced else 'all')
+    cache = fontconfig_cache(name)
+    if 'fonts' not in cache:
+        cache['fonts'] = fc_list(monospaced)
+        save_fontconfig_cache(name)
+    return create_font_map(cache['fonts'])
 
 
 def list_fonts():
@@ -93,6 +156,16 @@ def resolve_family(f, main_family, bold, italic):
 
 
 def get_font_files(opts):
+    faces = fontconfig_cache('fontconfig-faces')
+    key = json.dumps([getattr(opts, attr) for attr in sorted(attr_map.values())])
+    ans = faces.get(key)
+    if ans is None:
+        ans = faces[key] = find_font_files(opts)
+        save_fontconfig_cache('fontconfig-faces')
+    return ans
+
+
+def find_font_files(opts):
     ans = {}
     for (bold, italic), attr in attr_map.items():
         rf = resolve_family(getattr(opts, attr), opts.font_family, bold, italic)
@@ -202,6 +202,7 @@ historybuf_push(HistoryBuf *self) {
         pagerhist_push(self);
         self->start_of_data = (self->start_of_data + 1) % self->ynum;
     } else self->count++;
+    self->total_lines_added++;
     return idx;
 }
 
@@ -402,6 +403,7 @@ static PyMemberDef members[] = {
     {"xnum", T_UINT, offsetof(HistoryBuf, xnum), READONLY, "xnum"},
     {"ynum", T_UINT, offsetof(HistoryBuf, ynum), READONLY, "ynum"},
     {"count", T_UINT, offsetof(HistoryBuf, count), READONLY, "count"},
+    {"total_lines_added", T_ULONGLONG, offsetof(HistoryBuf, total_lines_added), READONLY, "Total number of lines ever added to this buffer, it is not reset when the buffer is cleared"},
     {NULL}  /* Sentinel */
 };
 
@@ -449,6 +451,7 @@ void historybuf_rewrap(HistoryBuf *self, HistoryBuf *other) {
             memcpy(other->segments[i].line_attrs, self->segments[i].line_attrs, SEGMENT_SIZE * sizeof(line_attrs_type));
         }
         other->count = self->count; other->start_of_data = self->start_of_data;
+        other->total_lines_added = self->total_lines_added;
         return;
     }
     if (other->pagerhist && other->xnum != self->xnum && other->pagerhist->end != other->pagerhist->start)
@@ -459,6 +462,9 @@ void historybuf_rewrap(HistoryBuf *self, HistoryBuf *other) {
         rewrap_inner(self, other, self->count, NULL, &x, &y);
         for (index_type i = 0; i < other->count; i++) *attrptr(other, (other->start_of_data + i) % other->ynum) |= TEXT_DIRTY_MASK;
     }
+    // The number of lines changes when rewrapping, keep the numbering of the
+    // most recent lines stable, so the counter is only approximate across resizes
+    other->total_lines_added = MAX(self->total_lines_added, other->count);
 }
 
 static PyObject*
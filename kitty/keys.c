@@ -49,6 +49,12 @@ set_special_key_combo(int glfw_key, int mods, bool is_native) {
     }
 }
 
+void
+clear_special_key_combos() {
+    memset(needs_special_handling, 0, sizeof(needs_special_handling));
+    native_special_keys_count = 0;
+}
+
 static inline Window*
 active_window() {
     Tab *t = global_state.callback_os_window->tabs + global_state.callback_os_window->active_tab;
@@ -891,4 +891,15 @@ def evict_cached_layouts(tab_id):
     for key in remove:
         del create_layout_object_for.cache[key]
 
+
+def update_spacing_of_cached_layouts(tab_id, margin_width, single_window_margin_width, padding_width, border_width):
+    # Change the spacing of the layouts of a tab in place, so that they keep
+    # the sizes the windows were given
+    cache = create_layout_object_for.cache
+    for key in [key for key in cache if key[2] == tab_id]:
+        layout = cache.pop(key)
+        layout.margin_width, layout.single_window_margin_width = margin_width, single_window_margin_width
+        layout.padding_width, layout.border_width = padding_width, border_width
+        cache[key[:3] + (margin_width, single_window_margin_width, padding_width, border_width) + key[7:]] = layout
+
 # }}}
@@ -93,7 +93,9 @@ void historybuf_clear(HistoryBuf *self);
 #define as_text_generic(args, container, get_line, lines, columns) { \
     PyObject *callback; \
     int as_ansi = 0, insert_wrap_markers = 0; \
-    if (!PyArg_ParseTuple(args, "O|pp", &callback, &as_ansi, &insert_wrap_markers)) return NULL; \
+    unsigned int start_line = 0, stop_line = lines; \
+    if (!PyArg_ParseTuple(args, "O|ppII", &callback, &as_ansi, &insert_wrap_markers, &start_line, &stop_line)) return NULL; \
+    stop_line = MIN(stop_line, (unsigned int)lines); \
     PyObject *ret = NULL, *t = NULL; \
     Py_UCS4 *buf = NULL; \
     PyObject *nl = PyUnicode_FromString("\n"); \
@@ -103,7 +105,7 @@ void historybuf_clear(HistoryBuf *self);
         buf = malloc(sizeof(Py_UCS4) * columns * 100); \
         if (buf == NULL) { PyErr_NoMemory(); goto end; } \
     } \
-    for (index_type y = 0; y < lines; y++) { \
+    for (index_type y = start_line; y < stop_line; y++) { \
         Line *line = get_line(container, y); \
         if (!line->continued && y > 0) { \
             ret = PyObject_CallFunctionObjArgs(callback, nl, NULL); \
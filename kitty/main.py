@@ -6,6 +6,7 @@ import locale
 import os
 import sys
 from contextlib import contextmanager
+from functools import partial
 
 from .borders import load_borders_program
 from .boss import Boss
@@ -17,12 +18,13 @@ from .constants import (
     is_wayland, kitty_exe, logo_data_file
 )
 from .fast_data_types import (
-    GLFW_IBEAM_CURSOR, GLFW_MOD_SUPER, create_os_window, free_font_data,
-    glfw_init, glfw_terminate, load_png_data, set_custom_cursor,
-    set_default_window_icon, set_options
+    GLFW_IBEAM_CURSOR, GLFW_MOD_SUPER, add_timer, create_os_window,
+    free_font_data, glfw_init, glfw_terminate, load_png_data, remove_timer,
+    set_custom_cursor, set_default_window_icon, set_options
 )
 from .fonts.box_drawing import set_scale
 from .fonts.render import set_font_family
+from .trace import mark, save_trace, span, start_tracing, stop_tracing
 from .utils import (
     detach, log_error, single_instance, startup_notification_handler,
     unix_socket_paths
@@ -83,8 +85,9 @@ def talk_to_instance(args):
 
 
 def load_all_shaders(semi_transparent=0):
-    load_shader_programs(semi_transparent)
-    load_borders_program()
+    with span('compile shaders'):
+        load_shader_programs(semi_transparent)
+        load_borders_program()
 
 
 def init_glfw(debug_keyboard=False):
@@ -124,14 +127,17 @@ def _run_app(opts, args):
             set_default_window_icon(f.read(), 256, 256)
     load_shader_programs.use_selection_fg = opts.selection_foreground is not None
     with cached_values_for(run_app.cached_values_name) as cached_values:
-        with startup_notification_handler(extra_callback=run_app.first_window_callback) as pre_show_callback:
+        with startup_notification_handler(extra_callback=run_app.first_window_callback) as pre_show_callback, span('create OS window'):
             window_id = create_os_window(
                     run_app.initial_window_size_func(opts, cached_values),
                     pre_show_callback,
                     appname, args.name or args.cls or appname,
                     args.cls or appname, load_all_shaders)
-        boss = Boss(window_id, opts, args, cached_values, new_os_window_trigger)
-        boss.start()
+        with span('create boss'):
+            boss = Boss(window_id, opts, args, cached_values, new_os_window_trigger)
+            boss.start()
+        if args.trace_startup:
+            add_timer('trace_startup', partial(finish_startup_trace, args.trace_startup), 0)
         try:
             boss.child_monitor.main_loop()
         finally:
@@ -141,13 +147,25 @@ def _run_app(opts, args):
 def run_app(opts, args):
     set_scale(opts.box_drawing_scale)
     set_options(opts, is_wayland, args.debug_gl, args.debug_font_fallback)
-    set_font_family(opts, debug_font_matching=args.debug_font_fallback)
+    with span('set font family'):
+        set_font_family(opts, debug_font_matching=args.debug_font_fallback)
     try:
         _run_app(opts, args)
     finally:
         free_font_data()  # must free font data before glfw/freetype/fontconfig/opengl etc are finalized
 
 
+def finish_startup_trace(path, timer_id):
+    # Timers are dispatched after rendering, so this runs after the first
+    # frame has been drawn
+    remove_timer(timer_id)
+    mark('first main loop iteration')
+    try:
+        save_trace(path)
+    except EnvironmentError as err:
+        log_error('Failed to save the startup trace to {} with error: {}'.format(path, err))
+
+
 run_app.cached_values_name = 'main'
 run_app.first_window_callback = lambda window_handle: None
 run_app.initial_window_size_func = initial_window_size_func
@@ -244,8 +262,13 @@ def _main():
         cwd_ok = False
     if not cwd_ok:
         os.chdir(os.path.expanduser('~'))
-    args, rest = parse_args(args=args)
+    with span('parse command line'):
+        args, rest = parse_args(args=args)
     args.args = rest
+    if args.trace_startup:
+        start_tracing()
+    else:
+        stop_tracing()
     if args.debug_config:
         init_glfw(args.debug_keyboard)  # needed for parsing native keysyms
         create_opts(args, debug_config=True)
@@ -261,8 +284,10 @@ def _main():
         if not is_first:
             talk_to_instance(args)
             return
-    init_glfw(args.debug_keyboard)  # needed for parsing native keysyms
-    opts = create_opts(args)
+    with span('init glfw'):
+        init_glfw(args.debug_keyboard)  # needed for parsing native keysyms
+    with span('load config'):
+        opts = create_opts(args)
     setup_environment(opts, args)
     try:
         with setup_profiling(args):
@@ -2,22 +2,88 @@
 # vim:fileencoding=utf-8
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
+import io
 import json
 import os
 import re
 import sys
 import types
+from collections import namedtuple
 from functools import partial
+from itertools import count
 
 from .cli import emph, parse_args
-from .cmds import cmap, parse_subcommand_cli
+from .cmds import (
+    BulkPayload, ChunkedResponse, DeferredResponse, cmap, parse_subcommand_cli
+)
 from .constants import appname, version
-from .fast_data_types import read_command_response
 from .utils import TTYIO, parse_address_spec
 
 
-def handle_cmd(boss, window, cmd):
-    cmd = json.loads(cmd)
+class RemotePeer:
+
+    ''' A client connected to the remote control socket that sent the command
+    currently being handled '''
+
+    def __init__(self, peer_id):
+        self.peer_id = peer_id
+        self.request_id = None
+        self.keep_request_open = False
+
+
+EventSubscription = namedtuple('EventSubscription', 'peer_id request_id events')
+
+
+def encode_response(response):
+    ' Encode a response as a complete escape code, finishing any deferred response data '
+    data = response.get('data')
+    if isinstance(data, DeferredResponse):
+        response['data'] = data.encode(data.snapshot)
+    return ('\x1bP@kitty-cmd' + json.dumps(response) + '\x1b\\').encode('utf-8')
+
+
+class ResponseWriter:
+
+    '''
+    Encode responses to remote control peers and send them from a worker
+    thread, so that serializing large responses does not hold up the UI.
+    Responses are sent in the order they are queued, so everything sent to
+    peers must go through here. The response objects must not be modified
+    after they are queued. Unless finish is False, sending a response finishes
+    the request. A response of None finishes the request without sending
+    anything.
+    '''
+
+    def __init__(self, send_to_peer):
+        from queue import Queue
+        self.send_to_peer = send_to_peer
+        self.queue = Queue()
+        self.thread = None
+
+    def __call__(self, peer_id, response, finish=True):
+        if self.thread is None:
+            from threading import Thread
+            self.thread = Thread(target=self.run, name='RemoteResponses', daemon=True)
+            self.thread.start()
+        self.queue.put((peer_id, response, finish))
+
+    def run(self):
+        while True:
+            peer_id, response, finish = self.queue.get()
+            if response is None:
+                data = None
+            else:
+                try:
+                    data = encode_response(response)
+                except Exception as err:
+                    import traceback
+                    data = encode_response({
+                        'ok': False, 'error': 'Failed to encode response: {}'.format(err),
+                        'tb': traceback.format_exc(), 'id': response.get('id')})
+            self.send_to_peer(peer_id, data, finish)
+
+
+def handle_cmd(boss, window, cmd, allow_deferred=False):
     v = cmd['version']
     no_response = cmd['no_response']
     if tuple(v)[:2] > version[:2]:
@@ -34,9 +100,15 @@ def handle_cmd(boss, window, cmd):
             return
         raise
     response = {'ok': True}
+    if isinstance(ans, ChunkedResponse):
+        response['continuation'] = ans.continuation
+        ans = ans.data
+    if isinstance(ans, DeferredResponse) and not allow_deferred:
+        ans = ans.encode(ans.snapshot)
     if ans is not None:
         response['data'] = ans
-    if not c.no_response and not no_response:
+    # Commands that normally have no response can still respond to some requests
+    if not no_response and (not c.no_response or ans is not None):
         return response
 
 
@@ -54,6 +126,9 @@ def encode_send(send):
     return b'\x1bP' + send + b'\x1b\\'
 
 
+response_frame = re.compile(br'\x1bP@kitty-cmd([^\x1b]+)\x1b\\')
+
+
 class SocketIO:
 
     def __init__(self, to):
@@ -87,19 +162,97 @@ class SocketIO:
         self.socket.shutdown(socket.SHUT_WR)
 
     def recv(self, timeout):
-        dcs = re.compile(br'\x1bP@kitty-cmd([^\x1b]+)\x1b\\')
         self.socket.settimeout(timeout)
         with self.socket.makefile('rb') as src:
             data = src.read()
-        m = dcs.search(data)
+        m = response_frame.search(data)
         if m is None:
             raise TimeoutError('Timed out while waiting to read cmd response')
         return m.group(1)
 
 
+class Connection:
+
+    '''
+    A long lived connection to a kitty instance listening on a socket. Any
+    number of commands can be sent over a single connection. Every command is
+    tagged with a request id and kitty sends the responses back in the order
+    in which the commands were received, so commands can be pipelined: send
+    many of them and then read the responses.
+    '''
+
+    def __init__(self, to, timeout=10):
+        import socket
+        family, address = parse_address_spec(to)[:2]
+        self.socket = socket.socket(family)
+        self.socket.setblocking(True)
+        self.socket.connect(address)
+        self.timeout = timeout
+        self.buf = b''
+        self.request_ids = count(1)
+        self.pending_responses = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def close(self):
+        import socket
+        if self.socket is not None:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except EnvironmentError:
+                pass
+            self.socket.close()
+            self.socket = None
+
+    def send(self, send):
+        ''' Send the specified command, returning its request id '''
+        send = send.copy()
+        send['id'] = request_id = next(self.request_ids)
+        payload = send.get('payload')
+        if isinstance(payload, types.GeneratorType):
+            # All chunks are sent with the same id, only the commands that
+            # produce a payload generator (send-text) never have a response
+            for chunk in payload:
+                send['payload'] = chunk
+                self.socket.sendall(encode_send(send))
+        else:
+            self.socket.sendall(encode_send(send))
+        return request_id
+
+    def read_response(self):
+        self.socket.settimeout(self.timeout)
+        while True:
+            m = response_frame.search(self.buf)
+            if m is not None:
+                self.buf = self.buf[m.end():]
+                return json.loads(m.group(1).decode('ascii'))
+            data = self.socket.recv(io.DEFAULT_BUFFER_SIZE * 8)
+            if not data:
+                raise ConnectionError('The connection to kitty was closed while waiting for a response')
+            self.buf += data
+
+    def recv(self, request_id):
+        ''' Wait for and return the response to the specified request '''
+        while request_id not in self.pending_responses:
+            response = self.read_response()
+            self.pending_responses[response.get('id')] = response
+        return self.pending_responses.pop(request_id)
+
+    def do_io(self, send, no_response):
+        request_id = self.send(send)
+        if no_response:
+            return {'ok': True}
+        return self.recv(request_id)
+
+
 class RCIO(TTYIO):
 
     def recv(self, timeout):
+        from .fast_data_types import read_command_response
         ans = []
         read_command_response(self.tty_fd, timeout, ans)
         return b''.join(ans)
@@ -127,6 +280,97 @@ def do_io(to, send, no_response):
     return response
 
 
+def fetch_remaining_chunks(to, send, response):
+    ''' Print the chunks of a response that was split into chunks as they
+    arrive, returning the response containing the last chunk '''
+    conn = Connection(to) if to else None
+    try:
+        while response.get('ok') and 'continuation' in response:
+            print(response.get('data', ''), end='', flush=True)
+            send['payload']['continuation'] = response['continuation']
+            response = do_io(to, send, False) if conn is None else conn.do_io(send, False)
+    finally:
+        if conn is not None:
+            conn.close()
+    return response
+
+
+def send_bulk(to, send, bulk):
+    '''
+    Send the data from a BulkPayload in chunks, waiting for kitty to
+    acknowledge them. The chunk size grows while the data is written to the
+    target windows quickly and sending pauses while the windows have too much
+    data waiting to be written to them.
+    '''
+    from base64 import standard_b64encode
+    from time import sleep
+    # Chunks must fit in the maximum message size kitty accepts after base64 encoding
+    min_chunk, max_chunk = 16 * 1024, 512 * 1024
+    low_water, high_water = 1024 * 1024, 8 * 1024 * 1024
+    max_in_flight = 4
+    chunk_size = 64 * 1024
+    send = send.copy()
+    send['no_response'] = False
+    payload = dict(bulk.payload, bulk=True)
+    in_flight = []
+
+    def check(response):
+        if not response.get('ok'):
+            if response.get('tb'):
+                print(response['tb'], file=sys.stderr)
+            raise SystemExit(response['error'])
+        return json.loads(response['data'])
+
+    def send_chunk(data):
+        send['payload'] = dict(payload, data=standard_b64encode(data).decode('ascii'))
+        in_flight.append(conn.send(send))
+
+    def acknowledged():
+        nonlocal chunk_size
+        ack = check(conn.recv(in_flight.pop(0)))
+        # After the first chunk, send directly to the windows it matched
+        payload['window_ids'] = ack['window_ids']
+        pending = ack['pending']
+        if pending > high_water:
+            chunk_size = max(min_chunk, chunk_size // 2)
+            delay = 0.005
+            while pending > low_water:
+                sleep(delay)
+                delay = min(0.05, delay * 2)
+                send_chunk(b'')
+                pending = check(conn.recv(in_flight.pop(0)))['pending']
+        elif pending < low_water:
+            chunk_size = min(max_chunk, chunk_size * 2)
+
+    with Connection(to) as conn:
+        while True:
+            data = bulk.read(chunk_size)
+            if not data:
+                break
+            send_chunk(data)
+            if 'window_ids' not in payload or len(in_flight) >= max_in_flight:
+                acknowledged()
+        while in_flight:
+            acknowledged()
+
+
+def stream_responses(to, send):
+    with Connection(to, timeout=None) as conn:
+        request_id = conn.send(send)
+        while True:
+            try:
+                response = conn.recv(request_id)
+            except ConnectionError:
+                break  # kitty has quit
+            if not response.get('ok'):
+                if response.get('tb'):
+                    print(response['tb'], file=sys.stderr)
+                raise SystemExit(response['error'])
+            data = response.get('data')
+            if data is not None:
+                print(data, flush=True)
+
+
 all_commands = tuple(sorted(cmap))
 cli_msg = (
         'Control {appname} by sending it commands. Set the'
@@ -159,23 +403,36 @@ def main(args):
         raise SystemExit('{} is not a known command. Known commands are: {}'.format(
             emph(cmd), ', '.join(all_commands)))
     opts, items = parse_subcommand_cli(func, items)
+    if not global_opts.to and 'KITTY_LISTEN_ON' in os.environ:
+        global_opts.to = os.environ['KITTY_LISTEN_ON']
     payload = func(global_opts, opts, items)
     send = {
         'cmd': cmd,
         'version': version,
     }
-    if payload is not None:
-        send['payload'] = payload
     if global_opts.no_command_response is not None:
         no_response = global_opts.no_command_response
     else:
         no_response = func.no_response
     send['no_response'] = no_response
-    if not global_opts.to and 'KITTY_LISTEN_ON' in os.environ:
-        global_opts.to = os.environ['KITTY_LISTEN_ON']
+    if isinstance(payload, BulkPayload):
+        send_bulk(global_opts.to, send, payload)
+        return
+    if payload is not None:
+        send['payload'] = payload
+    if func.streams_response:
+        if not global_opts.to:
+            raise SystemExit('The {} command only works when using --to'.format(emph(cmd)))
+        try:
+            stream_responses(global_opts.to, send)
+        except KeyboardInterrupt:
+            pass
+        return
     response = do_io(global_opts.to, send, no_response)
     if no_response:
         return
+    if 'continuation' in response:
+        response = fetch_remaining_chunks(global_opts.to, send, response)
     if not response.get('ok'):
         if response.get('tb'):
             print(response['tb'], file=sys.stderr)
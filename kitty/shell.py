@@ -130,17 +130,23 @@ def print_help(which=None):
         display_subcommand_help(func)
 
 
-def run_cmd(global_opts, cmd, func, opts, items):
-    from .remote_control import do_io
+def run_cmd(global_opts, cmd, func, opts, items, connection=None):
+    from .remote_control import BulkPayload, do_io, send_bulk
     payload = func(global_opts, opts, items)
     send = {
         'cmd': cmd,
         'version': version,
         'no_response': False,
     }
+    if isinstance(payload, BulkPayload):
+        send_bulk(global_opts.to, send, payload)
+        return
     if payload is not None:
         send['payload'] = payload
-    response = do_io(global_opts.to, send, func.no_response)
+    if connection is None:
+        response = do_io(global_opts.to, send, func.no_response)
+    else:
+        response = connection.do_io(send, func.no_response)
     if not response.get('ok'):
         if response.get('tb'):
             print_err(response['tb'])
@@ -150,8 +156,34 @@ def run_cmd(global_opts, cmd, func, opts, items):
         print(response['data'])
 
 
+class PersistentConnection:
+
+    ''' Re-use a single connection to kitty for all commands run in the shell,
+    re-connecting as needed, when kitty is controlled over a socket '''
+
+    def __init__(self, to):
+        self.to = to
+        self.connection = None
+
+    def do_io(self, send, no_response):
+        from .remote_control import Connection
+        if self.connection is None:
+            self.connection = Connection(self.to)
+        try:
+            return self.connection.do_io(send, no_response)
+        except EnvironmentError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
 def real_main(global_opts):
     init_readline(readline)
+    connection = PersistentConnection(global_opts.to) if global_opts.to else None
     print_help_for_seq.allow_pager = False
     print('Welcome to the kitty shell!')
     print('Use {} for assistance or {} to quit'.format(green('help'), green('exit')))
@@ -196,7 +228,7 @@ def real_main(global_opts):
             continue
         else:
             try:
-                run_cmd(global_opts, cmd, func, opts, items)
+                run_cmd(global_opts, cmd, func, opts, items, connection)
             except SystemExit as e:
                 print_err(e)
                 continue
@@ -207,6 +239,8 @@ def real_main(global_opts):
                 print_err('Unhandled error:')
                 traceback.print_exc()
                 continue
+    if connection is not None:
+        connection.close()
 
 
 def main(global_opts):
@@ -101,12 +101,12 @@ add_tab(id_type os_window_id) {
 }
 
 static inline id_type
-add_window(id_type os_window_id, id_type tab_id, PyObject *title) {
+add_window(id_type os_window_id, id_type tab_id, PyObject *title, id_type window_id) {
     WITH_TAB(os_window_id, tab_id);
         ensure_space_for(tab, windows, Window, tab->num_windows + 1, capacity, 1, true);
         make_os_window_context_current(osw);
         memset(tab->windows + tab->num_windows, 0, sizeof(Window));
-        tab->windows[tab->num_windows].id = ++global_state.window_id_counter;
+        tab->windows[tab->num_windows].id = window_id ? window_id : ++global_state.window_id_counter;
         tab->windows[tab->num_windows].visible = true;
         tab->windows[tab->num_windows].title = title;
         tab->windows[tab->num_windows].render_data.vao_idx = create_cell_vao();
@@ -336,6 +336,10 @@ PYWRAP0(next_window_id) {
     return PyLong_FromUnsignedLongLong(global_state.window_id_counter + 1);
 }
 
+PYWRAP0(reserve_window_id) {
+    return PyLong_FromUnsignedLongLong(++global_state.window_id_counter);
+}
+
 PYWRAP1(handle_for_window_id) {
     id_type os_window_id;
     PA("K", &os_window_id);
@@ -409,6 +413,8 @@ PYWRAP1(set_options) {
     OPT(select_by_word_characters_count) = PyUnicode_GET_LENGTH(chars);
     Py_DECREF(chars);
 
+    // set_options() is called again when the config is reloaded
+    clear_special_key_combos();
     GA(keymap); set_special_keys(ret);
     Py_DECREF(ret); if (PyErr_Occurred()) return NULL;
     GA(sequence_map); set_special_keys(ret);
@@ -704,7 +710,7 @@ THREE_ID_OBJ(update_window_title)
 THREE_ID(remove_window)
 PYWRAP1(resolve_key_mods) { int mods; PA("ii", &kitty_mod, &mods); return PyLong_FromLong(resolve_mods(mods)); }
 PYWRAP1(add_tab) { return PyLong_FromUnsignedLongLong(add_tab(PyLong_AsUnsignedLongLong(args))); }
-PYWRAP1(add_window) { PyObject *title; id_type a, b; PA("KKO", &a, &b, &title); return PyLong_FromUnsignedLongLong(add_window(a, b, title)); }
+PYWRAP1(add_window) { PyObject *title; id_type a, b, c = 0; PA("KKO|K", &a, &b, &title, &c); return PyLong_FromUnsignedLongLong(add_window(a, b, title, c)); }
 PYWRAP0(current_os_window) { OSWindow *w = current_os_window(); if (!w) Py_RETURN_NONE; return PyLong_FromUnsignedLongLong(w->id); }
 TWO_ID(remove_tab)
 KI(set_active_tab)
@@ -719,6 +725,7 @@ KK5I(add_borders_rect)
 static PyMethodDef module_methods[] = {
     MW(current_os_window, METH_NOARGS),
     MW(next_window_id, METH_NOARGS),
+    MW(reserve_window_id, METH_NOARGS),
     MW(set_options, METH_VARARGS),
     MW(set_in_sequence_mode, METH_O),
     MW(resolve_key_mods, METH_VARARGS),
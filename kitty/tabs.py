@@ -7,14 +7,17 @@ from collections import deque, namedtuple
 from functools import partial
 
 from .borders import Borders
-from .child import Child
+from .child import Child, child_pool
 from .constants import appname, get_boss, is_macos, is_wayland
 from .fast_data_types import (
     add_tab, glfw_post_empty_event, mark_tab_bar_dirty, next_window_id,
     pt_to_px, remove_tab, remove_window, ring_bell, set_active_tab, swap_tabs,
     x11_window_id
 )
-from .layout import create_layout_object_for, evict_cached_layouts
+from .layout import (
+    create_layout_object_for, evict_cached_layouts,
+    update_spacing_of_cached_layouts
+)
 from .session import resolved_shell
 from .tab_bar import TabBar, TabBarData
 from .utils import log_error
@@ -37,6 +40,61 @@ def add_active_id_to_history(items, item_id, maxlen=64):
         items.popleft()
 
 
+class DeferredRelayouts:
+
+    '''
+    Used as a context manager to collect the relayouts of tabs and the
+    refreshes of tab bars requested while it is active, performing each of
+    them only once when the outermost context exits.
+    '''
+
+    def __init__(self):
+        self.depth = 0
+        self.tabs = {}
+        self.tab_managers = {}
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, *a):
+        self.depth -= 1
+        if self.depth == 0:
+            self.flush()
+
+    def relayout(self, tab, full=True):
+        if self.depth < 1:
+            return False
+        prev = self.tabs.get(tab.id)
+        self.tabs[tab.id] = tab, full or (prev is not None and prev[1])
+        return True
+
+    def mark_tab_bar_dirty(self, tab_manager):
+        if self.depth < 1:
+            return False
+        self.tab_managers[tab_manager.os_window_id] = tab_manager
+        return True
+
+    def discard(self, tab):
+        self.tabs.pop(tab.id, None)
+
+    def flush(self):
+        tabs, tab_managers = self.tabs, self.tab_managers
+        self.tabs, self.tab_managers = {}, {}
+        for tab, full in tabs.values():
+            if full:
+                tab.relayout()
+            else:
+                tab.relayout_borders()
+        for tm in tab_managers.values():
+            tm.mark_tab_bar_dirty()
+        if tabs or tab_managers:
+            glfw_post_empty_event()
+
+
+deferred_relayouts = DeferredRelayouts()
+
+
 class Tab:  # {{{
 
     def __init__(self, tab_manager, session_tab=None, special_window=None, cwd_from=None):
@@ -48,12 +106,10 @@ class Tab:  # {{{
         if not self.id:
             raise Exception('No OS window with id {} found, or tab counter has wrapped'.format(self.os_window_id))
         self.opts, self.args = tab_manager.opts, tab_manager.args
-        self.margin_width, self.padding_width, self.single_window_margin_width = map(
-            lambda x: pt_to_px(getattr(self.opts, x), self.os_window_id), (
-                'window_margin_width', 'window_padding_width', 'single_window_margin_width'))
+        self.set_window_spacing()
         self.name = getattr(session_tab, 'name', '')
+        self.uses_configured_layouts = not getattr(session_tab, 'enabled_layouts', None)
         self.enabled_layouts = [x.lower() for x in getattr(session_tab, 'enabled_layouts', None) or self.opts.enabled_layouts]
-        self.borders = Borders(self.os_window_id, self.id, self.opts, pt_to_px(self.opts.window_border_width, self.os_window_id), self.padding_width)
         self.windows = deque()
         for i, which in enumerate('first second third fourth fifth sixth seventh eighth ninth tenth'.split()):
             setattr(self, which + '_window', partial(self.nth_window, num=i))
@@ -72,6 +128,30 @@ class Tab:  # {{{
             self._set_current_layout(l0)
             self.startup(session_tab)
 
+    def set_window_spacing(self):
+        self.margin_width, self.padding_width, self.single_window_margin_width = map(
+            lambda x: pt_to_px(getattr(self.opts, x), self.os_window_id), (
+                'window_margin_width', 'window_padding_width', 'single_window_margin_width'))
+        self.borders = Borders(self.os_window_id, self.id, self.opts, pt_to_px(self.opts.window_border_width, self.os_window_id), self.padding_width)
+
+    def apply_options(self, changed):
+        ''' Update the tab for the options that were changed by reloading the
+        config. Returns True if the tab has to be laid out again. '''
+        needs_relayout = 'draw_minimal_borders' in changed
+        layout_name = self._current_layout_name
+        if changed & {'window_margin_width', 'window_padding_width', 'single_window_margin_width', 'window_border_width'}:
+            self.set_window_spacing()
+            update_spacing_of_cached_layouts(
+                self.id, self.margin_width, self.single_window_margin_width,
+                self.padding_width, self.borders.border_width)
+            needs_relayout = True
+        if 'enabled_layouts' in changed and self.uses_configured_layouts:
+            self.enabled_layouts = [x.lower() for x in self.opts.enabled_layouts]
+            if layout_name not in self.enabled_layouts:
+                self._set_current_layout(self.enabled_layouts[0])
+                needs_relayout = True
+        return needs_relayout
+
     def _set_current_layout(self, layout_name):
         self._last_used_layout = self._current_layout_name
         self.current_layout = self.create_layout_object(layout_name)
@@ -134,6 +214,7 @@ class Tab:  # {{{
                 tm.mark_tab_bar_dirty()
 
     def on_bell(self, window):
+        get_boss().notify_event_subscribers('bell', window_id=window.id, tab_id=self.id)
         tm = self.tab_manager_ref()
         if tm is not None:
             self.relayout_borders()
@@ -145,11 +226,15 @@ class Tab:  # {{{
                 yield w
 
     def relayout(self):
+        if deferred_relayouts.relayout(self):
+            return
         if self.windows:
             self.active_window_idx = self.current_layout(self.windows, self.active_window_idx)
         self.relayout_borders()
 
     def relayout_borders(self):
+        if deferred_relayouts.relayout(self, full=False):
+            return
         tm = self.tab_manager_ref()
         if tm is not None:
             visible_windows = [w for w in self.windows if w.is_visible_in_layout]
@@ -214,11 +299,14 @@ class Tab:  # {{{
             self.relayout()
 
     def launch_child(self, use_shell=False, cmd=None, stdin=None, cwd_from=None, cwd=None, env=None):
+        # Only plain shells are pooled, see ChildPool
+        poolable = cmd is None and stdin is None and cwd_from is None and not env
         if cmd is None:
             if use_shell:
                 cmd = resolved_shell(self.opts)
             else:
                 cmd = self.args.args or resolved_shell(self.opts)
+            poolable = poolable and cmd == resolved_shell(self.opts)
         fenv = {}
         if env:
             fenv.update(env)
@@ -230,7 +318,13 @@ class Tab:  # {{{
                 import traceback
                 traceback.print_exc()
         ans = Child(cmd, cwd or self.cwd, self.opts, stdin, fenv, cwd_from)
+        if poolable:
+            pooled = child_pool.adopt(ans)
+            if pooled is not None:
+                return pooled
         ans.fork()
+        if poolable:
+            child_pool.add_template(ans)
         return ans
 
     def new_window(self, use_shell=True, cmd=None, stdin=None, override_title=None, cwd_from=None, cwd=None, overlay_for=None, env=None):
@@ -331,9 +425,10 @@ class Tab:  # {{{
     def move_window_backward(self):
         self.move_window(-1)
 
-    def list_windows(self, active_window):
+    def list_windows(self, active_window, fields=None, window_ids=None):
         for w in self:
-            yield w.as_dict(is_focused=w is active_window)
+            if window_ids is None or w.id in window_ids:
+                yield w.as_dict(is_focused=w is active_window, fields=fields)
 
     def matches(self, field, pat):
         if field == 'id':
@@ -352,6 +447,7 @@ class Tab:  # {{{
         return window in self.windows
 
     def destroy(self):
+        deferred_relayouts.discard(self)
         evict_cached_layouts(self.id)
         for w in self.windows:
             w.destroy()
@@ -412,13 +508,18 @@ class TabManager:  # {{{
     def _add_tab(self, tab):
         before = len(self.tabs)
         self.tabs.append(tab)
+        get_boss().tab_id_map[tab.id] = tab
+        get_boss().notify_event_subscribers('tab_created', tab_id=tab.id, os_window_id=self.os_window_id)
         if len(self.tabs) > 1 and before < 2:
             self.tabbar_visibility_changed()
 
     def _remove_tab(self, tab):
+        deferred_relayouts.discard(tab)
         before = len(self.tabs)
         remove_tab(self.os_window_id, tab.id)
         self.tabs.remove(tab)
+        get_boss().tab_id_map.pop(tab.id, None)
+        get_boss().notify_event_subscribers('tab_closed', tab_id=tab.id, os_window_id=self.os_window_id)
         if len(self.tabs) < 2 and before > 1:
             self.tabbar_visibility_changed()
 
@@ -433,12 +534,34 @@ class TabManager:  # {{{
             glfw_post_empty_event()
 
     def mark_tab_bar_dirty(self):
+        if deferred_relayouts.mark_tab_bar_dirty(self):
+            return
         if len(self.tabs) > 1 and not self.tab_bar_hidden:
             mark_tab_bar_dirty(self.os_window_id)
 
     def update_tab_bar_data(self):
         self.tab_bar.update(self.tab_bar_data)
 
+    def apply_options(self, changed):
+        ''' Update the tab bar and tabs for the options that were changed by
+        reloading the config. Only the tabs affected by the changes are laid
+        out again. '''
+        relayout_all = False
+        if any(k == 'bell_on_tab' or k.startswith(('tab_', 'active_tab_', 'inactive_tab_')) for k in changed):
+            self.tab_bar.destroy()
+            self.tab_bar = TabBar(self.os_window_id, self.opts)
+            was_hidden, self.tab_bar_hidden = self.tab_bar_hidden, self.opts.tab_bar_style == 'hidden'
+            # Only the position and visibility of the tab bar change the
+            # space the tabs have
+            relayout_all = was_hidden != self.tab_bar_hidden or 'tab_bar_edge' in changed
+            if not self.tab_bar_hidden:
+                self.tab_bar.layout()
+                self.mark_tab_bar_dirty()
+        with deferred_relayouts:
+            for tab in self.tabs:
+                if tab.apply_options(changed) or relayout_all:
+                    tab.relayout()
+
     def resize(self, only_tabs=False):
         if not only_tabs:
             if not self.tab_bar_hidden:
@@ -482,15 +605,17 @@ class TabManager:  # {{{
     def __len__(self):
         return len(self.tabs)
 
-    def list_tabs(self, active_tab, active_window):
+    def list_tabs(self, active_tab, active_window, fields=None, window_ids=None):
         for tab in self:
-            yield {
-                'id': tab.id,
-                'is_focused': tab is active_tab,
-                'title': tab.name or tab.title,
-                'layout': tab.current_layout.name,
-                'windows': list(tab.list_windows(active_window)),
-            }
+            windows = list(tab.list_windows(active_window, fields, window_ids))
+            if windows or window_ids is None:
+                yield {
+                    'id': tab.id,
+                    'is_focused': tab is active_tab,
+                    'title': tab.name or tab.title,
+                    'layout': tab.current_layout.name,
+                    'windows': windows,
+                }
 
     @property
     def active_tab(self):
@@ -573,7 +698,9 @@ class TabManager:  # {{{
         return self.tab_bar.blank_rects if len(self.tabs) > 1 else ()
 
     def destroy(self):
+        tab_id_map = get_boss().tab_id_map
         for t in self:
+            tab_id_map.pop(t.id, None)
             t.destroy()
         self.tab_bar.destroy()
         del self.tab_bar
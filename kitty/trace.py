@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+'''
+Wall clock tracing of the phases of kitty startup, see --trace-startup. The
+trace is written in the Chrome trace event format, it can be viewed with
+chrome://tracing or https://ui.perfetto.dev
+'''
+
+import builtins
+import json
+import os
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+
+events = []
+enabled = False
+
+
+def trace_startup_requested(argv):
+    return any(a == '--trace-startup' or a.startswith('--trace-startup=') for a in argv)
+
+
+def add_event(name, start, end=None, category='startup', **args):
+    ev = {'name': name, 'cat': category, 'pid': os.getpid(), 'tid': 0, 'ts': start * 1e6}
+    if end is None:
+        ev.update({'ph': 'i', 's': 'p'})
+    else:
+        ev.update({'ph': 'X', 'dur': (end - start) * 1e6})
+    if args:
+        ev['args'] = args
+    events.append(ev)
+
+
+@contextmanager
+def span(name, category='startup', **args):
+    if not enabled:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        add_event(name, start, perf_counter(), category, **args)
+
+
+def mark(name, category='startup'):
+    if enabled:
+        add_event(name, perf_counter(), category=category)
+
+
+def install_import_tracer():
+    original_import = builtins.__import__
+
+    def traced_import(name, globals=None, locals=None, fromlist=(), level=0):
+        full_name = name
+        if level and globals:
+            package = globals.get('__package__') or ''
+            for i in range(level - 1):
+                package = package.rpartition('.')[0]
+            full_name = package + '.' + name if name else package
+        if fromlist and full_name in sys.modules:
+            # from x import y can import the submodule x.y
+            full_name += '.' + ','.join(fromlist)
+        num_loaded = len(sys.modules)
+        start = perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            if len(sys.modules) > num_loaded:
+                add_event('import ' + full_name, start, perf_counter(), 'import')
+
+    builtins.__import__ = traced_import
+    return original_import
+
+
+def start_tracing():
+    global enabled
+    if not enabled:
+        enabled = True
+        start_tracing.original_import = install_import_tracer()
+        mark('tracing started')
+
+
+def stop_tracing():
+    global enabled
+    if enabled:
+        enabled = False
+        builtins.__import__ = start_tracing.original_import
+
+
+def save_trace(path):
+    stop_tracing()
+    data = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
@@ -8,6 +8,7 @@ import sys
 import weakref
 from collections import deque
 from enum import IntEnum
+from functools import partial
 from itertools import chain
 
 from .config import build_ansi_color_table
@@ -140,7 +141,7 @@ class Window:
         self.child_title = self.default_title
         self.title_stack = deque(maxlen=10)
         self.allow_remote_control = child.allow_remote_control
-        self.id = add_window(tab.os_window_id, tab.id, self.title)
+        self.id = add_window(tab.os_window_id, tab.id, self.title, child.window_id)
         if not self.id:
             raise Exception('No tab with id: {} in OS Window: {} was found, or the window counter wrapped'.format(tab.id, tab.os_window_id))
         self.tab_id = tab.id
@@ -165,17 +166,22 @@ class Window:
         return 'Window(title={}, id={}, overlay_for={}, overlay_window_id={})'.format(
                 self.title, self.id, self.overlay_for, self.overlay_window_id)
 
-    def as_dict(self, is_focused=False):
-        return dict(
-            id=self.id,
-            is_focused=is_focused,
-            title=self.override_title or self.title,
-            pid=self.child.pid,
-            cwd=self.child.current_cwd or self.child.cwd,
-            cmdline=self.child.cmdline,
-            env=self.child.environ,
-            foreground_processes=self.child.foreground_processes
+    def as_dict(self, is_focused=False, fields=None):
+        ''' Only the specified fields are computed, if fields is not None. The id is always present. '''
+        getters = dict(
+            is_focused=lambda: is_focused,
+            title=lambda: self.override_title or self.title,
+            pid=lambda: self.child.pid,
+            cwd=lambda: self.child.current_cwd or self.child.cwd,
+            cmdline=lambda: self.child.cmdline,
+            env=lambda: self.child.environ,
+            foreground_processes=lambda: self.child.foreground_processes
         )
+        ans = {'id': self.id}
+        for k, f in getters.items():
+            if fields is None or k in fields:
+                ans[k] = f()
+        return ans
 
     @property
     def current_colors(self):
@@ -264,6 +270,7 @@ class Window:
 
     def title_updated(self):
         update_window_title(self.os_window_id, self.tab_id, self.id, self.title)
+        get_boss().notify_event_subscribers('title_changed', window_id=self.id, tab_id=self.tab_id, title=self.title)
         t = self.tabref()
         if t is not None:
             t.title_changed(self)
@@ -280,6 +287,7 @@ class Window:
         get_boss().child_monitor.set_iutf8(self.id, on)
 
     def focus_changed(self, focused):
+        get_boss().notify_event_subscribers('focus_changed', window_id=self.id, tab_id=self.tab_id, focused=focused)
         if focused:
             self.needs_attention = False
             if self.screen.focus_tracking_enabled:
@@ -486,9 +494,105 @@ class Window:
                 sanitizer = text_sanitizer(as_ansi, add_wrap_markers)
                 h = list(map(sanitizer, h))
             self.screen.historybuf.as_text(h.append, as_ansi, add_wrap_markers)
+            if self.screen.historybuf.count and not self.screen.linebuf.is_continued(0):
+                h.append('\n')
             lines = chain(h, lines)
         return ''.join(lines)
 
+    def text_line_sources(self, as_ansi=False, add_history=False, add_wrap_markers=False):
+        ''' Return a list of (number of lines, func, is_continued) for every
+        part of the text of this window. func(start, stop) returns the text of
+        the lines from start to stop as a list of strings. is_continued is
+        True if the first line of a part continues the last line of the
+        previous part. '''
+        screen = self.screen
+        add_history = add_history and not screen.is_using_alternate_linebuf()
+
+        def lines_from(f, start, stop):
+            ans = []
+            f(ans.append, as_ansi, add_wrap_markers, start, stop)
+            return ans
+
+        sources = []
+        if add_history:
+            if self.opts.scrollback_pager_history_size:
+                h = []
+                screen.historybuf.pagerhist_as_text(h.append)
+                plines = ''.join(h)
+                if not as_ansi or not add_wrap_markers:
+                    plines = text_sanitizer(as_ansi, add_wrap_markers)(plines)
+                # The pager history ends with a newline unless its last line
+                # is continued in the history buffer
+                history_continued = bool(plines) and not plines.endswith('\n')
+                plines = plines.split('\n')
+                if plines and not plines[-1]:
+                    del plines[-1]
+
+                def pager_lines(start, stop):
+                    return [('\n' if y > 0 else '') + plines[y] for y in range(start, min(stop, len(plines)))]
+                sources.append((len(plines), pager_lines, False))
+            else:
+                history_continued = False
+            sources.append((screen.historybuf.count, partial(lines_from, screen.historybuf.as_text), history_continued))
+        screen_lines = screen.as_text_non_visual if add_history else screen.as_text
+        sources.append((screen.lines, partial(lines_from, screen_lines), screen.linebuf.is_continued(0)))
+        return sources
+
+    def as_text_chunk(self, start=0, stop=None, max_lines=None, as_ansi=False, add_history=False, add_wrap_markers=False):
+        '''
+        Return the text of the lines from start to stop (exclusive), but at
+        most max_lines of them, as (text, next_line). Lines are numbered from
+        the top of the scrollback and negative numbers count from the bottom.
+        next_line is the number of the first line not returned or None if
+        there are no more lines. Only the requested lines are converted to text.
+        '''
+        sources = self.text_line_sources(as_ansi, add_history, add_wrap_markers)
+        total = sum(source[0] for source in sources)
+        start = max(0, start + total if start < 0 else start)
+        stop = total if stop is None else max(0, stop + total if stop < 0 else min(stop, total))
+        end = stop if max_lines is None else min(stop, start + max_lines)
+        parts = []
+        offset = 0
+        for num, f, is_continued in sources:
+            a, b = max(start, offset), min(end, offset + num)
+            if a < b:
+                if a == offset and offset > 0 and not is_continued:
+                    parts.append('\n')
+                parts.extend(f(a - offset, b - offset))
+            offset += num
+        return ''.join(parts), (end if end < stop else None)
+
+    def text_since(self, cursor=0, as_ansi=False):
+        '''
+        Return the text of the lines output since cursor, which is a value
+        returned by a previous call. Lines are numbered by the total number
+        of lines ever scrolled into the scrollback, so the numbering is stable
+        as the screen scrolls. Only lines above the cursor row are returned, as
+        the current line may still be incomplete. lines_lost is the number of
+        requested lines that have already been dropped from the scrollback.
+        '''
+        screen = self.screen
+        hb = screen.historybuf
+        added = hb.total_lines_added
+        first = added - hb.count
+        cursor = max(0, cursor)
+        lines_lost = max(0, first - cursor)
+        start = max(cursor, first)
+        end = added if screen.is_using_alternate_linebuf() else added + screen.cursor.y
+
+        def line_at(seq):
+            return hb.line(added - 1 - seq) if seq < added else screen.line(seq - added)
+
+        lines = []
+        for seq in range(start, end):
+            line = line_at(seq)
+            lines.append(line.as_ansi() if as_ansi else str(line))
+            # lines are shared objects, so query the next one only after
+            # converting this one to text
+            if seq + 1 >= added + screen.lines or not line_at(seq + 1).is_continued():
+                lines.append('\n')
+        return {'text': ''.join(lines), 'cursor': max(end, start), 'lines_lost': lines_lost}
+
     @property
     def cwd_of_child(self):
         return self.child.foreground_cwd or self.child.current_cwd
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from statistics import median
+from time import monotonic
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base)
+
+
+def create_tree(tdir, num_files, num_lines, seed=1):
+    # Create two trees of files, in which every file is changed a little
+    r = random.Random(seed)
+    words = 'the quick brown fox jumps over the lazy dog'.split()
+    left, right = os.path.join(tdir, 'left'), os.path.join(tdir, 'right')
+    pairs = []
+    for i in range(num_files):
+        lines = [' '.join(r.choice(words) for w in range(8)) for j in range(num_lines)]
+        changed = list(lines)
+        for j in range(r.randint(1, 5)):
+            pos = r.randrange(len(changed))
+            if r.random() < 0.5:
+                changed[pos] = 'changed ' + changed[pos]
+            else:
+                del changed[pos]
+        name = os.path.join(str(i // 100), '{}.txt'.format(i))
+        for root, data in ((left, lines), (right, changed)):
+            path = os.path.join(root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write('\n'.join(data) + '\n')
+        pairs.append((os.path.join(left, name), os.path.join(right, name)))
+    return pairs
+
+
+def run(pairs, diff_cmd, context):
+    from kittens.diff.patch import Differ, set_diff_command
+    set_diff_command(diff_cmd)
+    d = Differ()
+    for left, right in pairs:
+        d.add_diff(left, right)
+    st = monotonic()
+    ans = d(context)
+    if isinstance(ans, str):
+        raise SystemExit(ans)
+    return monotonic() - st
+
+
+def main():
+    parser = ArgumentParser(description='Compare the speed of the builtin diff engine of the diff kitten with running a diff command per file')
+    parser.add_argument('--files', default=1000, type=int, help='Number of changed files')
+    parser.add_argument('--lines', default=200, type=int, help='Number of lines in each file')
+    parser.add_argument('--repeat', default=5, type=int, help='Number of times to diff all files')
+    parser.add_argument('--context', default=3, type=int, help='Number of lines of context')
+    args = parser.parse_args()
+
+    tdir = tempfile.mkdtemp()
+    try:
+        pairs = create_tree(tdir, args.files, args.lines)
+        for diff_cmd in ('builtin', 'auto'):
+            times = [run(pairs, diff_cmd, args.context) * 1000 for i in range(args.repeat)]
+            print('{}: {} files: min: {:.1f}ms median: {:.1f}ms max: {:.1f}ms'.format(
+                diff_cmd, len(pairs), min(times), median(times), max(times)))
+    finally:
+        shutil.rmtree(tdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from statistics import median
+from time import monotonic
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+frame = re.compile(br'\x1bP@kitty-cmd([^\x1b]+)\x1b\\')
+
+
+def fake_kitty(server):
+    # Respond to every command with an empty window list, so that only the
+    # cost of the client is measured
+    while True:
+        conn = server.accept()[0]
+        with conn:
+            buf = b''
+            while frame.search(buf) is None:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                buf += data
+            conn.sendall(b'\x1bP@kitty-cmd{"ok": true, "data": "[]"}\x1b\\')
+
+
+def run(cmd):
+    st = monotonic()
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+    return monotonic() - st
+
+
+def main():
+    parser = ArgumentParser(description='Measure the cold start latency of kitty @ ls')
+    parser.add_argument('--repeat', default=20, type=int, help='Number of times to run the command')
+    parser.add_argument('--to', help='Address of a running kitty instance to use instead of a fake one that does nothing')
+    parser.add_argument('--kitty', help='The command used to run kitty, defaults to running kitty from this source tree')
+    args = parser.parse_args()
+
+    to = args.to
+    if not to:
+        tdir = tempfile.mkdtemp()
+        path = os.path.join(tdir, 'kitty.sock')
+        server = socket.socket(socket.AF_UNIX)
+        server.bind(path)
+        server.listen(5)
+        threading.Thread(target=fake_kitty, args=(server,), daemon=True).start()
+        to = 'unix:' + path
+
+    kitty = args.kitty.split() if args.kitty else [sys.executable, base]
+    cmd = kitty + ['@', '--to', to, 'ls']
+    run(cmd)  # warm the OS file cache
+    times = [run(cmd) * 1000 for i in range(args.repeat)]
+    print('kitty @ ls: min: {:.1f}ms median: {:.1f}ms max: {:.1f}ms'.format(min(times), median(times), max(times)))
+
+    if args.kitty:
+        return
+    imports = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + cmd[1:], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode('utf-8')
+    kitty_modules = sorted(set(re.findall(r'\|\s+(kitty\.\S+)', imports)))
+    print('kitty modules imported ({}): {}'.format(len(kitty_modules), ' '.join(kitty_modules)))
+    if 'kitty.fast_data_types' in kitty_modules:
+        print('WARNING: fast_data_types was loaded, it should not be needed when using --to', file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+from collections import deque
+from unittest.mock import MagicMock, patch
+from weakref import WeakValueDictionary
+
+from kitty.window import Window as KittyWindow
+
+from . import BaseTest
+from .remote_control import fake_boss
+
+
+class Child:
+
+    def __init__(self, pid):
+        self.pid, self.child_fd = pid, -1
+        self.accessed = []
+
+    def get(name, value):
+        def getter(self):
+            self.accessed.append(name)
+            return value
+        return property(getter)
+
+    # The process information that is expensive to get
+    cwd = current_cwd = get('cwd', '/')
+    cmdline = get('cmdline', ['sh'])
+    environ = get('environ', {'A': '1'})
+    foreground_processes = get('foreground_processes', [])
+    del get
+
+
+class Window:
+
+    as_dict = KittyWindow.as_dict
+    matches = KittyWindow.matches
+
+    def __init__(self, window_id, pid, tab, title='sh'):
+        self.id, self.child, self.tab_id, self.os_window_id = window_id, Child(pid), tab.id, tab.os_window_id
+        self.overlay_for = self.action_on_close = self.override_title = None
+        self.title = title
+        self.screen = None
+        self.destroyed = False
+        tab.windows.append(self)
+
+    def destroy(self):
+        self.destroyed = True
+
+
+class Layout:
+
+    name = 'tall'
+
+
+def create_tab(tab_id):
+    from kitty.tabs import Tab
+    ans = Tab.__new__(Tab)
+    ans.id, ans.os_window_id, ans.windows, ans.name = tab_id, 1, deque(), 'tab{}'.format(tab_id)
+    ans._active_window_idx, ans.current_layout = 0, Layout()
+    return ans
+
+
+def create_tab_manager():
+    from kitty.tabs import TabManager
+    ans = TabManager.__new__(TabManager)
+    ans.os_window_id, ans.tabs, ans.active_tab_history = 1, [], deque()
+    ans._active_tab_idx, ans.tab_bar_hidden, ans.tab_bar = 0, False, MagicMock()
+    return ans
+
+
+class TestBoss(BaseTest):
+
+    def test_indices(self):
+        from kitty.tabs import Tab, TabManager
+        boss = fake_boss([])
+        boss.window_id_map, boss.window_pid_map, boss.tab_id_map = WeakValueDictionary(), WeakValueDictionary(), WeakValueDictionary()
+        boss.child_monitor = MagicMock()
+        boss.os_window_map, boss.os_window_death_actions, boss.cached_values = {}, {}, {}
+        boss.shutting_down = False
+        c_functions = dict.fromkeys(('remove_tab', 'set_active_tab', 'mark_tab_bar_dirty', 'glfw_post_empty_event'), MagicMock())
+        with patch.multiple('kitty.tabs', get_boss=lambda: boss, **c_functions), \
+                patch.object(TabManager, 'tabbar_visibility_changed', lambda self: None), \
+                patch.object(Tab, 'remove_window', lambda self, w: self.windows.remove(w)):
+            tm = boss.os_window_map[1] = create_tab_manager()
+            tabs = [create_tab(i) for i in (1, 2, 3)]
+            for tab in tabs:
+                tm._add_tab(tab)
+            w1, w2 = Window(1, 101, tabs[0]), Window(2, 102, tabs[0])
+            w3, w4 = Window(3, 103, tabs[1]), Window(10, 104, tabs[2])
+            for w in (w1, w2, w3, w4):
+                boss.add_child(w)
+
+            def match(spec):
+                return list(boss.match_windows(spec))
+
+            self.ae(match('id:1'), [w1])
+            self.ae(match('id:10'), [w4])
+            self.ae(match('pid:102'), [w2])
+            # Only the canonical form of an id or pid matches
+            for spec in ('id:01', 'id: 1', 'id:+1', 'id:1.0', 'id:abc', 'id:', 'id:99', 'pid:0102', 'pid:x', 'pid:'):
+                self.ae(match(spec), [], spec)
+            self.ae(list(boss.match_tabs('id:2')), [tabs[1]])
+            self.ae(list(boss.match_tabs('id:02')), [])
+            self.ae(list(boss.match_tabs('id:x')), [])
+            self.ae(list(boss.match_tabs('id:3')), [tabs[2]])
+            self.ae(list(boss.match_tabs('pid:103')), [tabs[1]])
+            self.assertIs(boss.tab_for_window(w3), tabs[1])
+
+            # A window that has been moved to another tab is never reported
+            # to be in the tab it was in
+            tabs[1].windows.remove(w3), tabs[0].windows.append(w3)
+            self.assertIsNone(boss.tab_for_window(w3))
+            w3.tab_id = tabs[0].id
+            self.assertIs(boss.tab_for_window(w3), tabs[0])
+            self.ae(list(boss.match_tabs('id:3')), [tabs[2]])
+            self.ae(list(boss.match_tabs('id:1')), [tabs[0]])
+            tabs[0].windows.remove(w3), tabs[1].windows.append(w3)
+            w3.tab_id = tabs[1].id
+
+            # A window that closes is removed from the indices, but not a
+            # window that re-uses its pid
+            w5 = Window(5, 101, tabs[0])
+            boss.add_child(w5)
+            boss.on_child_death(w1.id)
+            self.ae(match('id:1'), [])
+            self.ae(match('pid:101'), [w5])
+            self.assertTrue(w1.destroyed)
+            self.ae(list(tabs[0]), [w2, w5])
+            # When the last window of a tab closes, the tab is removed
+            boss.on_child_death(w4.id)
+            self.ae((match('id:10'), match('pid:104')), ([], []))
+            self.ae(tm.tabs, tabs[:2])
+            self.ae(set(boss.tab_id_map), {1, 2})
+            # A window is only removed once
+            boss.on_child_death(w4.id)
+            self.ae(tm.tabs, tabs[:2])
+
+            tm._remove_tab(tabs[1])
+            self.ae(set(boss.tab_id_map), {1})
+            self.assertIsNone(boss.tab_for_window(w3))
+            tm._add_tab(tabs[1])
+
+            # Closing the OS window removes its tabs and windows
+            with patch('kitty.tabs.evict_cached_layouts'):
+                boss.on_os_window_closed(1, 100, 100)
+            self.ae(len(boss.tab_id_map), 0)
+            self.ae(len(boss.window_id_map), 0)
+            self.ae(len(boss.window_pid_map), 0)
+            for spec in ('id:2', 'id:3', 'pid:102'):
+                self.ae(match(spec), [], spec)
+            self.ae(list(boss.match_tabs('id:1')), [])
+
+    def test_ls(self):
+        import json
+        from kitty.cmds import MatchError, cmap, cmd_ls, ls, parse_subcommand_cli
+        boss = fake_boss([])
+        tm = create_tab_manager()
+        boss.os_window_map = {1: tm}
+        tm.tabs = tabs = [create_tab(1), create_tab(2), create_tab(3)]
+        w1, w2 = Window(1, 101, tabs[0], 'vim'), Window(2, 102, tabs[0])
+        w3, w4 = Window(3, 103, tabs[1], 'vim x'), Window(4, 104, tabs[2])
+        windows = w1, w2, w3, w4
+        boss.window_id_map = WeakValueDictionary((w.id, w) for w in windows)
+        boss.window_pid_map = WeakValueDictionary((w.child.pid, w) for w in windows)
+        boss.tab_id_map = WeakValueDictionary((t.id, t) for t in tabs)
+
+        def run(*args):
+            for w in windows:
+                del w.child.accessed[:]
+            opts, items = parse_subcommand_cli(cmap['ls'], ['ls'] + list(args))
+            ans = ls(boss, None, cmd_ls(None, opts, items))
+            return ans.encode(ans.snapshot)
+
+        with patch('kitty.boss.current_os_window', lambda: 1):
+            data = json.loads(run())
+            self.ae([t['id'] for t in data[0]['tabs']], [1, 2, 3])
+            self.ae(data[0]['tabs'][0]['windows'][0], {
+                'id': 1, 'is_focused': True, 'title': 'vim', 'pid': 101, 'cwd': '/',
+                'cmdline': ['sh'], 'env': {'A': '1'}, 'foreground_processes': []})
+            self.ae(w1.child.accessed, ['cwd', 'cmdline', 'environ', 'foreground_processes'])
+            # Only the requested fields are computed, the id is always present
+            data = json.loads(run('--fields', 'title, pid'))
+            self.ae(data[0]['tabs'][1]['windows'], [{'id': 3, 'title': 'vim x', 'pid': 103}])
+            for w in windows:
+                self.ae(w.child.accessed, [])
+            self.ae(json.loads(run('--fields', 'id'))[0]['tabs'][0]['windows'], [{'id': 1}, {'id': 2}])
+            self.assertRaises(SystemExit, run, '--fields', 'title,colors')
+            # Tabs and OS windows with no matching windows are dropped
+            data = json.loads(run('--match', 'title:vim', '--fields', 'title'))
+            self.ae(data, [{'id': 1, 'is_focused': True, 'tabs': [
+                {'id': 1, 'is_focused': True, 'title': 'tab1', 'layout': 'tall', 'windows': [{'id': 1, 'title': 'vim'}]},
+                {'id': 2, 'is_focused': False, 'title': 'tab2', 'layout': 'tall', 'windows': [{'id': 3, 'title': 'vim x'}]},
+            ]}])
+            self.ae([t['id'] for t in json.loads(run('--match', 'id:4', '-f', 'pid'))[0]['tabs']], [3])
+            self.assertRaises(MatchError, run, '--match', 'id:5')
+            # One object per window per line
+            lines = run('--format', 'ndjson', '--fields', 'title').split('\n')
+            self.ae([json.loads(line) for line in lines], [
+                {'id': w.id, 'title': w.title, 'os_window_id': 1, 'tab_id': w.tab_id} for w in windows])
+            self.ae(json.loads(run('--format', 'ndjson', '--match', 'pid:102')), {'id': 2, 'is_focused': False, 'title': 'sh', 'pid': 102, 'cwd': '/',
+                'cmdline': ['sh'], 'env': {'A': '1'}, 'foreground_processes': [], 'os_window_id': 1, 'tab_id': 1})
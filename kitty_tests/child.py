@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+import os
+from unittest.mock import patch
+
+from . import BaseTest
+
+
+class TestChild(BaseTest):
+
+    def test_process_info_cache(self):
+        from kitty.child import ProcessInfoCache
+        now = [100.0]
+        fetched = []
+
+        def fetch(pid):
+            fetched.append(pid)
+            return 'value{}'.format(len(fetched))
+
+        with patch('kitty.child.monotonic', lambda: now[0]):
+            c = ProcessInfoCache(ttl=1)
+            self.ae(c.get(1, 'cmdline', fetch), 'value1')
+            self.ae(c.get(1, 'cmdline', fetch), 'value1')
+            self.ae(c.get(1, 'environ', fetch), 'value2')
+            self.ae(c.get(2, 'cmdline', fetch), 'value3')
+            self.ae(fetched, [1, 1, 2])
+            # All fields expire, including the environment, which exec can change
+            now[0] += 1
+            self.ae(c.get(1, 'environ', fetch), 'value4')
+            self.ae(c.get(1, 'cmdline', fetch), 'value5')
+            # Entries that have expired are pruned on access
+            self.ae(set(c.entries), {1})
+            c.invalidate(1)
+            self.ae(c.get(1, 'cmdline', fetch), 'value6')
+            now[0] += 0.5
+            c.get(3, 'cmdline', fetch)
+            self.ae(set(c.entries), {1, 3})
+            now[0] += 2
+            c.get(3, 'cmdline', fetch)
+            self.ae(set(c.entries), {3})
+            c.invalidate()
+            self.ae(c.entries, {})
+
+    def test_processes_in_group(self):
+        from kitty.child import processes_in_group
+        pid = os.getpid()
+        self.assertIn(pid, processes_in_group(os.getpgid(pid), pid))
+        self.assertIn(pid, processes_in_group(os.getpgid(pid)))
+
+    def test_kitten_server(self):
+        import json
+        import socket
+        from kittens.runner import KittenServer, recv_message, send_message
+        ks = KittenServer()
+        ends = []
+
+        def start():
+            ks.socket, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            ks.socket.settimeout(ks.timeout)
+            ends.append(theirs)
+
+        r, w = os.pipe()
+        try:
+            with patch.object(ks, 'start', start):
+                # The server is started on first use, kittens are run the
+                # normal way until it is ready
+                self.assertFalse(ks.is_ready())
+                self.assertFalse(ks.is_ready())
+                self.ae(ks.spawn(['hints'], '/', {}, -1, r, -1, -1, r, w), None)
+                self.ae(len(ends), 1)
+                server = ends[0]
+                send_message(server, json.dumps({'ready': True}).encode('utf-8'))
+                self.assertTrue(ks.is_ready())
+                send_message(server, json.dumps({'pid': 1234}).encode('utf-8'))
+                self.ae(ks.spawn(['hints'], '/', {'A': '1'}, -1, r, -1, -1, r, w), 1234)
+                data, fds = recv_message(server, max_fds=3)
+                for fd in fds:
+                    os.close(fd)
+                self.ae(json.loads(data.decode('utf-8')), {'args': ['hints'], 'cwd': '/', 'env': {'A': '1'}})
+                self.ae(len(fds), 2)
+                # A server that stops working is not restarted
+                server.close()
+                with patch('traceback.print_exc'):
+                    self.ae(ks.spawn(['hints'], '/', {}, -1, r, -1, -1, r, w), None)
+                self.assertFalse(ks.is_ready())
+                self.ae(len(ends), 1)
+        finally:
+            os.close(r), os.close(w)
+
+    def test_child_pool(self):
+        import signal
+        import time
+        from kitty.child import Child, ChildPool
+
+        def child(code=None):
+            pid = os.fork()
+            if pid == 0:
+                if code is None:
+                    time.sleep(10)
+                os._exit(code or 0)
+            c = Child.__new__(Child)
+            c.pid, c.argv, c.cwd, c.env = pid, ['sh'], '/', {}
+            c.child_fd, c.terminal_ready_fd = os.open(os.devnull, os.O_RDONLY), -1
+            return c
+
+        def wait_for_death(c):
+            for i in range(500):
+                if not c.is_alive:
+                    return True
+                time.sleep(0.01)
+
+        dead, live = child(0), child()
+        try:
+            self.assertTrue(wait_for_death(dead))
+            # The pid has been reaped, so it can be reused, which must not
+            # make the child appear to be alive
+            self.assertFalse(dead.is_alive)
+            self.assertTrue(live.is_alive)
+            pool = ChildPool()
+            with patch.object(pool, 'refill_later', lambda: None):
+                pool.pools[pool.key(live)] = {'template': live, 'children': [dead, live]}
+                self.assertIs(pool.adopt(live), live)
+                self.ae(pool.pools[pool.key(live)]['children'], [])
+                self.assertIs(pool.adopt(live), None)
+        finally:
+            os.kill(live.pid, signal.SIGKILL)
+            self.assertTrue(wait_for_death(live))
+            os.close(live.child_fd)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from . import BaseTest
+
+
+class TestComplete(BaseTest):
+
+    def setUp(self):
+        from kitty.constants import cache_dir
+        self.tdir = tempfile.mkdtemp()
+        self.orig_cache_dir = getattr(cache_dir, 'ans', None)
+        cache_dir.ans = self.tdir
+
+    def tearDown(self):
+        from kitty.constants import cache_dir
+        from kitty.complete import completion_table
+        cache_dir.ans = self.orig_cache_dir
+        completion_table.__dict__.pop('ans', None)
+        shutil.rmtree(self.tdir)
+
+    def test_completion_table(self):
+        import kitty.complete as complete
+        path = os.path.join(self.tdir, 'completion-table.json')
+        with patch('kitty.complete.build_completion_table', wraps=complete.build_completion_table) as build:
+
+            def table(expected_builds, from_disk=True):
+                if from_disk:
+                    complete.completion_table.__dict__.pop('ans', None)
+                ans = complete.completion_table()
+                self.ae(build.call_count, expected_builds)
+                return ans
+
+            t = table(1)
+            self.assertIn('ls', t['remote_commands'])
+            self.assertIn('font_size', t['config_directives'])
+            self.assertIn('--single-instance', {a for opt in t['kitty_options'] for a in opt['aliases']})
+            self.assertTrue(os.path.exists(path))
+            self.assertIs(table(1, from_disk=False), t)
+            self.ae(table(1), t)
+            # A change to any module that defines options rebuilds the table
+            signature = json.loads(json.dumps(complete.table_signature() + [('changed', 1)]))
+            with patch('kitty.complete.table_signature', lambda: signature):
+                self.ae(table(2)['signature'], signature)
+                table(2)
+            table(3)
+            with open(path, 'w') as f:
+                f.write('garbage')
+            self.ae(table(4), t)
+            table(4)
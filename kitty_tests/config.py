@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from . import BaseTest
+
+
+class TestConfig(BaseTest):
+
+    def setUp(self):
+        from kitty.constants import cache_dir
+        from kitty.config import OptionsCache
+        self.tdir = tempfile.mkdtemp()
+        self.orig_cache_dir = getattr(cache_dir, 'ans', None)
+        cache_dir.ans = os.path.join(self.tdir, 'cache')
+        OptionsCache.loaded.clear()
+        self.mtime = 1000
+
+    def tearDown(self):
+        from kitty.constants import cache_dir
+        from kitty.config import OptionsCache
+        cache_dir.ans = self.orig_cache_dir
+        OptionsCache.loaded.clear()
+        shutil.rmtree(self.tdir)
+
+    def write_conf(self, name, text):
+        path = os.path.join(self.tdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        # Make sure the change is noticed even on filesystems with coarse mtimes
+        self.mtime += 1
+        os.utime(path, (self.mtime, self.mtime))
+        return path
+
+    def test_options_cache(self):
+        import kitty.config as config
+        path = self.write_conf('kitty.conf', 'font_size 13\ninclude other.conf\n')
+        self.write_conf('other.conf', 'scrollback_lines 100\n')
+        with patch('kitty.config._load_config', wraps=config._load_config) as parse:
+
+            def load(expected_parses, *paths, **kw):
+                opts = config.load_config(*paths, **kw)
+                self.ae(parse.call_count, expected_parses)
+                return opts
+
+            opts = load(1, path)
+            self.ae((opts.font_size, opts.scrollback_lines), (13, 100))
+            self.ae(len(os.listdir(os.path.join(self.tdir, 'cache', 'options-cache'))), 1)
+            load(1, path)
+            # Loading the cache from disk, as a new process would
+            config.OptionsCache.loaded.clear()
+            opts = load(1, path)
+            self.ae((opts.font_size, opts.scrollback_lines), (13, 100))
+            # Changing the config file or an included file invalidates the cache
+            self.write_conf('kitty.conf', 'font_size 14\ninclude other.conf\n')
+            self.ae(load(2, path).font_size, 14)
+            self.write_conf('other.conf', 'scrollback_lines 200\n')
+            self.ae(load(3, path).scrollback_lines, 200)
+            load(3, path)
+            # Overrides are part of the key
+            self.ae(load(4, path, overrides=('font_size 15',)).font_size, 15)
+            self.ae(load(4, path).font_size, 14)
+            # As is the code that defines the options
+            sig = config.options_definitions_signature() + ['changed']
+            with patch('kitty.config.options_definitions_signature', lambda: sig):
+                self.ae(load(5, path).font_size, 14)
+            self.ae(len(os.listdir(os.path.join(self.tdir, 'cache', 'options-cache'))), 3)
+
+    def test_options_cache_format(self):
+        import json
+        import kitty.config as config
+        path = self.write_conf('kitty.conf', '''
+foreground #123456
+selection_foreground none
+env A=1
+symbol_map U+E0A0-U+E0A2,U+E0B0 PowerlineSymbols
+clipboard_control write-clipboard
+map ctrl+a send_text all \\x1b[1;5A
+map ctrl+b>x combine : new_window : goto_tab 2
+map ctrl+c change_font_size all +2.5
+map ctrl+d kitten hints --type url
+map ctrl+e no_op
+''')
+        with patch('kitty.config._load_config', wraps=config._load_config) as parse:
+            parsed = config.load_config(path)
+            config.OptionsCache.loaded.clear()
+            cached = config.load_config(path)
+        self.ae(parse.call_count, 1)
+        self.assertTrue(cached.sequence_map)
+        self.ae(cached._asdict(), parsed._asdict())
+        self.ae(cached.symbol_map, {(0xe0a0, 0xe0a2): 'PowerlineSymbols', (0xe0b0, 0xe0b0): 'PowerlineSymbols'})
+        self.assertIsInstance(cached.clipboard_control, frozenset)
+        self.assertIn(config.KeyAction('send_text', ['all', b'\x1b[1;5A']), cached.keymap.values())
+        # The cache is JSON, and a cache with unknown contents is ignored
+        cache_path = os.path.join(self.tdir, 'cache', 'options-cache', os.listdir(os.path.join(self.tdir, 'cache', 'options-cache'))[0])
+        self.assertTrue(cache_path.endswith('.json'))
+        with open(cache_path) as f:
+            data = json.load(f)
+        data['options']['foreground'] = {'os.system': ['true']}
+        with open(cache_path, 'w') as f:
+            json.dump(data, f)
+        config.OptionsCache.loaded.clear()
+        with patch('kitty.config.log_error') as log_error, patch('kitty.config._load_config', wraps=config._load_config) as parse:
+            self.ae(config.load_config(path).foreground, parsed.foreground)
+        self.ae(parse.call_count, 1)
+        self.ae(log_error.call_count, 1)
+        config.OptionsCache.loaded.clear()
+        self.ae(config.load_config(path)._asdict(), parsed._asdict())
+
+    def test_loaded_options_are_not_shared(self):
+        from kitty.config import load_config
+        path = self.write_conf('kitty.conf', 'font_size 13\nenv A=1\n')
+        first = load_config(path)
+        self.assertTrue(first.keymap)
+        # Changes to loaded options, as made by Boss, must not affect later loads
+        first.keymap.clear()
+        first.env['B'] = '2'
+        second = load_config(path)
+        self.assertTrue(second.keymap)
+        self.ae(second.env, {'A': '1'})
+        # Reloading after a change always gives new values
+        self.write_conf('kitty.conf', 'font_size 14\nenv A=3\n')
+        reloaded = load_config(path)
+        again = load_config(path)
+        self.ae((reloaded.font_size, again.font_size), (14, 14))
+        for opts in (first, second, reloaded):
+            self.assertIsNot(again.keymap, opts.keymap)
+            self.assertIsNot(again.env, opts.env)
+        reloaded.env['A'] = '4'
+        self.ae(load_config(path).env, {'A': '3'})
+
+    def test_reload(self):
+        import json
+        from unittest.mock import DEFAULT, MagicMock, patch as patch_
+        from kitty.config import load_config
+        from kitty.constants import version
+        from kitty.rgb import Color
+        from .remote_control import fake_boss
+
+        class Args:
+            override = ['background_opacity=0.5']
+            debug_gl = debug_font_fallback = False
+            listen_on = None
+
+        class TabManager:
+
+            def __init__(self, windows):
+                self.tabs = [windows]
+                self.changed, self.num_resizes = [], 0
+                self.tab_bar = MagicMock()
+
+            def __iter__(self):
+                return iter(self.tabs)
+
+            def apply_options(self, changed):
+                self.changed.append(changed)
+
+            def resize(self):
+                self.num_resizes += 1
+
+        conf = 'allow_remote_control yes\nfont_size 13\nforeground #111111\nmap ctrl+a new_window\nmap ctrl+b new_tab\nenv A=1\n'
+        path = self.write_conf('kitty.conf', conf)
+        sent = []
+        boss = fake_boss(sent)
+        boss.opts, boss.args = load_config(path, overrides=('background_opacity 0.5',)), Args()
+        trigger = next(k for k, v in boss.opts.keymap.items() if v.func == 'new_tab')
+        boss.new_os_window_trigger = trigger
+        boss.keymap = {k: v for k, v in boss.opts.keymap.items() if k != trigger}
+        boss.startup_colors, boss.window_id_map = {}, {}
+        window = MagicMock()
+        tm = TabManager([window])
+        boss.os_window_map = {1: tm}
+        c_functions = 'set_options patch_color_profiles patch_global_colors global_font_size os_window_font_size change_background_opacity'
+        with patch_.multiple('kitty.boss', **{k: DEFAULT for k in c_functions.split()}) as c, \
+                patch_('kitty.main.set_default_env') as set_default_env, \
+                patch_('kitty.fonts.render.set_font_family') as set_font_family, \
+                patch_('kitty.fonts.box_drawing.set_scale'):
+
+            def reload(text):
+                self.write_conf('kitty.conf', text)
+                return boss.load_config_file(path)
+
+            opts = boss.opts
+            old_keymap = boss.keymap
+            conf = conf.replace('#111111', '#222222').replace('ctrl+a', 'ctrl+c').replace('A=1', 'A=2')
+            changed = reload(conf)
+            # The command line overrides are applied again
+            self.ae(changed, {'foreground', 'key_definitions', 'keymap', 'env'})
+            self.assertIs(boss.opts, opts)
+            self.ae(opts.foreground, Color(0x22, 0x22, 0x22))
+            self.ae(boss.startup_colors, {'foreground': opts.foreground})
+            c['patch_color_profiles'].assert_called_once_with({'foreground': 0x222222}, False, (window.screen.color_profile,), True)
+            c['patch_global_colors'].assert_called_once_with({'foreground': 0x222222}, True)
+            tm.tab_bar.patch_colors.assert_called_once_with({'foreground': 0x222222})
+            window.refresh.assert_called_once_with()
+            self.assertNotEqual(boss.keymap, old_keymap)
+            self.ae(boss.keymap, {k: v for k, v in opts.keymap.items() if k != trigger})
+            set_default_env.assert_called_once_with({'A': '2'})
+            self.ae(c['set_options'].call_count, 1)
+            self.ae(tm.changed, [changed])
+            # Fonts are only reloaded when a font option changes
+            set_font_family.assert_not_called()
+            c['os_window_font_size'].assert_not_called()
+            c['change_background_opacity'].assert_not_called()
+            self.ae(tm.num_resizes, 0)
+            conf = conf.replace('font_size 13', 'font_size 14')
+            self.ae(reload(conf), {'font_size'})
+            self.ae(set_font_family.call_count, 1)
+            c['global_font_size'].assert_called_once_with(14)
+            c['os_window_font_size'].assert_called_once_with(1, 14, True)
+            self.ae(tm.num_resizes, 1)
+            self.ae(c['patch_color_profiles'].call_count, 1)
+            # Nothing is done if nothing changed
+            self.ae(reload(conf), frozenset())
+            self.ae(len(tm.changed), 2)
+
+            # The load-config remote command
+            from kitty.cmds import cmap, cmd_load_config, parse_subcommand_cli
+            self.write_conf('kitty.conf', conf + 'scrollback_lines 100\ncursor #333333\n')
+            opts, items = parse_subcommand_cli(cmap['load-config'], ['load-config', path])
+            cmd = {'cmd': 'load-config', 'version': version, 'no_response': False, 'id': 1, 'payload': cmd_load_config(None, opts, items)}
+            boss.peer_message_received(('\x1bP@kitty-cmd' + json.dumps(cmd) + '\x1b\\').encode('utf-8'), 1)
+            self.ae(sent, [(1, {'ok': True, 'id': 1, 'data': 'cursor\nscrollback_lines'}, True)])
+            self.ae(boss.opts.scrollback_lines, 100)
+
+    def test_parse_option_spec(self):
+        import kitty.cli as cli
+        spec = '''
+--title -T
+Set the title
+
+
+--type
+type=choices
+choices=a,b
+default=a
+The type
+'''
+        with patch('kitty.cli._parse_option_spec', wraps=cli._parse_option_spec) as parse:
+            first = cli.parse_option_spec(spec)
+            self.ae([opt['dest'] for opt in first[0]], ['title', 'type'])
+            self.ae(first[0][1]['choices'], {'a', 'b'})
+            second = cli.parse_option_spec(spec)
+            self.ae(parse.call_count, 1)
+            self.ae(second, first)
+            cli.parse_option_spec(spec + '\n--other\nOther\n')
+            self.ae(parse.call_count, 2)
+            # Changes made by one caller are not seen by others
+            first[0][0]['help'] = 'changed'
+            first[0].append('# Extra')
+            self.assertIsInstance(first[0][1]['choices'], frozenset)
+            third = cli.parse_option_spec(spec)
+            self.ae(parse.call_count, 2)
+            self.ae(third, second)
+            self.ae(len(third[0]), 2)
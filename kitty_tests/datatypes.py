@@ -424,6 +424,9 @@ class TestDataTypes(BaseTest):
             hb.push(line)
         for i in range(3000):
             self.ae(str(hb.line(i)).rstrip(), str(3000 - 1 - i))
+        self.ae(hb.total_lines_added, 3000)
+        hb.push(lb.line(1))
+        self.ae((hb.count, hb.total_lines_added), (3000, 3001))
 
         # rewrap
         hb = filled_history_buf(5, 5)
@@ -442,6 +445,7 @@ class TestDataTypes(BaseTest):
         hb.rewrap(hb2)
         for i in range(hb2.ynum):
             self.ae(hb2.line(i), hb.line(i))
+        self.ae(hb2.total_lines_added, hb.total_lines_added)
         self.ae(hb2.dirty_lines(), list(range(hb2.ynum)))
         hb = filled_history_buf(5, 5)
         hb2 = HistoryBuf(hb.ynum, hb.xnum * 2)
@@ -3,9 +3,27 @@
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
 
+import os
+import tempfile
+from contextlib import contextmanager
+
 from . import BaseTest
 
 
+@contextmanager
+def left_and_right():
+    ' Temporary directories to be compared '
+    with tempfile.TemporaryDirectory() as tdir:
+        yield os.path.join(tdir, 'left'), os.path.join(tdir, 'right')
+
+
+def write_file(base, name, data):
+    path = os.path.join(base, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+
 class TestDiff(BaseTest):
 
     def test_changed_center(self):
@@ -44,3 +62,226 @@ class TestDiff(BaseTest):
 
         highlights = [h(0, 1, 1), h(1, 3, 2)]
         self.ae(['S1SaE1ES2SbcE2Ed'], split_with_highlights('abcd', 10, highlights))
+
+    def test_collect_files(self):
+        from kittens.diff.collect import Collection, collect_files
+        w = write_file
+        with left_and_right() as (left, right):
+            for base in (left, right):
+                w(base, 'same', b'same\n')
+                w(base, 'empty', b'')
+                w(base, 'd/same', b'x' * 100000)
+            w(left, 'size', b'a\n'), w(right, 'size', b'ab\n')
+            w(left, 'content', b'a\n'), w(right, 'content', b'b\n')
+            w(left, 'old', b'moved\n'), w(right, 'new', b'moved\n')
+            w(left, 'removed', b'removed\n'), w(right, 'added', b'added\n')
+            os.link(os.path.join(left, 'same'), os.path.join(right, 'linked'))
+            os.link(os.path.join(left, 'same'), os.path.join(left, 'linked'))
+            c = Collection()
+            collect_files(c, left, right)
+            names = {os.path.relpath(p, left if typ != 'add' else right): typ for p, typ, data in c}
+            self.ae(names, {'size': 'diff', 'content': 'diff', 'old': 'rename', 'removed': 'removal', 'added': 'add'})
+            self.ae(c.renames[os.path.join(left, 'old')], os.path.join(right, 'new'))
+
+    def test_rename_detection(self):
+        from kittens.diff.collect import Collection, collect_files
+        w = write_file
+        with left_and_right() as (left, right):
+            for i in range(3):
+                w(left, 'a/{}/__init__.py'.format(i), '')
+                w(right, 'b/{}/__init__.py'.format(i), '')
+            text = ''.join('line {}\n'.format(i) for i in range(20))
+            w(left, 'old.txt', text), w(right, 'new.txt', text.replace('line 10', 'changed'))
+            w(left, 'gone.txt', 'gone\n'), w(right, 'other.txt', 'other\n')
+
+            def collect(rename_similarity):
+                c = Collection()
+                collect_files(c, left, right, rename_similarity)
+                return c
+
+            c = collect(0)
+            self.ae(c.renames, {os.path.join(left, 'a/{}/__init__.py'.format(i)): os.path.join(right, 'b/{}/__init__.py'.format(i)) for i in range(3)})
+            self.ae(c.changes, {})
+            c = collect(0.5)
+            self.ae(c.changes, {os.path.join(left, 'old.txt'): os.path.join(right, 'new.txt')})
+            self.ae(c.removes, {os.path.join(left, 'gone.txt')})
+            self.ae(c.adds, {os.path.join(right, 'other.txt')})
+            c = collect(0.9)
+            self.ae(c.changes, {})
+
+    def test_content_cache(self):
+        from kittens.diff.collect import ContentCache
+        with tempfile.TemporaryDirectory() as tdir:
+            paths = []
+            for i in range(10):
+                paths.append(os.path.join(tdir, str(i)))
+                with open(paths[-1], 'w') as f:
+                    f.write('{}\n'.format(i) * 1000)
+            with open(os.path.join(tdir, 'binary'), 'wb') as f:
+                f.write(b'\xff' * 1000)
+            c = ContentCache()
+            self.ae(c.loaded(paths[0]).lines, ('0',) * 1000)
+            self.ae((c.hits, c.misses), (0, 1))
+            c.loaded(paths[0])
+            self.ae((c.hits, c.misses), (1, 1))
+            e = c.loaded(os.path.join(tdir, 'binary'))
+            self.ae((e.lines, e.size), (None, 1000))
+            c = ContentCache(max_size=3 * c.entries[paths[0]].cost)
+            for p in paths:
+                c.loaded(p)
+            self.assertLessEqual(c.size, c.max_size)
+            self.ae(list(c.entries), paths[-3:])
+            self.ae(c.evictions, 7)
+            c.loaded(paths[-3]), c.loaded(paths[0])
+            self.ae(list(c.entries), [paths[-1], paths[-3], paths[0]])
+
+    def test_builtin_diff(self):
+        import random
+        from kittens.diff.line_diff import opcodes
+        from kittens.diff import patch
+        r = random.Random(7)
+        for i in range(500):
+            left = [r.choice('abcde') for i in range(r.randint(0, 30))]
+            right = [r.choice('abcde') for i in range(r.randint(0, 30))]
+            result = []
+            for tag, i1, i2, j1, j2 in opcodes(left, right):
+                if tag == 'equal':
+                    self.ae(left[i1:i2], right[j1:j2])
+                    result.extend(left[i1:i2])
+                else:
+                    result.extend(right[j1:j2])
+            self.ae(result, right)
+
+        def hunks(left, right, context=3):
+            patch.left_lines, patch.right_lines = left, right
+            p = patch.builtin_patch(left, right, context)
+            return [(h.left_start, h.left_count, h.right_start, h.right_count, h.title, [
+                (c.is_context, c.left_start, c.left_count, c.right_start, c.right_count) for c in h.chunks]) for h in p]
+
+        left = ['def f():'] + ['    a{}'.format(i) for i in range(10)] + ['def g():', '    b', '']
+        right = list(left)
+        right[1] = '    changed'
+        del right[9]
+        right.insert(12, '    c')
+        self.ae(hunks(left, left), [])
+        # the same as the output of diff -p -U 1
+        self.ae(hunks(left, right, 1), [
+            (0, 3, 0, 3, '', [(True, 0, 1, 0, 1), (False, 1, 1, 1, 1), (True, 2, 1, 2, 1)]),
+            (8, 3, 8, 2, 'def f():', [(True, 8, 1, 8, 1), (False, 9, 1, 9, 0), (True, 10, 1, 9, 1)]),
+            (12, 2, 11, 3, 'def g():', [(True, 12, 1, 11, 1), (False, 13, 0, 12, 1), (True, 13, 1, 13, 1)]),
+        ])
+        # a deleted run of identical lines is shown at its end, as with diff
+        self.ae(hunks(['1', '2', '2', '3'], ['1', '2', '3'], 0), [(2, 1, 1, 0, '', [(False, 2, 1, 1, 0)])])
+        self.ae(hunks([], ['a'], 0), [(-1, 0, 0, 1, '', [(False, -1, 0, 0, 1)])])
+
+        # Regions that need too many edits are shown as replaced
+        from unittest.mock import patch as mock_patch
+        left, right = ['x'] * 20 + ['y'] * 20, ['y'] * 20 + ['x'] * 20
+        self.assertIn(('equal', 20, 40, 0, 20), opcodes(left, right))
+        with mock_patch('kittens.diff.line_diff.MIN_COST_LIMIT', 8):
+            self.ae(opcodes(left, right), [('replace', 0, 40, 0, 40)])
+            self.ae(opcodes(left + ['z'], right + ['z']), [('replace', 0, 40, 0, 40), ('equal', 40, 41, 40, 41)])
+
+    def test_rendered_diff(self):
+        from functools import partial
+        from kittens.diff.render import Block, Line, LineRef, Reference, RenderedDiff
+        rendered = []
+
+        def render(path, start, count):
+            rendered.append((path, start))
+            return (Line('{}:{}'.format(path, i), Reference(path, LineRef(i)), i == start) for i in range(start, start + count))
+
+        blocks = [Block(frozenset('a'), lines=(Line('title a', Reference('a')),), has_change_start=False)]
+        blocks += [Block(frozenset('a'), 10, partial(render, 'a', i * 10, 10), starts={'a': i * 10}) for i in range(3)]
+        blocks.append(Block(frozenset('b'), lines=(Line('title b', Reference('b')),), has_change_start=False))
+        blocks.append(Block(frozenset('b'), 5, partial(render, 'b', 0, 5), has_change_start=False, starts={'b': 0}))
+        d = RenderedDiff(blocks, 3, max_cached_lines=20)
+        self.ae(len(d), 37)
+        self.ae(rendered, [])
+        self.ae(d[15].text, 'a:14')
+        self.ae(d[-1].text, 'b:4')
+        self.ae(d[0].text, 'title a')
+        self.ae(rendered, [('a', 10), ('b', 0)])
+        self.ae([l.text for l in d], ['title a'] + ['a:{}'.format(i) for i in range(30)] + ['title b'] + ['b:{}'.format(i) for i in range(5)])
+        self.assertLessEqual(d.num_cached_lines, 20)
+        self.ae(d.next_change(0), 1)
+        self.ae(d.next_change(1), 11)
+        self.ae(d.next_change(25), None)
+        self.ae(d.next_change(35, backwards=True), 21)
+        self.ae(d.path_map, {'a': (0, 3), 'b': (4, 5)})
+        # Finding a source line only renders the block that shows it
+        d.clear_cache()
+        del rendered[:]
+        self.ae(d.position_of(Reference('a', LineRef(12))), 13)
+        self.ae(rendered, [('a', 10)])
+        self.ae(d.position_of(Reference('b', LineRef(7))), 36)
+        self.ae(rendered, [('a', 10), ('b', 0)])
+        self.ae(d.position_of(Reference('b')), 31)
+        self.ae(d.position_of(Reference('c')), None)
+        self.ae(d.position_of(Reference('c', LineRef(1))), None)
+        del rendered[:]
+        d.clear_cache()
+        d[5]
+        self.ae(rendered, [('a', 0)])
+
+    def test_search(self):
+        from functools import partial
+        from kittens.diff.render import Block, Line, LineRef, Reference, RenderedDiff
+        from unittest.mock import patch as mock_patch
+        from kittens.diff.search import Search
+        sources = {
+            'a': tuple('foo' if i % 7 == 0 else 'a{}'.format(i) for i in range(30)),
+            'b': tuple('foo' if i == 3 else 'b{}'.format(i) for i in range(5)),
+        }
+        rendered, loaded = [], []
+
+        def render(path, start, count):
+            rendered.append((path, start))
+            return (Line('   ' + sources[path][i], Reference(path, LineRef(i)), i == start) for i in range(start, start + count))
+
+        def lines_for_path(path):
+            loaded.append(path)
+            return sources[path]
+
+        def diff():
+            blocks = [Block(frozenset('a'), lines=(Line('title a', Reference('a')),), has_change_start=False)]
+            blocks += [Block(
+                frozenset('a'), 10, partial(render, 'a', i * 10, 10), starts={'a': i * 10},
+                source_ranges=(('a', i * 10, i * 10 + 10),)) for i in range(3)]
+            blocks.append(Block(frozenset('b'), lines=(Line('   b foo', Reference('b')),), has_change_start=False))
+            blocks.append(Block(frozenset('b'), 5, partial(render, 'b', 0, 5), starts={'b': 0}, source_ranges=(('b', 0, 5),)))
+            return RenderedDiff(blocks, 3)
+
+        class Opts:
+            search_fg = search_bg = None
+
+        s = Search(Opts(), 'FOO', False, False)
+        with mock_patch('kittens.diff.search.lines_for_path', lines_for_path):
+            self.assertTrue(s(diff(), 3, 20))
+            # Matches are counted without rendering any lines
+            self.ae(len(s), 7)
+            self.ae(rendered, [])
+            self.ae(s.match_blocks, [1, 2, 3, 4, 5])
+            self.ae(s.next_match(0), 1)
+            self.ae(rendered, [('a', 0)])
+            self.ae(s.next_match(1), 8)
+            self.ae(s.next_match(8), 15)
+            self.ae(s.next_match(8, include_current=True), 8)
+            self.ae(s.next_match(29), 31)
+            self.ae(s.next_match(31), 35)
+            self.ae(s.next_match(35), None)
+            self.ae(s.next_match(31, backwards=True), 29)
+            self.ae(s.next_match(1, backwards=True), None)
+            self.ae(rendered, [('a', 0), ('a', 10), ('a', 20), ('b', 0)])
+            self.assertIn(15, s)
+            self.assertNotIn(16, s)
+            written = []
+            self.assertTrue(s.highlight_line(written.append, 15))
+            self.ae(written[1:], ['\r\x1b[3Cfoo', '\x1b[m'])
+            self.assertFalse(s.highlight_line(written.append, 0))
+            # Rendering the diff again, as on resize, does not search the
+            # source lines again
+            del rendered[:]
+            loaded_before = len(loaded)
+            self.assertTrue(s(diff(), 3, 20))
+            self.ae((len(s), len(loaded), rendered), (7, loaded_before, []))
@@ -2,8 +2,14 @@
 # vim:fileencoding=utf-8
 # License: GPL v3 Copyright: 2017, Kovid Goyal <kovid at kovidgoyal.net>
 
+import json
+import os
+import shutil
 import sys
+import tempfile
 import unittest
+from collections import namedtuple
+from unittest.mock import patch
 
 from kitty.constants import is_macos
 from kitty.fast_data_types import (
@@ -122,3 +128,86 @@ class Rendering(BaseTest):
         finally:
             sys.stderr = orig
         self.assertIn('LastResort', buf.getvalue())
+
+
+@unittest.skipIf(is_macos, 'macOS does not use fontconfig')
+class FontConfigCache(BaseTest):
+
+    def setUp(self):
+        from kitty.constants import cache_dir
+        self.tdir = tempfile.mkdtemp()
+        self.orig_cache_dir = getattr(cache_dir, 'ans', None)
+        cache_dir.ans = self.tdir
+        self.conf, self.fonts_dir = os.path.join(self.tdir, 'fonts.conf'), os.path.join(self.tdir, 'fonts')
+        open(self.conf, 'w').close()
+        os.mkdir(self.fonts_dir)
+        self.clear_caches()
+
+    def tearDown(self):
+        from kitty.constants import cache_dir
+        cache_dir.ans = self.orig_cache_dir
+        self.clear_caches()
+        shutil.rmtree(self.tdir)
+
+    def clear_caches(self):
+        from kitty.fonts.fontconfig import all_fonts_map, fontconfig_cache
+        fontconfig_cache.caches.clear()
+        fontconfig_cache.__dict__.pop('signature', None)
+        all_fonts_map.cache_clear()
+
+    def test_fontconfig_cache(self):
+        import kitty.fonts.fontconfig as fc
+        path = os.path.join(self.tdir, 'fontconfig-faces.json')
+        fonts = [
+            {'family': 'Mono', 'full_name': 'Mono Regular', 'postscript_name': 'Mono-Regular', 'path': '/mono.ttf',
+             'weight': fc.FC_WEIGHT_REGULAR, 'slant': fc.FC_SLANT_ROMAN, 'spacing': 'MONO'},
+            {'family': 'Mono', 'full_name': 'Mono Bold', 'postscript_name': 'Mono-Bold', 'path': '/mono-bold.ttf',
+             'weight': fc.FC_WEIGHT_BOLD, 'slant': fc.FC_SLANT_ROMAN, 'spacing': 'MONO'},
+        ]
+        Opts = namedtuple('Opts', 'font_family bold_font italic_font bold_italic_font')
+        opts = Opts('Mono', 'auto', 'auto', 'auto')
+
+        with patch('kitty.fonts.fontconfig.fc_config_paths', lambda: ((self.conf,), (self.fonts_dir,))), \
+                patch('kitty.fonts.fontconfig.fc_list', return_value=fonts) as fc_list, \
+                patch('kitty.fonts.fontconfig.find_font_files', wraps=fc.find_font_files) as find:
+
+            def font_files(expected_finds, opts=opts, from_disk=True):
+                if from_disk:
+                    self.clear_caches()
+                ans = fc.get_font_files(opts)
+                self.ae(find.call_count, expected_finds)
+                return ans
+
+            ff = font_files(1)
+            self.ae({k: v['path'] for k, v in ff.items()}, {
+                'medium': '/mono.ttf', 'bold': '/mono-bold.ttf', 'italic': '/mono.ttf', 'bi': '/mono-bold.ttf'})
+            self.assertTrue(os.path.exists(path))
+            self.assertIs(font_files(1, from_disk=False), ff)
+            self.ae(font_files(1), ff)
+            self.ae(fc_list.call_count, 1)
+            # A change to the font family options finds the fonts again, but
+            # keeps the fonts found for the previous options
+            self.ae(font_files(2, opts._replace(bold_font='Mono Regular'))['bold']['path'], '/mono.ttf')
+            self.ae(font_files(2), ff)
+            self.ae(fc_list.call_count, 1)
+            # A change to a fontconfig config file or font directory discards
+            # the cached fonts
+            st = os.stat(self.conf)
+            os.utime(self.conf, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            self.ae(font_files(3), ff)
+            self.ae(fc_list.call_count, 2)
+            self.ae(font_files(3), ff)
+            with open(os.path.join(self.fonts_dir, 'new-font.ttf'), 'w'):
+                pass
+            st = os.stat(self.fonts_dir)
+            os.utime(self.fonts_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            self.ae(font_files(4), ff)
+            self.ae(fc_list.call_count, 3)
+            # A corrupt or invalid cache file is replaced
+            for garbage in ('garbage', '[]', json.dumps({'data': {}})):
+                with open(path, 'w') as f:
+                    f.write(garbage)
+                with patch('kitty.fonts.fontconfig.log_error') as log_error:
+                    self.ae(font_files(find.call_count + 1), ff)
+                self.ae(log_error.call_count, int(garbage == 'garbage'))
+                self.ae(font_files(find.call_count), ff)
@@ -180,3 +180,23 @@ class TestLayout(BaseTest):
         for layout_class in Stack, Horizontal:
             q = create_layout(layout_class)
             self.do_overlay_test(q)
+
+    def test_update_spacing(self):
+        from kitty.layout import create_layout_object_for, evict_cached_layouts, update_spacing_of_cached_layouts
+        try:
+            tall = create_layout_object_for('tall', 1, 1001, 1, 1, 1, 1)
+            stack = create_layout_object_for('stack', 1, 1001, 1, 1, 1, 1)
+            other = create_layout_object_for('tall', 1, 1002, 1, 1, 1, 1)
+            tall.apply_bias(0, 0.2, 2, True)
+            bias = tall.main_bias
+            # The layouts are changed in place, so the sizes the windows were
+            # given are kept
+            update_spacing_of_cached_layouts(1001, 2, -1, 3, 4)
+            self.assertIs(create_layout_object_for('tall', 1, 1001, 2, -1, 3, 4), tall)
+            self.assertIs(create_layout_object_for('stack', 1, 1001, 2, -1, 3, 4), stack)
+            self.ae((tall.margin_width, tall.single_window_margin_width, tall.padding_width, tall.border_width), (2, -1, 3, 4))
+            self.ae(tall.main_bias, bias)
+            self.assertIs(create_layout_object_for('tall', 1, 1002, 1, 1, 1, 1), other)
+            self.ae(other.margin_width, 1)
+        finally:
+            evict_cached_layouts(1001), evict_cached_layouts(1002)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from queue import Queue
+
+from . import BaseTest
+
+
+class GlobalOpts:
+
+    def __init__(self, to=None):
+        self.to = to
+        self.no_command_response = None
+
+
+class FakeChildMonitor:
+
+    def __init__(self, sent):
+        self.sent = sent
+
+    def send_to_peer(self, peer_id, data, finish):
+        self.sent.append((peer_id, data, finish))
+
+
+def fake_boss(sent=None):
+    # A Boss that only has what is needed to handle remote commands
+
+    from kitty.boss import Boss
+
+    class FakeOpts:
+        allow_remote_control = True
+
+    class FakeBoss(Boss):
+
+        def __init__(self):
+            self.opts = FakeOpts()
+            self.font_sizes = []
+            self.event_subscriptions = {}
+            self.current_remote_peer = None
+            # Everything must be sent via the response writer, to keep the order
+            self.child_monitor = FakeChildMonitor([])
+            self.response_writer = lambda peer_id, response, finish=True: sent.append((peer_id, response, finish))
+
+        def set_font_size(self, size):
+            if size <= 0:
+                raise ValueError('Invalid font size: {}'.format(size))
+            self.font_sizes.append(size)
+
+    return FakeBoss()
+
+
+def serve(server, received):
+    # Respond to every command with its id and payload, in the order received
+    from kitty.remote_control import response_frame
+    conn = server.accept()[0]
+    with conn:
+        buf = b''
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            buf += data
+            while True:
+                m = response_frame.search(buf)
+                if m is None:
+                    break
+                buf = buf[m.end():]
+                cmd = json.loads(m.group(1).decode('ascii'))
+                received.append(cmd)
+                response = {'ok': True, 'id': cmd['id'], 'data': cmd.get('payload')}
+                conn.sendall(('\x1bP@kitty-cmd' + json.dumps(response) + '\x1b\\').encode('utf-8'))
+
+
+class TestRemoteControl(BaseTest):
+
+    def test_connection(self):
+        from kitty.remote_control import Connection
+        tdir = tempfile.mkdtemp()
+        server = socket.socket(socket.AF_UNIX)
+        try:
+            path = os.path.join(tdir, 'kitty.sock')
+            server.bind(path)
+            server.listen(1)
+            received = []
+            t = threading.Thread(target=serve, args=(server, received), daemon=True)
+            t.start()
+            with Connection('unix:' + path, timeout=5) as conn:
+                ids = [conn.send({'cmd': 'ls', 'payload': i}) for i in range(3)]
+                self.ae(ids, [1, 2, 3])
+                # Responses can be read in any order, the ones read while
+                # waiting for another response are kept
+                self.ae(conn.recv(3)['data'], 2)
+                self.ae(sorted(conn.pending_responses), [1, 2])
+                self.ae(conn.recv(1)['data'], 0)
+                self.ae(conn.do_io({'cmd': 'ls', 'payload': 'x'}, False), {'ok': True, 'id': 4, 'data': 'x'})
+                self.ae(conn.recv(2)['data'], 1)
+                self.ae(conn.pending_responses, {})
+                # All chunks of a generator payload are sent with the same id
+                rid = conn.send({'cmd': 'send-text', 'payload': (p for p in 'ab')})
+                self.ae(conn.recv(rid)['data'], 'a')
+                self.ae(conn.recv(rid)['data'], 'b')
+            t.join(5)
+            self.ae([c['id'] for c in received], [1, 2, 3, 4, 5, 5])
+        finally:
+            server.close()
+            shutil.rmtree(tdir)
+
+    def test_response_writer(self):
+        from kitty.cmds import DeferredResponse
+        from kitty.remote_control import ResponseWriter, response_frame
+        sent = Queue()
+        w = ResponseWriter(lambda *a: sent.put(a))
+        w(1, {'ok': True, 'id': 1, 'data': DeferredResponse([1, 2], json.dumps)})
+        w(2, {'ok': True, 'id': 2, 'data': object()})
+        w(1, {'ok': True, 'id': 3})
+        responses = []
+        for i in range(3):
+            peer_id, data, finish = sent.get(timeout=5)
+            self.assertTrue(finish)
+            responses.append((peer_id, json.loads(response_frame.search(data).group(1).decode('utf-8'))))
+        self.ae([(p, r['id']) for p, r in responses], [(1, 1), (2, 2), (1, 3)])
+        self.ae(responses[0][1]['data'], '[1, 2]')
+        self.assertFalse(responses[1][1]['ok'])
+        self.assertIn('Failed to encode response', responses[1][1]['error'])
+        w(1, {'ok': True, 'id': 4}, False)
+        w(1, None)
+        self.assertFalse(sent.get(timeout=5)[2])
+        self.ae(sent.get(timeout=5), (1, None, True))
+
+    def test_batch(self):
+        from kitty.cmds import batch, cmap, cmd_batch, parse_subcommand_cli
+
+        def parse(*cmdlines, stop_on_error=False):
+            args = ['batch'] + (['--stop-on-error'] if stop_on_error else []) + [json.dumps(cmdlines)]
+            opts, items = parse_subcommand_cli(cmap['batch'], args)
+            return cmd_batch(GlobalOpts(), opts, items)
+
+        payload = parse('set-font-size 10', ['set-font-size', '0'], 'set-font-size 12')
+        self.ae(payload['commands'], [
+            {'cmd': 'set-font-size', 'no_response': False, 'payload': {'size': s}} for s in (10, 0, 12)])
+        self.assertFalse(payload['stop_on_error'])
+        self.assertRaises(SystemExit, parse, 'batch []')
+        self.assertRaises(SystemExit, parse, 'no-such-command')
+
+        def run(payload):
+            boss = fake_boss()
+            ans = batch(boss, None, payload)
+            return boss.font_sizes, json.loads(ans.encode(ans.snapshot))
+
+        sizes, responses = run(payload)
+        self.ae(sizes, [10, 12])
+        self.ae([r['ok'] for r in responses], [True, False, True])
+        self.ae(responses[1]['error'], 'Invalid font size: 0.0')
+        sizes, responses = run(parse('set-font-size 10', 'set-font-size 0', 'set-font-size 12', stop_on_error=True))
+        self.ae(sizes, [10])
+        self.ae([r['ok'] for r in responses], [True, False])
+
+    def test_batch_send_text(self):
+        from kitty.cmds import BulkPayload, cmap, cmd_batch, cmd_send_text, parse_subcommand_cli
+        tdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tdir, 'text')
+            with open(path, 'w') as f:
+                f.write('some text')
+            global_opts = GlobalOpts('unix:' + os.path.join(tdir, 'kitty.sock'))
+            opts, items = parse_subcommand_cli(cmap['send-text'], ['send-text', '--from-file', path])
+            self.assertIsInstance(cmd_send_text(global_opts, opts, items), BulkPayload)
+            # Bulk transfers need a connection of their own, so they are not used in a batch
+            opts, items = parse_subcommand_cli(cmap['batch'], ['batch', json.dumps([['send-text', '--from-file', path]])])
+            payload = cmd_batch(global_opts, opts, items)
+            self.ae([c['payload']['text'] for c in payload['commands']], ['some text'])
+            json.dumps(payload)
+            self.assertFalse(global_opts.in_batch)
+        finally:
+            shutil.rmtree(tdir)
+
+    def test_peer_messages(self):
+        from kitty.constants import version
+        sent = []
+        boss = fake_boss(sent)
+
+        def send(cmd, **kw):
+            cmd = dict(kw, cmd=cmd, version=version, no_response=False)
+            return boss.peer_message_received(('\x1bP@kitty-cmd' + json.dumps(cmd) + '\x1b\\').encode('utf-8'), 1)
+
+        send('set-font-size', id=7, payload={'size': 11})
+        send('set-font-size', id=8, payload={'size': 0})
+        send('set-font-size', payload={'size': 12})
+        boss.peer_message_received(b'\x1bP@kitty-cmd{\x1b\\', 1)
+        self.ae(boss.font_sizes, [11, 12])
+        self.ae([(p, r.get('id'), r['ok'], f) for p, r, f in sent], [
+            (1, 7, True, True), (1, 8, False, True), (1, None, True, True), (1, None, False, True)])
+        self.assertIn('Malformed', sent[-1][1]['error'])
+
+    def test_event_subscriptions(self):
+        from kitty.constants import version
+        sent = []
+        boss = fake_boss(sent)
+        cmd = {'cmd': 'subscribe', 'version': version, 'no_response': False, 'id': 3, 'payload': {'events': ['bell']}}
+        boss.peer_message_received(('\x1bP@kitty-cmd' + json.dumps(cmd) + '\x1b\\').encode('utf-8'), 1)
+        self.ae(sent, [(1, {'ok': True, 'id': 3}, False)])
+        boss.notify_event_subscribers('bell', window_id=1)
+        boss.notify_event_subscribers('title_changed', window_id=1)
+        boss.notify_event_subscribers('bell', window_id=2)
+        boss.peer_closed(1)
+        boss.notify_event_subscribers('bell', window_id=3)
+        self.ae([(p, r and json.loads(r['data'])['window_id'], f) for p, r, f in sent[1:]], [(1, 1, False), (1, 2, False), (1, None, True)])
+        self.ae(sent[1][1]['id'], 3)
+        self.ae(boss.child_monitor.sent, [])
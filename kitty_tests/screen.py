@@ -435,10 +435,116 @@ class TestScreen(BaseTest):
         s.carriage_return(), s.linefeed()
         s.draw('c')
 
-        def as_text(as_ansi=False):
+        def as_text(as_ansi=False, *line_range):
             d = []
-            s.as_text(d.append, as_ansi)
+            s.as_text(d.append, as_ansi, False, *line_range)
             return ''.join(d)
 
         self.ae(as_text(), 'ababababab\nc\n\n')
         self.ae(as_text(True), 'ababababab\nc\n\n')
+        self.ae(as_text(False, 0, 2), 'ababababab')
+        self.ae(as_text(False, 2), '\nc\n\n')
+        self.ae(as_text(False, 1, 100), 'babab\nc\n\n')
+        self.ae(''.join(as_text(False, i, i + 1) for i in range(s.lines)), as_text())
+
+    def test_text_since(self):
+        from kitty.window import Window
+
+        class W:
+            text_since = Window.text_since
+
+        w = W()
+        w.screen = s = self.create_screen(scrollback=5)
+
+        def write(*lines):
+            for line in lines:
+                s.draw(line)
+                s.carriage_return(), s.linefeed()
+
+        self.ae(w.text_since(), {'text': '', 'cursor': 0, 'lines_lost': 0})
+        write('a', 'b')
+        self.ae(w.text_since(), {'text': 'a\nb\n', 'cursor': 2, 'lines_lost': 0})
+        write('c', 'd', 'e', 'f', 'g')
+        self.ae(s.historybuf.count, 3)
+        self.ae(w.text_since(2), {'text': 'c\nd\ne\nf\ng\n', 'cursor': 7, 'lines_lost': 0})
+        self.ae(w.text_since(7), {'text': '', 'cursor': 7, 'lines_lost': 0})
+        # Fill the history buffer so that it wraps and drops the oldest lines
+        write(*('h{}'.format(i) for i in range(10)))
+        self.ae(s.historybuf.count, 5)
+        self.ae(s.historybuf.total_lines_added, 13)
+        self.ae(w.text_since(7), {'text': ''.join('h{}\n'.format(i) for i in range(1, 10)), 'cursor': 17, 'lines_lost': 1})
+        self.ae(w.text_since(0)['lines_lost'], 8)
+        # A wrapped line is returned as a single line
+        write('x' * 7)
+        self.ae(w.text_since(17), {'text': 'x' * 7 + '\n', 'cursor': 19, 'lines_lost': 0})
+        # Only the rows above the cursor are returned
+        s.draw('partial')
+        self.ae(w.text_since(19), {'text': 'parti', 'cursor': 20, 'lines_lost': 0})
+
+    def test_as_text_chunk(self):
+        from kitty.window import Window
+
+        class W:
+            as_text = Window.as_text
+            as_text_chunk = Window.as_text_chunk
+            text_line_sources = Window.text_line_sources
+
+        class Opts:
+            scrollback_pager_history_size = 1024
+
+        def create_window(*lines):
+            w = W()
+            w.opts, w.screen = Opts(), self.create_screen(scrollback=5)
+            for line in lines:
+                w.screen.draw(line)
+                w.screen.carriage_return(), w.screen.linefeed()
+            return w
+
+        def chunks(w, max_lines, **kw):
+            ans, start = [], 0
+            while start is not None:
+                text, start = w.as_text_chunk(start, max_lines=max_lines, **kw)
+                ans.append(text)
+            return ans
+
+        def assert_continuation_rebuilds_text(w):
+            for kw in ({}, {'add_history': True}, {'add_history': True, 'as_ansi': True, 'add_wrap_markers': True}):
+                q = w.as_text(**kw)
+                for max_lines in range(1, 15):
+                    self.ae(''.join(chunks(w, max_lines, **kw)), q, (max_lines, kw))
+
+        # 3 lines in the pager history, 5 in the history buffer and 5 on screen
+        w = create_window(*('l{}'.format(i) for i in range(12)))
+        self.ae(w.screen.historybuf.count, 5)
+        self.ae(w.as_text(add_history=True), ''.join('l{}\n'.format(i) for i in range(12)))
+        self.ae(w.as_text_chunk(add_history=True), (w.as_text(add_history=True), None))
+        self.ae(w.as_text_chunk(), ('l8\nl9\nl10\nl11\n', None))
+        self.ae(chunks(w, 4, add_history=True), ['l0\nl1\nl2\nl3', '\nl4\nl5\nl6\nl7', '\nl8\nl9\nl10\nl11', '\n'])
+        # Lines are joined with a newline across the pager history, the
+        # history buffer and the screen
+        self.ae(w.as_text_chunk(2, 4, add_history=True), ('\nl2\nl3', None))
+        self.ae(w.as_text_chunk(7, 9, add_history=True), ('\nl7\nl8', None))
+        self.ae(w.as_text_chunk(1, 2, max_lines=5, add_history=True), ('\nl1', None))
+        # Negative line numbers count from the bottom
+        self.ae(w.as_text_chunk(-5, add_history=True), ('\nl8\nl9\nl10\nl11\n', None))
+        self.ae(w.as_text_chunk(-13, -11, add_history=True), ('l0\nl1', None))
+        self.ae(w.as_text_chunk(-3, -1, max_lines=1, add_history=True), ('\nl10', 11))
+        self.ae(w.as_text_chunk(-2), ('\nl11\n', None))
+        self.ae(w.as_text_chunk(-100, 1), ('l8', None))
+        self.ae(w.as_text_chunk(100), ('', None))
+        self.ae(w.as_text_chunk(3, 1), ('', None))
+        assert_continuation_rebuilds_text(w)
+
+        # A wrapped line that continues from the pager history into the
+        # history buffer
+        w = create_window('x' * 7, 'h1', 'h2', 'h3', 'h4', 's1', 's2', 's3', 's4')
+        self.ae(w.as_text(add_history=True), 'xxxxxxx\nh1\nh2\nh3\nh4\ns1\ns2\ns3\ns4\n')
+        self.ae(w.as_text_chunk(0, 1, add_history=True), ('xxxxx', None))
+        self.ae(w.as_text_chunk(1, 2, add_history=True), ('xx', None))
+        assert_continuation_rebuilds_text(w)
+        # A wrapped line that continues from the history buffer onto the screen
+        w = create_window('a', 'b', 'x' * 7, 'd', 'e', 'f')
+        self.ae(w.screen.historybuf.count, 3)
+        self.ae(w.as_text(add_history=True), 'a\nb\nxxxxxxx\nd\ne\nf\n')
+        self.ae(w.as_text_chunk(2, 4, add_history=True), ('\nxxxxxxx', None))
+        assert_continuation_rebuilds_text(w)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+# License: GPL v3 Copyright: 2019, Kovid Goyal <kovid at kovidgoyal.net>
+
+import builtins
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from . import BaseTest
+
+
+class TestTrace(BaseTest):
+
+    def setUp(self):
+        import kitty.trace as trace
+        self.tdir = tempfile.mkdtemp()
+        del trace.events[:]
+
+    def tearDown(self):
+        import kitty.trace as trace
+        trace.stop_tracing()
+        del trace.events[:]
+        shutil.rmtree(self.tdir)
+
+    def test_trace(self):
+        import kitty.trace as trace
+        self.assertTrue(trace.trace_startup_requested(['kitty', '--trace-startup=/tmp/x']))
+        self.assertTrue(trace.trace_startup_requested(['kitty', '--trace-startup', '/tmp/x']))
+        self.assertFalse(trace.trace_startup_requested(['kitty', '--trace-startupx']))
+        # Nothing is recorded unless tracing is enabled
+        with trace.span('nothing'):
+            pass
+        trace.mark('nothing')
+        self.ae(trace.events, [])
+
+        original_import = builtins.__import__
+        trace.start_tracing()
+        self.assertIsNot(builtins.__import__, original_import)
+        with trace.span('phase', answer=42):
+            trace.mark('point')
+        with open(os.path.join(self.tdir, 'traced_module.py'), 'w') as f:
+            f.write('x = 1\n')
+        sys.path.insert(0, self.tdir)
+        try:
+            import traced_module  # noqa
+        finally:
+            sys.path.remove(self.tdir)
+            sys.modules.pop('traced_module', None)
+        import json as already_loaded  # noqa
+        path = os.path.join(self.tdir, 'trace.json')
+        trace.save_trace(path)
+        self.assertIs(builtins.__import__, original_import)
+        self.assertFalse(trace.enabled)
+
+        with open(path) as f:
+            data = json.load(f)
+        self.ae(data['displayTimeUnit'], 'ms')
+        events = {e['name']: e for e in data['traceEvents']}
+        self.ae(set(events), {'tracing started', 'point', 'phase', 'import traced_module'})
+        phase, point = events['phase'], events['point']
+        self.ae((phase['ph'], phase['cat'], phase['args']), ('X', 'startup', {'answer': 42}))
+        self.ae((point['ph'], point['s']), ('i', 'p'))
+        self.assertTrue(phase['ts'] <= point['ts'] <= phase['ts'] + phase['dur'])
+        self.ae(events['import traced_module']['cat'], 'import')
+        for e in data['traceEvents']:
+            self.ae(e['pid'], os.getpid())